@@ -22,5 +22,27 @@ epc_per.set_sts()
 epc_fld = Field('val', 'Exception Program Counter - holds the return address for the trap handler', epc_per, width=32, we=True)
 epc_reg = Register('epc', 'Exception Program Counter', fields=[epc_fld])
 
+# Performance counters control
+freeze = CfgField('freeze', 'performance counters snapshot freeze, while set the perf_* registers hold the counts of the cycle it was set, the counters keep counting', 1)
+clr = CfgField('clr', 'performance counters clear, while set all counters are held at 0', 1)
+perf_ctrl = Register('perf_ctrl', 'Performance counters control', fields=[freeze, clr])
+
+# Performance counters, 64-bit snapshots split into low and high words
+perf_cntrs = {
+    'cycles'  : 'cycles since the CPU left reset',
+    'retired' : 'instructions retired (leaving the decode stage)',
+    'intrlock': 'load-use pipe interlock bubbles',
+    'br_flush': 'branch mispredict flushes',
+    'jr_flush': 'jalr flushes',
+    'traps'   : 'exceptions taken to the trap handler',
+}
+perf_regs = []
+for name, desc in perf_cntrs.items():
+    for half in ('lo', 'hi'):
+        perf_per = AccessPermissions()
+        perf_per.set_sts()
+        perf_fld = Field('val', f'{desc}, bits {"31:0" if half=="lo" else "63:32"}', perf_per, width=32, we=True)
+        perf_regs.append(Register(f'perf_{name}_{half}', f'Performance counter - {desc}, {half} word', fields=[perf_fld]))
+
 # regfile
-etcpu_mng_regs = RegFile('etcpu_mng_regs', 'ETCPU management registers', [cfg_trap_hdlr, exc, epc_reg])
\ No newline at end of file
+etcpu_mng_regs = RegFile('etcpu_mng_regs', 'ETCPU management registers', [cfg_trap_hdlr, exc, epc_reg, perf_ctrl] + perf_regs)
\ No newline at end of file
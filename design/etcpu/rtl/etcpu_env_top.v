@@ -8,8 +8,13 @@ module etcpu_env_top #(
    // ---------- //
    parameter  int INST_MEM_DEPTH = 512 , // Instruction memory depth
    parameter  int MAIN_MEM_DEPTH =  64 , // Main memory depth
-   parameter  int APB_ADD_W      =   4 , // APB's address bus width [bits]
+   parameter  int APB_ADD_W      =   6 , // APB's address bus width [bits]
    parameter  int APB_DAT_W      =  32 , // APB's data bus width [bits]
+   parameter  int BP_DYNAMIC     =   1 , // 1 - BHT + BTB branch prediction, 0 - static backward-taken prediction
+   parameter  int BHT_IDX_W      =   6 , // BHT index width, 2**BHT_IDX_W 2-bit counters
+   parameter  int BTB_IDX_W      =   3 , // BTB index width, 2**BTB_IDX_W jalr targets
+   parameter  int PF_DEPTH       =   4 , // Instruction prefetch buffer entries
+   parameter  int INST_MEM_LAT   =   0 , // Instruction memory read latency [cycles], 0 - data in the request cycle
    // Derived parameters //
    // ------------------ //
    localparam int APB_STRB_W     = int'(APB_DAT_W/8)   // APB's strobe bus width [bits]
@@ -62,6 +67,10 @@ logic [32-1:0] inst_mem_rd_addr          ;
 logic [32-1:0] inst_mem_rd_addr_wrapped  ; 
 logic [32-1:0] inst_mem_dat_out          ; 
 logic [32-1:0] inst_mem_addr             ; 
+logic          inst_mem_req_vld          ; 
+logic          inst_mem_req_rdy          ; 
+logic          inst_mem_rsp_vld          ; 
+logic [32-1:0] inst_mem_rsp_dat          ; 
 
 // CPU core instance //
 // ----------------- //
@@ -69,7 +78,12 @@ etcpu_top #(
    .INST_MEM_BYTE_ADD_W(INST_MEM_BYTE_ADD_W),
    .MAIN_MEM_BYTE_ADD_W(MAIN_MEM_BYTE_ADD_W),
    .APB_ADD_W          (APB_ADD_W          ),
-   .APB_DAT_W          (APB_DAT_W          ) 
+   .APB_DAT_W          (APB_DAT_W          ),
+   .BP_DYNAMIC         (BP_DYNAMIC         ),
+   .BHT_IDX_W          (BHT_IDX_W          ),
+   .BTB_IDX_W          (BTB_IDX_W          ),
+   .PF_DEPTH           (PF_DEPTH           ),
+   .PF_MAX_INFLIGHT    (INST_MEM_LAT>0 ? INST_MEM_LAT : 1) // at most one read per cycle of the latency in flight
 ) i_etcpu_top (
    // General Signals //
    .clk                (clk                ), // i, [1] X logic  , clock signal
@@ -99,9 +113,12 @@ etcpu_top #(
    .main_mem_dat_out (main_mem_dat_out ), // i, 32  X logic  , Output data (from memory POV)
    // ------------ Instruction Memory Read Interface ------------------ // 
    // Input control // 
+   .inst_mem_req_vld (inst_mem_req_vld ), // o, [1] X logic  , Read request valid
+   .inst_mem_req_rdy (inst_mem_req_rdy ), // i, [1] X logic  , Read request ready
    .inst_mem_addr    (inst_mem_rd_addr ), // o, 32  X logic  , Address
    // Output data // 
-   .inst_mem_dat_out (inst_mem_dat_out ) // i, 32   X logic  , Output data (from memory POV)
+   .inst_mem_rsp_vld (inst_mem_rsp_vld ), // i, [1] X logic  , Output data valid
+   .inst_mem_dat_out (inst_mem_rsp_dat ) // i, 32   X logic  , Output data (from memory POV)
 );
 
 // Instruction memory //
@@ -128,6 +145,29 @@ gen_sp_reg_mem_top #(
    .dat_out (inst_mem_dat_out                       )  // o, DAT_W X logic  , Output data
 );
 
+// Instruction memory read latency //
+// ------------------------------- //
+// reads are blocked while the testbench writes, a read returns INST_MEM_LAT cycles after its request
+assign inst_mem_req_rdy = ~inst_mem_wr_wen ; 
+generate
+if (INST_MEM_LAT==0) begin : gen_inst_mem_no_lat
+   assign inst_mem_rsp_vld = inst_mem_req_vld & inst_mem_req_rdy ; 
+   assign inst_mem_rsp_dat = inst_mem_dat_out ; 
+end
+else begin : gen_inst_mem_lat
+   logic [INST_MEM_LAT-1:0]         lat_vld ; 
+   logic [INST_MEM_LAT-1:0][32-1:0] lat_dat ; 
+   always_ff @(posedge clk) if (!rst_n_cpu) lat_vld[0] <= 1'b0 ; else lat_vld[0] <= inst_mem_req_vld & inst_mem_req_rdy ; 
+   always_ff @(posedge clk) if (!rst_n_cpu) lat_dat[0] <=    0 ; else lat_dat[0] <= inst_mem_dat_out ; 
+   for (genvar i=1 ; i<INST_MEM_LAT ; i++) begin : gen_lat_stage
+      always_ff @(posedge clk) if (!rst_n_cpu) lat_vld[i] <= 1'b0 ; else lat_vld[i] <= lat_vld[i-1] ; 
+      always_ff @(posedge clk) if (!rst_n_cpu) lat_dat[i] <=    0 ; else lat_dat[i] <= lat_dat[i-1] ; 
+   end
+   assign inst_mem_rsp_vld = lat_vld[INST_MEM_LAT-1] ; 
+   assign inst_mem_rsp_dat = lat_dat[INST_MEM_LAT-1] ; 
+end
+endgenerate
+
 // Main memory //
 // ----------- //
 gen_sp_reg_mem_top #(
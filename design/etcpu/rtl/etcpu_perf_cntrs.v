@@ -0,0 +1,52 @@
+//
+// etcpu_perf_cntrs.v
+//
+
+module etcpu_perf_cntrs #(
+   // Parameters //
+   // ---------- //
+   parameter  int EVNT_N = 6  , // Number of counted events
+   parameter  int CNT_W  = 64   // Counters width [bits]
+)(
+   // General Signals //
+   // --------------- //
+   input  logic                         clk      , // clock signal
+   input  logic                         rst_n    , // active low reset
+
+   // Configurations //
+   // -------------- //
+   input  logic                         cfg_clr  , // hold all counters at 0
+
+   // Events //
+   // ------ //
+   input  logic [EVNT_N-1:0]            evnt     , // per-cycle event indications, one per counter
+
+   // Counters //
+   // -------- //
+   output logic [EVNT_N-1:0][CNT_W-1:0] cnt_next   // counters next value, the events of this cycle included
+);
+
+// Internal Registers //
+// ------------------ //
+logic [EVNT_N-1:0][CNT_W-1:0] cnt ;
+
+// Free-running counters //
+// --------------------- //
+genvar i ;
+generate
+   for (i=0 ; i<EVNT_N ; i++) begin : gen_cnt
+      assign cnt_next[i] = cfg_clr ? '0 : cnt[i] + CNT_W'(evnt[i]) ;
+      always_ff @(posedge clk) if (!rst_n) cnt[i] <= '0 ; else cnt[i] <= cnt_next[i] ;
+   end
+endgenerate
+
+endmodule
+
+//|~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~|//
+//|                                               |//
+//| 1. Project  :  etcpu                          |//
+//| 2. Author   :  Etay Sela                      |//
+//| 3. Date     :  2025-02-08                     |//
+//| 4. Version  :  v1.0.0                         |//
+//|                                               |//
+//|~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~|//
@@ -7,11 +7,25 @@ module etcpu_top #(
    // ---------- //
    parameter  int INST_MEM_BYTE_ADD_W =  8 , // Instruction memory Byte address width [bits]
    parameter  int MAIN_MEM_BYTE_ADD_W =  8 , // Main memory Byte address width [bits]
-   parameter  int APB_ADD_W           =  3 , // APB's address bus width [bits]
+   parameter  int APB_ADD_W           =  6 , // APB's address bus width [bits]
    parameter  int APB_DAT_W           = 32 , // APB's data bus width [bits]
+   parameter  int BP_DYNAMIC          =  1 , // 1 - BHT + BTB branch prediction, 0 - static backward-taken prediction
+   parameter  int BHT_IDX_W           =  6 , // BHT index width, 2**BHT_IDX_W 2-bit counters
+   parameter  int BTB_IDX_W           =  3 , // BTB index width, 2**BTB_IDX_W jalr targets
+   parameter  int PF_DEPTH            =  4 , // Instruction prefetch buffer entries
+   parameter  int PF_MAX_INFLIGHT     = 255 , // Instruction memory reads in flight at most (its read latency, at least 1)
    // Derived parameters //
    // ------------------ //
-   localparam int APB_STRB_W     = int'(APB_DAT_W/8)   // APB's strobe bus width [bits]
+   localparam int APB_STRB_W     = int'(APB_DAT_W/8) , // APB's strobe bus width [bits]
+   // Performance counters //
+   // -------------------- //
+   localparam int PERF_CYCLES    = 0 , // counter index - cycles
+   localparam int PERF_RETIRED   = 1 , // counter index - retired instructions
+   localparam int PERF_INTRLOCK  = 2 , // counter index - load-use interlock bubbles
+   localparam int PERF_BR_FLUSH  = 3 , // counter index - branch mispredict flushes
+   localparam int PERF_JR_FLUSH  = 4 , // counter index - jalr flushes
+   localparam int PERF_TRAPS     = 5 , // counter index - traps
+   localparam int PERF_N         = 6   // number of performance counters
 )(
    // General Signals //
    // --------------- //
@@ -54,16 +68,25 @@ module etcpu_top #(
    // ----------------------------------------------------------------- //
    // Input control // 
    // ------------- //
+   output logic                  inst_mem_req_vld   , // Read request valid
+   input  logic                  inst_mem_req_rdy   , // Read request ready
    output logic [32-1:0]         inst_mem_addr      , // Address  
    // Output data // 
    // ----------- //
+   input  logic                  inst_mem_rsp_vld   , // Output data valid, in request order
    input  logic [32-1:0]         inst_mem_dat_out     // Output data (from memory POV)
 );
 
+// Imports //
+// ------- //
+import utils_top::* ;
+
 // Internal Wires //
 // -------------- //
 // Configurations //
 logic [32-1:0] cfg_trap_hdlr_addr      ;
+logic          cfg_perf_freeze         ;
+logic          cfg_perf_clr            ;
 // Events // 
 logic          exc_inst_addr_mis       ; 
 logic          exc_inst_addr_oob       ;
@@ -73,6 +96,7 @@ logic          exc_main_addr_oob       ;
 logic [32-1:0] pc_next                 ; 
 // IF --> ID //
 logic [32-1:0] if2id_inst_next         ; 
+logic          if2id_vld_next          ; 
 // MA --> WB // 
 logic [32-1:0] ma2wb_pc_next           ; 
 logic [32-1:0] ma2wb_inst_next         ;
@@ -106,6 +130,13 @@ logic          if2id_branch_taken_next ;
 logic [32-1:0] if2id_branch_nt_pc_next ; 
 logic          id2ex_branch_taken_next ; 
 logic [32-1:0] id2ex_branch_nt_pc_next ; 
+// Branch predictor update EX --> IF //
+logic          ex2if_bp_branch         ;
+logic          ex2if_bp_jalr           ;
+logic          ex2if_bp_taken          ;
+// Performance counters //
+logic [PERF_N-1:0]         perf_evnt     ;
+logic [PERF_N-1:0][64-1:0] perf_cnt_next ;
 
 // Internal Registers //
 // ------------------ //
@@ -113,6 +144,7 @@ logic [32-1:0] pc                 ;
 // IF --> ID //
 logic [32-1:0] if2id_pc           ; 
 logic [32-1:0] if2id_inst         ; 
+logic          if2id_vld          ; // decode holds a fetched instruction, not a flush or empty prefetch buffer bubble 
 // MA --> WB // 
 logic [32-1:0] ma2wb_pc           ; 
 logic [32-1:0] ma2wb_inst         ;
@@ -136,7 +168,17 @@ logic [32-1:0] id2ex_branch_nt_pc ;
 
 // Fetch Stage // 
 // ----------- //
-fetch_top #(.INST_MEM_BYTE_ADD_W(INST_MEM_BYTE_ADD_W)) i_fetch_top (
+fetch_top #(
+   .INST_MEM_BYTE_ADD_W(INST_MEM_BYTE_ADD_W),
+   .BP_DYNAMIC         (BP_DYNAMIC         ),
+   .BHT_IDX_W          (BHT_IDX_W          ),
+   .BTB_IDX_W          (BTB_IDX_W          ),
+   .PF_DEPTH           (PF_DEPTH           ),
+   .PF_MAX_INFLIGHT    (PF_MAX_INFLIGHT    ) 
+) i_fetch_top (
+   // General Signals //
+   .clk                (clk                     ), // i, [1] X logic  , clock signal
+   .rst_n              (rst_n                   ), // i, [1] X logic  , active low reset
    // Configurations //
    .cfg_trap_hdlr_addr (cfg_trap_hdlr_addr      ), // i, 32  X logic  , congifurable trap handler base address
    // Program Counter Register // 
@@ -144,6 +186,7 @@ fetch_top #(.INST_MEM_BYTE_ADD_W(INST_MEM_BYTE_ADD_W)) i_fetch_top (
    .pc_next            (pc_next                 ), // o, 32  X logic  , Program counter next value
    // Instruction Register // 
    .id_inst            (if2id_inst_next         ), // o, 32  X logic  , Decode stage instruction
+   .id_inst_vld        (if2id_vld_next          ), // o, [1] X logic  , Decode stage instruction valid
    // Pipe interlock bubble //
    .intrlock_bubble    (intrlock_bubble         ), // i, [1] X logic  , bubble due to pipe interlock                
    // Branch Flush IF //
@@ -151,6 +194,12 @@ fetch_top #(.INST_MEM_BYTE_ADD_W(INST_MEM_BYTE_ADD_W)) i_fetch_top (
    .id_branch_nt_pc    (if2id_branch_nt_pc_next ),
    .ex_branch_flush    (branch_flush            ),
    .ex_branch_pc       (branch_flush_pc         ),
+   // Branch predictor update //
+   .ex_bp_branch       (ex2if_bp_branch         ), // i, [1] X logic  , execute instruction is a branch
+   .ex_bp_jalr         (ex2if_bp_jalr           ), // i, [1] X logic  , execute instruction is a jalr
+   .ex_bp_taken        (ex2if_bp_taken          ), // i, [1] X logic  , execute branch actual direction
+   .ex_bp_pc           (id2ex_pc                ), // i, 32  X logic  , execute instruction PC
+   .ex_bp_target       (ex2ma_dat_next          ), // i, 32  X logic  , execute jalr actual target
    // Events // 
    .exc_main_addr_mis  (exc_main_addr_mis       ), // i, [1] X logic , exception - main memory address misaligned
    .exc_main_addr_oob  (exc_main_addr_oob       ), // i, [1] X logic , exception - main memory address out-of-bounds
@@ -158,8 +207,11 @@ fetch_top #(.INST_MEM_BYTE_ADD_W(INST_MEM_BYTE_ADD_W)) i_fetch_top (
    .exc_inst_addr_oob  (exc_inst_addr_oob       ), // o, [1] X logic  , exception - instruction address out-of-bounds
    // ------------------------ Memory Interface ----------------------- // 
    // Input control // 
+   .mem_req_vld       (inst_mem_req_vld        ), // o, [1] X logic  , Read request valid
+   .mem_req_rdy       (inst_mem_req_rdy        ), // i, [1] X logic  , Read request ready
    .mem_addr          (inst_mem_addr           ), // o, 32  X logic  , Address
    // Output data // 
+   .mem_rsp_vld       (inst_mem_rsp_vld        ), // i, [1] X logic  , Output data valid
    .mem_dat_out       (inst_mem_dat_out        )  // i, 32  X logic  , Output data (from memory POV)
 );
 
@@ -221,6 +273,10 @@ execute_top i_execute_top (
    .id_branch_nt_pc (id2ex_branch_nt_pc ),
    .ex_branch_flush (branch_flush       ),
    .ex_branch_pc    (branch_flush_pc    ),
+   // Branch predictor update //
+   .ex_bp_branch    (ex2if_bp_branch    ), // o, [1] X logic  , instruction is a branch
+   .ex_bp_jalr      (ex2if_bp_jalr      ), // o, [1] X logic  , instruction is a jalr
+   .ex_bp_taken     (ex2if_bp_taken     ), // o, [1] X logic  , branch actual direction
    // Memory Access Outputs // 
    .ma_pc           (ex2ma_pc_next      ), // o, 32 X logic  , Output pc
    .ma_inst         (ex2ma_inst_next    ), // o, 32 X logic  , Output instruction
@@ -266,10 +322,12 @@ always_ff @(posedge clk) if (!rst_n) pc                 <=    0 ;
 // parameter. This is done to allow working with smaller instruction address
 // space thus saving test time
 // IF --> ID // 
-always_ff @(posedge clk) if (!rst_n) if2id_pc           <=    0 ;                                                       else if2id_pc           <= pc                      ; 
+// the stalled instruction keeps its PC and prediction along with it
+always_ff @(posedge clk) if (!rst_n) if2id_pc           <=    0 ;  else if (intrlock_bubble) if2id_pc <= if2id_pc     ; else if2id_pc           <= pc                      ; 
 always_ff @(posedge clk) if (!rst_n) if2id_inst         <=    0 ;  else if (intrlock_bubble) if2id_inst <= if2id_inst ; else if2id_inst         <= if2id_inst_next         ; 
-always_ff @(posedge clk) if (!rst_n) if2id_branch_taken <= 1'b0 ;                                                       else if2id_branch_taken <= if2id_branch_taken_next ; 
-always_ff @(posedge clk) if (!rst_n) if2id_branch_nt_pc <=    0 ;                                                       else if2id_branch_nt_pc <= if2id_branch_nt_pc_next ; 
+always_ff @(posedge clk) if (!rst_n) if2id_vld          <= 1'b0 ;  else if (intrlock_bubble) if2id_vld <= if2id_vld   ; else if2id_vld          <= ~branch_flush & if2id_vld_next ; 
+always_ff @(posedge clk) if (!rst_n) if2id_branch_taken <= 1'b0 ;  else if (intrlock_bubble) if2id_branch_taken <= if2id_branch_taken ; else if2id_branch_taken <= if2id_branch_taken_next ; 
+always_ff @(posedge clk) if (!rst_n) if2id_branch_nt_pc <=    0 ;  else if (intrlock_bubble) if2id_branch_nt_pc <= if2id_branch_nt_pc ; else if2id_branch_nt_pc <= if2id_branch_nt_pc_next ; 
 // ID --> EX // 
 always_ff @(posedge clk) if (!rst_n) id2ex_inst         <=    0 ;                                                       else id2ex_inst         <= id2ex_inst_next         ; 
 always_ff @(posedge clk) if (!rst_n) id2ex_dat_a        <=    0 ;                                                       else id2ex_dat_a        <= id2ex_dat_a_next        ; 
@@ -288,6 +346,27 @@ always_ff @(posedge clk) if (!rst_n) ma2wb_pc           <=    0 ;
 always_ff @(posedge clk) if (!rst_n) ma2wb_inst         <=    0 ;                                                       else ma2wb_inst         <= ma2wb_inst_next         ; 
 always_ff @(posedge clk) if (!rst_n) ma2wb_dat          <=    0 ;                                                       else ma2wb_dat          <= ma2wb_dat_next          ; 
 
+// Performance counters //
+// -------------------- //
+assign perf_evnt[PERF_CYCLES  ] = 1'b1 ;
+assign perf_evnt[PERF_RETIRED ] = if2id_vld & ~intrlock_bubble & ~branch_flush ; // leaves decode to execute
+assign perf_evnt[PERF_INTRLOCK] = intrlock_bubble ;
+assign perf_evnt[PERF_BR_FLUSH] = branch_flush & ex2if_bp_branch ;
+assign perf_evnt[PERF_JR_FLUSH] = branch_flush & ex2if_bp_jalr ;
+assign perf_evnt[PERF_TRAPS   ] = exc_inst_addr_mis | exc_inst_addr_oob | exc_main_addr_mis | exc_main_addr_oob ; // fetch jumps to the trap handler
+
+etcpu_perf_cntrs #(.EVNT_N(PERF_N), .CNT_W(64)) i_etcpu_perf_cntrs (
+   // General Signals //
+   .clk      (clk           ), // i, [1] X logic          , clock signal
+   .rst_n    (rst_n         ), // i, [1] X logic          , active low reset
+   // Configurations //
+   .cfg_clr  (cfg_perf_clr  ), // i, [1] X logic          , hold all counters at 0
+   // Events //
+   .evnt     (perf_evnt     ), // i, PERF_N X logic       , per-cycle event indications
+   // Counters //
+   .cnt_next (perf_cnt_next )  // o, PERF_N X 64 X logic  , counters next value
+);
+
 // Management registers //
 // -------------------- // 
 etcpu_mng_regs i_etcpu_mng_regs ( 
@@ -305,6 +384,32 @@ etcpu_mng_regs i_etcpu_mng_regs (
    .etcpu_mng_regs_exc_main_addr_oob_hw_next (exc_main_addr_oob  ), // etcpu_mng_regs_exc_main_addr_oob: HW write port     , input(1b)
    .etcpu_mng_regs_epc_val_hw_next           (pc                 ), // etcpu_mng_regs_epc_val: HW write port , input(32b)
    .etcpu_mng_regs_epc_val_hw_we             (exc_evnt_agg       ), // etcpu_mng_regs_epc_val: HW write enable bit , input(1b)
+   .etcpu_mng_regs_perf_ctrl_freeze          (cfg_perf_freeze    ), // etcpu_mng_regs_perf_ctrl_freeze: HW read port , output(1b)
+   .etcpu_mng_regs_perf_ctrl_clr             (cfg_perf_clr       ), // etcpu_mng_regs_perf_ctrl_clr: HW read port    , output(1b)
+   .etcpu_mng_regs_perf_cycles_lo_val_hw_next   (perf_cnt_next[PERF_CYCLES][31:0 ]), // etcpu_mng_regs_perf_cycles_lo_val: HW write port , input(32b)
+   .etcpu_mng_regs_perf_cycles_lo_val_hw_we     (~cfg_perf_freeze                 ), // etcpu_mng_regs_perf_cycles_lo_val: HW write enable bit , input(1b)
+   .etcpu_mng_regs_perf_cycles_hi_val_hw_next   (perf_cnt_next[PERF_CYCLES][63:32]), // etcpu_mng_regs_perf_cycles_hi_val: HW write port , input(32b)
+   .etcpu_mng_regs_perf_cycles_hi_val_hw_we     (~cfg_perf_freeze                 ), // etcpu_mng_regs_perf_cycles_hi_val: HW write enable bit , input(1b)
+   .etcpu_mng_regs_perf_retired_lo_val_hw_next  (perf_cnt_next[PERF_RETIRED][31:0 ]), // etcpu_mng_regs_perf_retired_lo_val: HW write port , input(32b)
+   .etcpu_mng_regs_perf_retired_lo_val_hw_we    (~cfg_perf_freeze                 ), // etcpu_mng_regs_perf_retired_lo_val: HW write enable bit , input(1b)
+   .etcpu_mng_regs_perf_retired_hi_val_hw_next  (perf_cnt_next[PERF_RETIRED][63:32]), // etcpu_mng_regs_perf_retired_hi_val: HW write port , input(32b)
+   .etcpu_mng_regs_perf_retired_hi_val_hw_we    (~cfg_perf_freeze                 ), // etcpu_mng_regs_perf_retired_hi_val: HW write enable bit , input(1b)
+   .etcpu_mng_regs_perf_intrlock_lo_val_hw_next (perf_cnt_next[PERF_INTRLOCK][31:0 ]), // etcpu_mng_regs_perf_intrlock_lo_val: HW write port , input(32b)
+   .etcpu_mng_regs_perf_intrlock_lo_val_hw_we   (~cfg_perf_freeze                 ), // etcpu_mng_regs_perf_intrlock_lo_val: HW write enable bit , input(1b)
+   .etcpu_mng_regs_perf_intrlock_hi_val_hw_next (perf_cnt_next[PERF_INTRLOCK][63:32]), // etcpu_mng_regs_perf_intrlock_hi_val: HW write port , input(32b)
+   .etcpu_mng_regs_perf_intrlock_hi_val_hw_we   (~cfg_perf_freeze                 ), // etcpu_mng_regs_perf_intrlock_hi_val: HW write enable bit , input(1b)
+   .etcpu_mng_regs_perf_br_flush_lo_val_hw_next (perf_cnt_next[PERF_BR_FLUSH][31:0 ]), // etcpu_mng_regs_perf_br_flush_lo_val: HW write port , input(32b)
+   .etcpu_mng_regs_perf_br_flush_lo_val_hw_we   (~cfg_perf_freeze                 ), // etcpu_mng_regs_perf_br_flush_lo_val: HW write enable bit , input(1b)
+   .etcpu_mng_regs_perf_br_flush_hi_val_hw_next (perf_cnt_next[PERF_BR_FLUSH][63:32]), // etcpu_mng_regs_perf_br_flush_hi_val: HW write port , input(32b)
+   .etcpu_mng_regs_perf_br_flush_hi_val_hw_we   (~cfg_perf_freeze                 ), // etcpu_mng_regs_perf_br_flush_hi_val: HW write enable bit , input(1b)
+   .etcpu_mng_regs_perf_jr_flush_lo_val_hw_next (perf_cnt_next[PERF_JR_FLUSH][31:0 ]), // etcpu_mng_regs_perf_jr_flush_lo_val: HW write port , input(32b)
+   .etcpu_mng_regs_perf_jr_flush_lo_val_hw_we   (~cfg_perf_freeze                 ), // etcpu_mng_regs_perf_jr_flush_lo_val: HW write enable bit , input(1b)
+   .etcpu_mng_regs_perf_jr_flush_hi_val_hw_next (perf_cnt_next[PERF_JR_FLUSH][63:32]), // etcpu_mng_regs_perf_jr_flush_hi_val: HW write port , input(32b)
+   .etcpu_mng_regs_perf_jr_flush_hi_val_hw_we   (~cfg_perf_freeze                 ), // etcpu_mng_regs_perf_jr_flush_hi_val: HW write enable bit , input(1b)
+   .etcpu_mng_regs_perf_traps_lo_val_hw_next    (perf_cnt_next[PERF_TRAPS][31:0 ] ), // etcpu_mng_regs_perf_traps_lo_val: HW write port , input(32b)
+   .etcpu_mng_regs_perf_traps_lo_val_hw_we      (~cfg_perf_freeze                 ), // etcpu_mng_regs_perf_traps_lo_val: HW write enable bit , input(1b)
+   .etcpu_mng_regs_perf_traps_hi_val_hw_next    (perf_cnt_next[PERF_TRAPS][63:32] ), // etcpu_mng_regs_perf_traps_hi_val: HW write port , input(32b)
+   .etcpu_mng_regs_perf_traps_hi_val_hw_we      (~cfg_perf_freeze                 ), // etcpu_mng_regs_perf_traps_hi_val: HW write enable bit , input(1b)
    .etcpu_mng_regs___intr                    (exc_evnt_agg       ), // etcpu_mng_regs__intr: agrregation of CPU exceptions , output(1b)
 
    // APB IF // 
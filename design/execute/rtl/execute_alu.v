@@ -93,7 +93,7 @@ assign mask_rtype_srl  = {32{{funct7, funct3}==ALU_SRL  }} ;
 assign mask_rtype_sra  = {32{{funct7, funct3}==ALU_SRA  }} ; 
 assign mask_rtype_sll  = {32{{funct7, funct3}==ALU_SLL  }} ; 
 // B-type //
-assign mask_btype_ltu  = {32{funct3==ALU_BGEU}} ; 
+assign mask_btype_ltu  = {32{(funct3==ALU_BLTU)|(funct3==ALU_BGEU)}} ; 
 assign mask_btype_lt   = {32{(funct3==ALU_BLT)|(funct3==ALU_BGE)}} ; 
 assign mask_btype_eq   = {32{(funct3==ALU_BEQ)|(funct3==ALU_BNE)}} ; 
 // I-type // 
@@ -8,24 +8,24 @@ module execute_branch_flush (
    input  logic [ 3-1:0] funct3 , 
    // Branch taken control //
    input  logic          br_pred , 
+   input  logic [32-1:0] br_pred_pc , // predicted jalr target
    // Output flush condition // 
-   output logic          flush 
+   output logic          flush , 
+   // Actual branch direction //
+   output logic          br_act 
 );
 
 // Imports //
 // ------- //
 import utils_top::* ; 
 
-// Internal wires //
-// -------------- //
-logic br_act ; 
-
 assign br_act = funct3==ALU_BGEU | funct3==ALU_BGE ?    ~alu_dat_out[0] : // BGE or BGEU
-                funct3==ALU_BLT                    ?     alu_dat_out[0] : // BLT 
+                funct3==ALU_BLTU | funct3==ALU_BLT ?     alu_dat_out[0] : // BLT or BLTU
                 funct3==ALU_BEQ                    ? ~(|(alu_dat_out))  : // BEQ
                                                        |(alu_dat_out)   ; // BNE
 
-assign flush = inst_jalr | (inst_branch & (br_pred ^ br_act)) ;
+// a jalr flushes unless the fetcher predicted its target //
+assign flush = (inst_jalr & ~(br_pred & br_pred_pc==alu_dat_out)) | (inst_branch & (br_pred ^ br_act)) ;
 
 endmodule
 
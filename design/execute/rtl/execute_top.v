@@ -23,11 +23,17 @@ module execute_top (
 
    // Branch IF //
    // --------- //
-   input  logic          id_branch_taken , // Branch taken by Fetcher branch prediction
-   input  logic [32-1:0] id_branch_nt_pc , // non-taken branch PC 
+   input  logic          id_branch_taken , // Branch taken by Fetcher branch prediction, or jalr target predicted
+   input  logic [32-1:0] id_branch_nt_pc , // non-taken branch PC, or predicted jalr target
    output logic          ex_branch_flush , // Branch flush indicator from execute stage
    output logic [32-1:0] ex_branch_pc    , // Branch flush indicator from execute stage
 
+   // Branch predictor update //
+   // ----------------------- //
+   output logic          ex_bp_branch    , // instruction is a branch
+   output logic          ex_bp_jalr      , // instruction is a jalr, its target is ma_dat
+   output logic          ex_bp_taken     , // branch actual direction
+
    // Memory Access Outputs // 
    // --------------------- //
    output logic [32-1:0] ma_inst         , // Output instruction 
@@ -66,9 +72,13 @@ execute_branch_flush i_execute_branch_flush (
    .alu_dat_out ( ma_dat          ),
    .funct3      ( id_inst[14:12]  ),
    .br_pred     ( id_branch_taken ),
-   .flush       ( ex_branch_flush )
+   .br_pred_pc  ( id_branch_nt_pc ),
+   .flush       ( ex_branch_flush ),
+   .br_act      ( ex_bp_taken     )
 );
 assign ex_branch_pc = inst_jalr ? ma_dat : id_branch_nt_pc ; 
+assign ex_bp_branch = inst_branch ; 
+assign ex_bp_jalr   = inst_jalr ; 
 
 // Drive Forwarding Interface //
 // -------------------------- //
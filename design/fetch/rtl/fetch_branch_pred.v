@@ -0,0 +1,117 @@
+//
+// fetch_branch_pred.v
+//
+
+module fetch_branch_pred #(
+   // Parameters //
+   // ---------- //
+   parameter  int BP_DYNAMIC          = 1 , // 1 - BHT + BTB prediction, 0 - static backward-taken prediction
+   parameter  int BHT_IDX_W           = 6 , // BHT index width, 2**BHT_IDX_W 2-bit counters
+   parameter  int BTB_IDX_W           = 3 , // BTB index width, 2**BTB_IDX_W jalr targets
+   parameter  int INST_MEM_BYTE_ADD_W = 8 , // Byte address width of instruction memory
+   // Derived parameters //
+   // ------------------ //
+   localparam int BHT_N               = 2**BHT_IDX_W  , // BHT entries
+   localparam int BTB_N               = 2**BTB_IDX_W  , // BTB entries
+   localparam int BTB_TAG_W           = 32-BTB_IDX_W-2  // BTB tag width, the PC bits above the index
+)(
+   // General Signals //
+   // --------------- //
+   input  logic          clk          , // clock signal
+   input  logic          rst_n        , // active low reset
+
+   // Lookup, fetch stage //
+   // ------------------- //
+   input  logic [32-1:0] pc           , // fetched instruction PC
+   input  logic          inst_branch  , // fetched instruction is a branch
+   input  logic          inst_jalr    , // fetched instruction is a jalr
+   input  logic [32-1:0] b_imm        , // fetched instruction B-type immediate
+   output logic          pred_taken   , // branch predicted taken, or jalr target predicted
+   output logic [32-1:0] pred_target  , // predicted jalr target
+
+   // Update, execute stage //
+   // --------------------- //
+   input  logic          upd_branch   , // executed instruction is a branch
+   input  logic          upd_jalr     , // executed instruction is a jalr
+   input  logic          upd_taken    , // executed branch actual direction
+   input  logic [32-1:0] upd_pc       , // executed instruction PC
+   input  logic [32-1:0] upd_target     // executed jalr actual target
+);
+
+generate
+if (BP_DYNAMIC) begin : gen_dynamic
+
+   // Internal Registers //
+   // ------------------ //
+   logic [BHT_N-1:0][2        -1:0] bht        ; // 2-bit saturating counters, taken if the MSB is set
+   logic [BTB_N-1:0]                btb_vld    ;
+   logic [BTB_N-1:0][BTB_TAG_W-1:0] btb_tag    ;
+   logic [BTB_N-1:0][32       -1:0] btb_target ;
+
+   // Internal Wires //
+   // -------------- //
+   logic [BHT_IDX_W-1:0] bht_rd_idx     ;
+   logic [BHT_IDX_W-1:0] bht_wr_idx     ;
+   logic [BTB_IDX_W-1:0] btb_rd_idx     ;
+   logic [BTB_IDX_W-1:0] btb_wr_idx     ;
+   logic                 btb_hit        ;
+   logic                 upd_target_vld ;
+
+   // Lookup //
+   // ------ //
+   assign bht_rd_idx  = pc[BHT_IDX_W+2-1:2] ;
+   assign btb_rd_idx  = pc[BTB_IDX_W+2-1:2] ;
+   assign btb_hit     = btb_vld[btb_rd_idx] & btb_tag[btb_rd_idx]==pc[32-1:BTB_IDX_W+2] ;
+   assign pred_taken  = (inst_branch & bht[bht_rd_idx][1]) | (inst_jalr & btb_hit) ;
+   assign pred_target = btb_target[btb_rd_idx] ;
+
+   // Update //
+   // ------ //
+   assign bht_wr_idx = upd_pc[BHT_IDX_W+2-1:2] ;
+   assign btb_wr_idx = upd_pc[BTB_IDX_W+2-1:2] ;
+   // only targets the fetch can jump to are kept, a bad one flushes and traps from execute
+   assign upd_target_vld = ~(|(upd_target[1:0])) & ~(|(upd_target[32-1:INST_MEM_BYTE_ADD_W])) ;
+
+   always_ff @(posedge clk) begin
+      if (!rst_n)
+         bht <= {BHT_N{2'b01}} ; // weakly not-taken
+      else if (upd_branch & upd_taken & bht[bht_wr_idx]!=2'b11)
+         bht[bht_wr_idx] <= bht[bht_wr_idx] + 2'b01 ;
+      else if (upd_branch & ~upd_taken & bht[bht_wr_idx]!=2'b00)
+         bht[bht_wr_idx] <= bht[bht_wr_idx] - 2'b01 ;
+   end
+
+   always_ff @(posedge clk) begin
+      if (!rst_n) begin
+         btb_vld    <= '0 ;
+         btb_tag    <= '0 ;
+         btb_target <= '0 ;
+      end
+      else if (upd_jalr & upd_target_vld) begin
+         btb_vld   [btb_wr_idx] <= 1'b1 ;
+         btb_tag   [btb_wr_idx] <= upd_pc[32-1:BTB_IDX_W+2] ;
+         btb_target[btb_wr_idx] <= upd_target ;
+      end
+   end
+
+end
+else begin : gen_static
+
+   // Backward branches taken, jalr never predicted //
+   // --------------------------------------------- //
+   assign pred_taken  = inst_branch & b_imm[31] ;
+   assign pred_target = '0 ;
+
+end
+endgenerate
+
+endmodule
+
+//|~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~|//
+//|                                               |//
+//| 1. Project  :  etcpu                          |//
+//| 2. Author   :  Etay Sela                      |//
+//| 3. Date     :  2025-02-08                     |//
+//| 4. Version  :  v1.0.0                         |//
+//|                                               |//
+//|~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~|//
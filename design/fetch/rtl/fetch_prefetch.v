@@ -0,0 +1,139 @@
+//
+// fetch_prefetch.v
+//
+
+module fetch_prefetch #(
+   // Parameters //
+   // ---------- //
+   parameter  int PF_DEPTH            = 4 , // Prefetch buffer entries, requests in flight + instructions waiting for fetch
+   parameter  int INST_MEM_BYTE_ADD_W = 8 , // Byte address width of instruction memory
+   parameter  int PF_MAX_INFLIGHT     = 255 , // Instruction memory reads in flight at most (its read latency, at least 1)
+   // Derived parameters //
+   // ------------------ //
+   localparam int CNT_W               = $clog2(PF_DEPTH+1) ,       // Entries counter width
+   localparam int DROP_W              = $clog2(PF_MAX_INFLIGHT+1)  // Dropped responses counter width, every read in flight may be dropped
+)(
+   // General Signals //
+   // --------------- //
+   input  logic          clk           , // clock signal
+   input  logic          rst_n         , // active low reset
+
+   // Fetch IF //
+   // -------- //
+   input  logic [32-1:0] pc            , // Program counter value, address of the instruction to fetch
+   input  logic          redirect      , // previous cycle flushed or trapped, restart the stream at pc
+   output logic          if_vld        , // instruction of pc is valid
+   input  logic          if_rdy        , // fetch takes the instruction
+   output logic [32-1:0] if_dat        , // instruction of pc
+
+   // Memory Request IF //
+   // ----------------- //
+   output logic          mem_req_vld   , // read request valid
+   input  logic          mem_req_rdy   , // memory accepts the read request
+   output logic [32-1:0] mem_addr      , // read address
+
+   // Memory Response IF //
+   // ------------------ //
+   input  logic          mem_rsp_vld   , // read data valid, responses return in request order
+   input  logic [32-1:0] mem_dat_out     // read data
+);
+
+// Elaboration checks //
+// ------------------ //
+generate
+   if (PF_MAX_INFLIGHT < 1) begin : gen_chk_max_inflight
+      $error("fetch_prefetch: PF_MAX_INFLIGHT=%0d, must be at least 1", PF_MAX_INFLIGHT) ;
+   end
+endgenerate
+
+// Internal Registers //
+// ------------------ //
+logic [PF_DEPTH-1:0][32-1:0] q_dat    ; // entry 0 holds the instruction of pc
+logic [CNT_W   -1:0]         cnt      ; // entries allocated, requested and not taken by fetch
+logic [CNT_W   -1:0]         fill_cnt ; // entries holding their data
+logic [DROP_W  -1:0]         drop_cnt ; // responses of a dropped stream still in flight
+logic [32      -1:0]         nxt_addr ; // address of entry 0
+logic [32      -1:0]         req_addr ; // next address to request
+
+// Internal Wires //
+// -------------- //
+logic                        restart  ;
+logic [CNT_W   -1:0]         eff_cnt  ;
+logic [CNT_W   -1:0]         eff_fill ;
+logic [DROP_W  -1:0]         eff_drop ;
+logic                        req_acc  ;
+logic                        rsp_fill ;
+logic                        rsp_drop ;
+logic                        pop      ;
+
+// Stream restart //
+// -------------- //
+// a stream holds sequential addresses from nxt_addr, any other pc or a flush / trap
+// drops it, the responses already in flight are counted and thrown away
+assign restart  = redirect | nxt_addr!=pc ;
+assign eff_cnt  = restart ? '0 : cnt      ;
+assign eff_fill = restart ? '0 : fill_cnt ;
+assign eff_drop = restart ? drop_cnt + DROP_W'(cnt - fill_cnt) : drop_cnt ;
+
+// Memory request //
+// -------------- //
+assign mem_req_vld = eff_cnt < CNT_W'(PF_DEPTH) ;
+assign mem_addr    = restart ? pc : req_addr ;
+assign req_acc     = mem_req_vld & mem_req_rdy ;
+
+// Memory response //
+// --------------- //
+assign rsp_drop = mem_rsp_vld & eff_drop!='0 ;
+assign rsp_fill = mem_rsp_vld & eff_drop=='0 ;
+
+// Fetch IF, an empty buffer passes the response through //
+// ----------------------------------------------------- //
+assign if_vld = eff_fill!='0 | rsp_fill ;
+assign if_dat = eff_fill!='0 ? q_dat[0] : mem_dat_out ;
+assign pop    = if_vld & if_rdy ;
+
+// Counters and addresses //
+// ---------------------- //
+always_ff @(posedge clk) begin
+   if (!rst_n) begin
+      cnt      <= '0 ;
+      fill_cnt <= '0 ;
+      drop_cnt <= '0 ;
+      nxt_addr <= '0 ;
+      req_addr <= '0 ;
+   end
+   else begin
+      cnt      <= eff_cnt  + CNT_W'(req_acc)  - CNT_W'(pop) ;
+      fill_cnt <= eff_fill + CNT_W'(rsp_fill) - CNT_W'(pop) ;
+      drop_cnt <= eff_drop - DROP_W'(rsp_drop) ;
+      nxt_addr <= pop ? 32'((pc + 4) & ((1<<INST_MEM_BYTE_ADD_W)-1)) : pc ;
+      req_addr <= req_acc ? 32'((mem_addr + 4) & ((1<<INST_MEM_BYTE_ADD_W)-1)) : mem_addr ;
+   end
+end
+
+// Data entries, shifted toward entry 0 on every pop //
+// ------------------------------------------------- //
+genvar i ;
+generate
+   for (i=0 ; i<PF_DEPTH ; i++) begin : gen_q_dat
+      always_ff @(posedge clk) begin
+         if (!rst_n)
+            q_dat[i] <= '0 ;
+         else if (rsp_fill & eff_fill==CNT_W'(i)+CNT_W'(pop))
+            q_dat[i] <= mem_dat_out ;
+         else if (pop)
+            q_dat[i] <= i<PF_DEPTH-1 ? q_dat[(i+1)%PF_DEPTH] : '0 ;
+      end
+   end
+endgenerate
+
+endmodule
+
+//|~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~|//
+//|                                               |//
+//| 1. Project  :  etcpu                          |//
+//| 2. Author   :  Etay Sela                      |//
+//| 3. Date     :  2025-02-08                     |//
+//| 4. Version  :  v1.0.0                         |//
+//|                                               |//
+//|~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~|//
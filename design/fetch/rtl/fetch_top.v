@@ -5,8 +5,18 @@
 module fetch_top #(
    // Parameters //
    // ---------- //
-   parameter int INST_MEM_BYTE_ADD_W = 8 // Byte address width of instruction memory
+   parameter int INST_MEM_BYTE_ADD_W = 8 , // Byte address width of instruction memory
+   parameter int BP_DYNAMIC          = 1 , // 1 - BHT + BTB branch prediction, 0 - static backward-taken prediction
+   parameter int BHT_IDX_W           = 6 , // BHT index width, 2**BHT_IDX_W 2-bit counters
+   parameter int BTB_IDX_W           = 3 , // BTB index width, 2**BTB_IDX_W jalr targets
+   parameter int PF_DEPTH            = 4 , // Prefetch buffer entries
+   parameter int PF_MAX_INFLIGHT     = 255 // Instruction memory reads in flight at most (its read latency, at least 1)
 )(
+   // General Signals //
+   // --------------- //
+   input  logic          clk                , // clock signal
+   input  logic          rst_n              , // active low reset
+
    // Configurations //
    // -------------- //
    input  logic [32-1:0] cfg_trap_hdlr_addr , // configurable trap handler base address 
@@ -18,6 +28,7 @@ module fetch_top #(
    // Instruction Register // 
    // -------------------- //
    output logic [32-1:0] id_inst            , // Decode stage instruction 
+   output logic          id_inst_vld        , // Decode stage instruction valid, the prefetch buffer was not empty
 
    // Pipe interlock bubble //
    // --------------------- //
@@ -25,11 +36,19 @@ module fetch_top #(
 
    // Branch IF //
    // --------- //
-   output logic          id_branch_taken    , // Branch taken by Fetcher branch prediction
-   output logic [32-1:0] id_branch_nt_pc    , // non-taken branch PC 
+   output logic          id_branch_taken    , // Branch taken by Fetcher branch prediction, or jalr target predicted
+   output logic [32-1:0] id_branch_nt_pc    , // non-taken branch PC, or predicted jalr target
    input  logic          ex_branch_flush    , // Branch flush indicator from execute stage
    input  logic [32-1:0] ex_branch_pc       , // Branch flush PC
 
+   // Branch predictor update //
+   // ----------------------- //
+   input  logic          ex_bp_branch       , // execute instruction is a branch
+   input  logic          ex_bp_jalr         , // execute instruction is a jalr
+   input  logic          ex_bp_taken        , // execute branch actual direction
+   input  logic [32-1:0] ex_bp_pc           , // execute instruction PC
+   input  logic [32-1:0] ex_bp_target       , // execute jalr actual target
+
    // Events //
    // ------ //
    input  logic          exc_main_addr_mis  , // exception - main memory address misaligned
@@ -42,11 +61,14 @@ module fetch_top #(
    // ----------------------------------------------------------------- //
    // Input control // 
    // ------------- //
-   output logic [32-1:0] mem_addr   , // Address  
+   output logic          mem_req_vld , // Read request valid
+   input  logic          mem_req_rdy , // Read request ready
+   output logic [32-1:0] mem_addr    , // Address  
 
    // Output data // 
    // ----------- //
-   input  logic [32-1:0] mem_dat_out  // Output data (from memory POV)
+   input  logic          mem_rsp_vld , // Output data valid
+   input  logic [32-1:0] mem_dat_out   // Output data (from memory POV)
 );
 
 // Import package //
@@ -61,8 +83,13 @@ logic [32-1:0] j_imm             ;
 logic [32-1:0] pc_p4             ; 
 logic [32-1:0] pc_pb             ; 
 logic [32-1:0] pc_pj             ; 
+logic [32-1:0] pc_pred           ; 
+logic [32-1:0] bp_target         ; 
 logic          jump2trap_cond    ; 
 logic [32-1:0] pc_next_unmasked  ; 
+logic          pf_redirect       ; 
+logic          if_vld            ; 
+logic [32-1:0] if_dat            ; 
 
 // Next Program Counter Logic //
 // -------------------------- //
@@ -74,14 +101,41 @@ assign j_imm = { {12{int_inst[31]}} , int_inst[19:12] , int_inst[20] , int_inst[
 assign pc_p4 = pc + 4 ; 
 assign pc_pb = pc + b_imm ; 
 assign pc_pj = pc + j_imm ;
+// Branch prediction //
+fetch_branch_pred #(
+   .BP_DYNAMIC          (BP_DYNAMIC          ),
+   .BHT_IDX_W           (BHT_IDX_W           ),
+   .BTB_IDX_W           (BTB_IDX_W           ),
+   .INST_MEM_BYTE_ADD_W (INST_MEM_BYTE_ADD_W )
+) i_fetch_branch_pred (
+   // General Signals //
+   .clk         (clk               ), // i, [1] X logic  , clock signal
+   .rst_n       (rst_n             ), // i, [1] X logic  , active low reset
+   // Lookup, fetch stage //
+   .pc          (pc                ), // i, 32  X logic  , fetched instruction PC
+   .inst_branch (opcode==OP_BRANCH ), // i, [1] X logic  , fetched instruction is a branch
+   .inst_jalr   (opcode==OP_JALR   ), // i, [1] X logic  , fetched instruction is a jalr
+   .b_imm       (b_imm             ), // i, 32  X logic  , fetched instruction B-type immediate
+   .pred_taken  (id_branch_taken   ), // o, [1] X logic  , branch predicted taken, or jalr target predicted
+   .pred_target (bp_target         ), // o, 32  X logic  , predicted jalr target
+   // Update, execute stage //
+   .upd_branch  (ex_bp_branch      ), // i, [1] X logic  , executed instruction is a branch
+   .upd_jalr    (ex_bp_jalr        ), // i, [1] X logic  , executed instruction is a jalr
+   .upd_taken   (ex_bp_taken       ), // i, [1] X logic  , executed branch actual direction
+   .upd_pc      (ex_bp_pc          ), // i, 32  X logic  , executed instruction PC
+   .upd_target  (ex_bp_target      )  // i, 32  X logic  , executed jalr actual target
+);
 // Drive output branch IF //
-assign id_branch_taken = opcode==OP_BRANCH & b_imm[31] ; 
-assign id_branch_nt_pc = id_branch_taken ? pc_p4 : pc_pb ; 
+assign pc_pred = opcode==OP_JALR ? bp_target : pc_pb ; 
+assign id_branch_nt_pc = opcode==OP_JALR ? bp_target : 
+                         id_branch_taken ? pc_p4     : 
+                                           pc_pb     ; 
 // Next PC logic //
 assign pc_next_unmasked = ex_branch_flush ? ex_branch_pc       : // FLUSH
                           intrlock_bubble ? pc                 : // BUBBLE
+                          ~if_vld         ? pc                 : // PREFETCH BUFFER EMPTY
                           opcode==OP_JAL  ? pc_pj              : // JAL PC
-                          id_branch_taken ? pc_pb              : // BRANCH PC
+                          id_branch_taken ? pc_pred            : // PREDICTED BRANCH / JALR PC
                                             pc_p4              ; // PC + 4 
 assign pc_next = jump2trap_cond ? cfg_trap_hdlr_addr : // met a trap, jump to handler
                                   pc_next_unmasked   ; // o.w, take the pc_next calculation above
@@ -92,15 +146,42 @@ assign exc_inst_addr_mis = |(pc_next_unmasked[1:0]) ;
 assign exc_inst_addr_oob = |(pc_next_unmasked[32-1:INST_MEM_BYTE_ADD_W]) ; 
 assign jump2trap_cond = exc_inst_addr_mis | exc_inst_addr_oob | exc_main_addr_mis | exc_main_addr_oob ; 
 
-// Memory Interface //
-// ---------------- //
-assign mem_addr = pc ; 
-assign int_inst = ex_branch_flush ? BUBBLE      :
-                                    mem_dat_out ; 
+// Prefetch buffer //
+// --------------- //
+// a flush or a trap restarts the stream even if it jumps to the next sequential address
+always_ff @(posedge clk) if (!rst_n) pf_redirect <= 1'b0 ; else pf_redirect <= ex_branch_flush | jump2trap_cond ; 
+
+fetch_prefetch #(
+   .PF_DEPTH            (PF_DEPTH            ),
+   .INST_MEM_BYTE_ADD_W (INST_MEM_BYTE_ADD_W ),
+   .PF_MAX_INFLIGHT     (PF_MAX_INFLIGHT     )
+) i_fetch_prefetch (
+   // General Signals //
+   .clk         (clk              ), // i, [1] X logic  , clock signal
+   .rst_n       (rst_n            ), // i, [1] X logic  , active low reset
+   // Fetch IF //
+   .pc          (pc               ), // i, 32  X logic  , address of the instruction to fetch
+   .redirect    (pf_redirect      ), // i, [1] X logic  , previous cycle flushed or trapped
+   .if_vld      (if_vld           ), // o, [1] X logic  , instruction of pc is valid
+   .if_rdy      (~intrlock_bubble ), // i, [1] X logic  , fetch takes the instruction
+   .if_dat      (if_dat           ), // o, 32  X logic  , instruction of pc
+   // Memory Request IF //
+   .mem_req_vld (mem_req_vld      ), // o, [1] X logic  , read request valid
+   .mem_req_rdy (mem_req_rdy      ), // i, [1] X logic  , memory accepts the read request
+   .mem_addr    (mem_addr         ), // o, 32  X logic  , read address
+   // Memory Response IF //
+   .mem_rsp_vld (mem_rsp_vld      ), // i, [1] X logic  , read data valid
+   .mem_dat_out (mem_dat_out      )  // i, 32  X logic  , read data
+);
+
+assign int_inst = ex_branch_flush ? BUBBLE :
+                  ~if_vld         ? BUBBLE :
+                                    if_dat ; 
 
 // Output instruction //
 // ------------------ //
-assign id_inst = int_inst ; 
+assign id_inst     = int_inst ; 
+assign id_inst_vld = if_vld   ; 
 
 endmodule
 
@@ -32,6 +32,7 @@ parameter bit [3-1:0] ALU_BEQ   =  3'b000 ; // func3[2:0]
 parameter bit [3-1:0] ALU_BNE   =  3'b001 ; // func3[2:0]
 parameter bit [3-1:0] ALU_BLT   =  3'b100 ; // func3[2:0]
 parameter bit [3-1:0] ALU_BGE   =  3'b101 ; // func3[2:0]
+parameter bit [3-1:0] ALU_BLTU  =  3'b110 ; // func3[2:0]
 parameter bit [3-1:0] ALU_BGEU  =  3'b111 ; // func3[2:0]
 // I-type //
 parameter bit [3-1:0] ALU_ADDI  =  3'b000 ; // func3[2:0]
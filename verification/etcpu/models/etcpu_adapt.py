@@ -0,0 +1,78 @@
+'''
+Coverage-directed random generator weights:
+    1. adapt_probs - reweights an opcode_probs mix toward the bins a merged coverage
+       database (see models.etcpu_cov) hit least, the opcode types and the get_rand_inst knobs:
+        btype_funct3 - per branch funct3 weights
+        btype_bwd    - probability of a backward branch
+        rs_reuse     - probability of reading a register one of the last 3 instructions wrote
+        raw_dist     - [EX, MA, WB] weights of that distance, EX after a load is a load-use hazard
+        reg_weights  - weights of the 32 register numbers
+    2. Every choice is reweighted by (mean hits / its hits) ** ADAPT_GAIN and keeps
+       at least MIN_SHARE of its group, so the loop never starves a choice
+used between the batches of python -m models.etcpu_regress --adapt N, which logs the seeds
+and weights of every batch to OUT_DIR/adapt.jsonl for replay
+'''
+from models.etcpu_cov import BIN_INDEX, BIN_NAMES, Coverage
+from models.riscv_infra import BRANCH_FUNCT3
+
+ADAPT_GAIN = 0.5
+MIN_SHARE = 0.02
+# opcode type -> its instructions, see get_rand_inst
+OPCODE_TYPE_INSTS = {
+    'itype': ('addi', 'slti', 'sltiu', 'xori', 'ori', 'andi', 'slli', 'srli', 'srai'),
+    'rtype': ('add', 'sub', 'sll', 'slt', 'sltu', 'xor', 'srl', 'sra', 'or', 'and'),
+    'store': ('sb', 'sh', 'sw'),
+    'load': ('lb', 'lh', 'lw', 'lbu', 'lhu'),
+    'jalr': ('jalr',),
+    'jal': ('jal',),
+    'btype': tuple(BRANCH_FUNCT3),
+}
+
+def reweight(weights: dict, counts: dict)->dict:
+    '''
+    weights moved toward the least counted choices, same total
+    '''
+    total = sum(weights.values()) or float(len(weights))
+    mean = sum(counts.values()) / len(counts)
+    new = {key: max(weight, MIN_SHARE * total) * ((mean + 1) / (counts[key] + 1)) ** ADAPT_GAIN for key, weight in weights.items()}
+    norm = total / sum(new.values())
+    return {key: round(max(weight * norm, MIN_SHARE * total), 4) for key, weight in new.items()}
+
+def reweight_prob(prob: float, hits: int, misses: int)->float:
+    '''
+    probability of a yes / no choice moved toward the least counted answer
+    '''
+    return reweight({'no': 1 - prob, 'yes': prob}, {'no': misses, 'yes': hits})['yes']
+
+def adapt_probs(cov: Coverage, probs: dict)->dict:
+    '''
+    the next opcode_probs mix (knobs included) from the coverage so far
+    '''
+    bins = cov.get_bins()
+    hits = lambda prefix: sum(bins[idx] for idx, name in enumerate(BIN_NAMES) if name.startswith(prefix))
+    adapted = {}
+
+    # 1. Opcode types, by the mean hits of their instructions
+    type_counts = {op_type: sum(bins[BIN_INDEX[f'inst.{name}']] for name in names) / len(names)
+                   for op_type, names in OPCODE_TYPE_INSTS.items()}
+    adapted.update(reweight({op_type: probs.get(op_type, 1) for op_type in OPCODE_TYPE_INSTS}, type_counts))
+
+    # 2. Branches, per funct3 and direction
+    btype_funct3 = probs.get('btype_funct3', {name: 1 for name in BRANCH_FUNCT3})
+    adapted['btype_funct3'] = reweight(btype_funct3, {name: hits(f'branch.{name}.') for name in BRANCH_FUNCT3})
+    bwd = sum(hits(f'branch.{name}.bwd.') for name in BRANCH_FUNCT3)
+    fwd = sum(hits(f'branch.{name}.fwd.') for name in BRANCH_FUNCT3)
+    adapted['btype_bwd'] = reweight_prob(probs.get('btype_bwd', 0), bwd, fwd)
+
+    # 3. Source registers, forwarding distance and load-use hazards
+    fwd_counts = {stage: hits(f'fwd.rs1.{stage}') + hits(f'fwd.rs2.{stage}') for stage in ('ex', 'ma', 'wb')}
+    reads = hits('rs1.') + hits('rs2.')
+    adapted['rs_reuse'] = reweight_prob(probs.get('rs_reuse', 0), sum(fwd_counts.values()), reads - sum(fwd_counts.values()))
+    fwd_counts['ex'] = min(fwd_counts['ex'], bins[BIN_INDEX['hazard.load_use']])
+    raw_dist = dict(zip(('ex', 'ma', 'wb'), probs.get('raw_dist', [1, 1, 1])))
+    adapted['raw_dist'] = list(reweight(raw_dist, fwd_counts).values())
+
+    # 4. Register numbers, written and read
+    reg_counts = {reg: bins[BIN_INDEX[f'rd.x{reg}']] + bins[BIN_INDEX[f'rs1.x{reg}']] + bins[BIN_INDEX[f'rs2.x{reg}']] for reg in range(32)}
+    adapted['reg_weights'] = list(reweight(dict(enumerate(probs.get('reg_weights', [1] * 32))), reg_counts).values())
+    return adapted
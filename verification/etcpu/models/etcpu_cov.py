@@ -0,0 +1,275 @@
+'''
+Functional coverage of the checked instruction stream:
+    1. Coverage - a flat preallocated array of 64-bit bin counters, sampled by PCMonitor
+       per checked instruction and by the EXCChecker callbacks per cycle:
+        inst.*    - every RV32I instruction (opcode / funct3 / funct7[5]), inst.other for the rest
+        rd.*, rs1.*, rs2.* - register numbers written / read
+        fwd.*     - read-after-write distance of rs1 / rs2, the EX, MA or WB forwarding hit of decode_top.v
+        hazard.load_use - load-use interlock bubbles
+        branch.*  - branch prediction hit / miss per funct3 and direction, and of jalr
+        exc.*     - raised exceptions per class
+       an instruction word is counted once per sample (hit / flushed) and folded
+       into the bins it hits (computed once per word) when they are read
+    2. Compact binary databases (.etcv), saved by close_test to $ETCPU_COV_OUT (see etcpu_regress --cov)
+    3. CLI - merges databases (files or directories searched recursively) and reports holes:
+        python -m models.etcpu_cov merge -o merged.etcv regress_a/coverage.etcv regress_b/coverage.etcv
+        python -m models.etcpu_cov report merged.etcv [--holes]
+'''
+import argparse
+import struct
+import sys
+import zlib
+from array import array
+from pathlib import Path
+from typing import Iterable, List
+from models.riscv_infra import decode_inst
+
+COV_MAGIC = b'ETCV\x01\x00\x00\x00' # magic + format version
+COV_HEADER = struct.Struct('<IIQ') # bins number, layout CRC, merged runs
+EXC_NAMES = ('INST_MIS', 'INST_OOB', 'MAIN_MIS', 'MAIN_OOB') # models.etcpu_ref.EXC_NAMES, not imported to keep the merge free of cocotb
+OP_LOAD, OP_IMM, OP_AUIPC, OP_STORE, OP_RR, OP_LUI, OP_BRANCH, OP_JALR, OP_JAL = 0, 4, 5, 8, 12, 13, 24, 25, 27
+
+# (name, opcode, funct3, funct7[5]), None matches any value
+RV32I_INSTS = (
+    ('lui', OP_LUI, None, None), ('auipc', OP_AUIPC, None, None), ('jal', OP_JAL, None, None), ('jalr', OP_JALR, 0, None),
+    ('beq', OP_BRANCH, 0, None), ('bne', OP_BRANCH, 1, None), ('blt', OP_BRANCH, 4, None),
+    ('bge', OP_BRANCH, 5, None), ('bltu', OP_BRANCH, 6, None), ('bgeu', OP_BRANCH, 7, None),
+    ('lb', OP_LOAD, 0, None), ('lh', OP_LOAD, 1, None), ('lw', OP_LOAD, 2, None), ('lbu', OP_LOAD, 4, None), ('lhu', OP_LOAD, 5, None),
+    ('sb', OP_STORE, 0, None), ('sh', OP_STORE, 1, None), ('sw', OP_STORE, 2, None),
+    ('addi', OP_IMM, 0, None), ('slti', OP_IMM, 2, None), ('sltiu', OP_IMM, 3, None), ('xori', OP_IMM, 4, None),
+    ('ori', OP_IMM, 6, None), ('andi', OP_IMM, 7, None), ('slli', OP_IMM, 1, 0), ('srli', OP_IMM, 5, 0), ('srai', OP_IMM, 5, 1),
+    ('add', OP_RR, 0, 0), ('sub', OP_RR, 0, 1), ('sll', OP_RR, 1, 0), ('slt', OP_RR, 2, 0), ('sltu', OP_RR, 3, 0),
+    ('xor', OP_RR, 4, 0), ('srl', OP_RR, 5, 0), ('sra', OP_RR, 5, 1), ('or', OP_RR, 6, 0), ('and', OP_RR, 7, 0),
+)
+BRANCH_NAMES = {funct3: name for name, opcode, funct3, _ in RV32I_INSTS if opcode == OP_BRANCH}
+# opcode -> (writes rd, reads rs1, reads rs2)
+REG_USE = {
+    OP_LUI: (1, 0, 0), OP_AUIPC: (1, 0, 0), OP_JAL: (1, 0, 0), OP_JALR: (1, 1, 0), OP_BRANCH: (0, 1, 1),
+    OP_LOAD: (1, 1, 0), OP_STORE: (0, 1, 1), OP_IMM: (1, 1, 0), OP_RR: (1, 1, 1),
+}
+
+def get_bin_names()->List[str]:
+    names = [f'inst.{name}' for name, _, _, _ in RV32I_INSTS] + ['inst.other']
+    for field in ('rd', 'rs1', 'rs2'):
+        names += [f'{field}.x{reg}' for reg in range(32)]
+    names += [f'fwd.{src}.{stage}' for src in ('rs1', 'rs2') for stage in ('ex', 'ma', 'wb')]
+    names.append('hazard.load_use')
+    names += [f'branch.{name}.{direction}.{result}' for name in BRANCH_NAMES.values()
+              for direction in ('fwd', 'bwd') for result in ('hit', 'miss')]
+    names += ['branch.jalr.hit', 'branch.jalr.miss']
+    names += [f'exc.{name}' for name in EXC_NAMES]
+    return names
+
+BIN_NAMES = tuple(get_bin_names())
+BIN_INDEX = {name: idx for idx, name in enumerate(BIN_NAMES)}
+NON_GOAL_BINS = frozenset((BIN_INDEX['inst.other'],)) # reported, but not counted as holes
+COV_LAYOUT_CRC = zlib.crc32('\n'.join(BIN_NAMES).encode())
+BIN_RD, BIN_RS1, BIN_RS2 = BIN_INDEX['rd.x0'], BIN_INDEX['rs1.x0'], BIN_INDEX['rs2.x0']
+FWD_RS1_BIN, FWD_RS2_BIN = BIN_INDEX['fwd.rs1.ex'], BIN_INDEX['fwd.rs2.ex']
+LOAD_USE_BIN, EXC_BIN = BIN_INDEX['hazard.load_use'], BIN_INDEX[f'exc.{EXC_NAMES[0]}']
+NO_BIN = len(BIN_NAMES) # scratch counters past the saved bins, hit instead of branching on what an instruction uses
+
+def get_inst_bins(word: int)->tuple:
+    '''
+    (inst, rd, rs1, rs2, prediction hit bins, rd written, rs1 read, rs2 read) of an instruction word,
+    registers not written / read are 0 and their bins NO_BIN, the miss bin follows the hit bin (flushed)
+    '''
+    inst = decode_inst(word)
+    name = 'other'
+    if word & 0x3 == 0x3:
+        b30 = inst.funct7 >> 5
+        for inst_name, opcode, funct3, funct7_b30 in RV32I_INSTS:
+            if inst.opcode == opcode and funct3 in (None, inst.funct3) and funct7_b30 in (None, b30):
+                name = inst_name
+                break
+    if name == 'other':
+        return BIN_INDEX['inst.other'], NO_BIN, NO_BIN, NO_BIN, NO_BIN, 0, 0, 0
+    writes_rd, reads_rs1, reads_rs2 = REG_USE[inst.opcode]
+    branch_bin = NO_BIN
+    if inst.opcode == OP_BRANCH:
+        branch_bin = BIN_INDEX[f"branch.{name}.{'bwd' if inst.b_imm < 0 else 'fwd'}.hit"]
+    elif inst.opcode == OP_JALR:
+        branch_bin = BIN_INDEX['branch.jalr.hit']
+    return (BIN_INDEX[f'inst.{name}'],
+            BIN_RD + inst.rd if writes_rd else NO_BIN, BIN_RS1 + inst.rs1 if reads_rs1 else NO_BIN,
+            BIN_RS2 + inst.rs2 if reads_rs2 else NO_BIN, branch_bin,
+            inst.rd if writes_rd else 0, inst.rs1 if reads_rs1 else 0, inst.rs2 if reads_rs2 else 0)
+
+class Coverage(object):
+    '''
+    Coverage collector and database:
+        1. sample_inst - per checked instruction (PCMonitor), tracks the last 3 destination
+           registers (bubbles and flushed slots included) for the forwarding distance
+        2. sample_exc - per cycle exceptions vector (EXCChecker callback)
+        3. get_bins - all bins, the per word counters folded in
+        4. save / load / merge - compact binary databases, all bins are 64-bit counters
+    save_all saves every collector that has a path (used by close_test)
+    '''
+    open_covs = []
+
+    def __init__(self, path: str=None):
+        self.path = path
+        self.bins = array('Q', bytes(8 * (len(BIN_NAMES) + 2)))
+        self.runs = 1
+        self.word_hits = array('Q') # (hit, flushed) counters per instruction word
+        self.word_bins = [] # get_inst_bins per instruction word
+        self.words = {} # instruction word -> (word_hits index, rd, rs1, rs2)
+        self.rd_hist = (0, 0, 0) # destinations in EX, MA and WB, 0 if none
+        if path is not None:
+            Coverage.open_covs.append(self)
+
+    def reset(self):
+        self.rd_hist = (0, 0, 0)
+
+    def _add_word(self, word: int)->tuple:
+        inst_bins = get_inst_bins(word)
+        self.words[word] = info = (len(self.word_hits),) + inst_bins[5:]
+        self.word_bins.append(inst_bins[:5])
+        self.word_hits.extend((0, 0))
+        return info
+
+    def sample_inst(self, word: int, intrlock: int, flush: bool):
+        ex_rd, ma_rd, wb_rd = self.rd_hist
+        if intrlock:
+            # the instruction stays in decode, a bubble moves on
+            self.bins[LOAD_USE_BIN] += 1
+            self.rd_hist = (0, ex_rd, ma_rd)
+            return
+        info = self.words.get(word)
+        if info is None:
+            info = self._add_word(word)
+        slot, rd, rs1, rs2 = info
+        self.word_hits[slot + flush] += 1
+        # x0 is never forwarded, the closest write wins
+        if rs1 and (rs1 == ex_rd or rs1 == ma_rd or rs1 == wb_rd):
+            self.bins[FWD_RS1_BIN + (0 if rs1 == ex_rd else 1 if rs1 == ma_rd else 2)] += 1
+        if rs2 and (rs2 == ex_rd or rs2 == ma_rd or rs2 == wb_rd):
+            self.bins[FWD_RS2_BIN + (0 if rs2 == ex_rd else 1 if rs2 == ma_rd else 2)] += 1
+        # the 2 instructions after a flush are killed
+        self.rd_hist = (0, 0, rd) if flush else (rd, ex_rd, ma_rd)
+
+    def sample_exc(self, exc: int):
+        if exc:
+            for bit in range(len(EXC_NAMES)):
+                if exc >> bit & 1:
+                    self.bins[EXC_BIN + bit] += 1
+
+    def get_bins(self)->array:
+        bins = array('Q', self.bins)
+        for idx, (inst_bin, rd_bin, rs1_bin, rs2_bin, branch_bin) in enumerate(self.word_bins):
+            hit, flushed = self.word_hits[2 * idx], self.word_hits[2 * idx + 1]
+            for bin_idx in (inst_bin, rd_bin, rs1_bin, rs2_bin):
+                bins[bin_idx] += hit + flushed
+            bins[branch_bin] += hit
+            bins[branch_bin + 1] += flushed
+        return bins
+
+    def merge(self, other: 'Coverage'):
+        self.bins = array('Q', map(int.__add__, self.get_bins(), other.get_bins()))
+        self.word_hits, self.word_bins, self.words = array('Q'), [], {}
+        self.runs += other.runs
+
+    def get_hit_num(self)->tuple:
+        '''
+        (goal bins hit, goal bins)
+        '''
+        goals = [count for idx, count in enumerate(self.get_bins()[:NO_BIN]) if idx not in NON_GOAL_BINS]
+        return sum(1 for count in goals if count), len(goals)
+
+    def get_holes(self)->List[str]:
+        bins = self.get_bins()
+        return [name for idx, name in enumerate(BIN_NAMES) if not bins[idx] and idx not in NON_GOAL_BINS]
+
+    def save(self, path: str=None):
+        bins = self.get_bins()[:NO_BIN]
+        if sys.byteorder != 'little':
+            bins.byteswap()
+        with open(path or self.path, 'wb') as file:
+            file.write(COV_MAGIC)
+            file.write(COV_HEADER.pack(len(bins), COV_LAYOUT_CRC, self.runs))
+            file.write(bins.tobytes())
+
+    @classmethod
+    def load(cls, path: str)->'Coverage':
+        with open(path, 'rb') as file:
+            data = file.read()
+        header_end = len(COV_MAGIC) + COV_HEADER.size
+        if data[:len(COV_MAGIC)] != COV_MAGIC or len(data) < header_end:
+            print(f'Error: {path} is not an etcpu coverage database')
+            exit(2)
+        bins_num, layout_crc, runs = COV_HEADER.unpack_from(data, len(COV_MAGIC))
+        if bins_num != len(BIN_NAMES) or layout_crc != COV_LAYOUT_CRC or len(data) != header_end + 8 * bins_num:
+            print(f'Error: {path} has a different bin layout, it was saved by another version of etcpu_cov')
+            exit(2)
+        cov = cls()
+        cov.bins = array('Q', data[header_end:])
+        if sys.byteorder != 'little':
+            cov.bins.byteswap()
+        cov.bins.extend((0, 0))
+        cov.runs = runs
+        return cov
+
+    @classmethod
+    def save_all(cls):
+        for cov in cls.open_covs:
+            cov.save()
+        cls.open_covs.clear()
+
+def get_db_paths(paths: Iterable[Path])->List[Path]:
+    db_paths = []
+    for path in paths:
+        db_paths += sorted(path.rglob('*.etcv')) if path.is_dir() else [path]
+    return db_paths
+
+def merge_dbs(paths: Iterable[Path])->Coverage:
+    '''
+    sum of the databases, None if there are none
+    '''
+    merged = None
+    for path in paths:
+        cov = Coverage.load(path)
+        if merged is None:
+            merged = cov
+        else:
+            merged.merge(cov)
+    return merged
+
+def get_report(cov: Coverage, holes: bool=False)->str:
+    '''
+    hit bins per group, the unhit bins if holes is set
+    '''
+    groups, bins = {}, cov.get_bins()
+    for idx, name in enumerate(BIN_NAMES):
+        if idx in NON_GOAL_BINS:
+            continue
+        group = groups.setdefault(name.split('.')[0], [0, 0])
+        group[0] += bool(bins[idx])
+        group[1] += 1
+    hit_num, goals_num = cov.get_hit_num()
+    lines = [f'Coverage : {hit_num}/{goals_num} bins hit ({100 * hit_num / goals_num:.1f}%) over {cov.runs} runs']
+    for group, (group_hit, group_num) in groups.items():
+        lines.append(f'    {group.ljust(8)} {group_hit}/{group_num}')
+    if holes:
+        lines += [f'    hole : {name}' for name in cov.get_holes()]
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description='merge and report etcpu coverage databases')
+    commands = parser.add_subparsers(dest='command', required=True)
+    merge_parser = commands.add_parser('merge', help='merge databases into one')
+    merge_parser.add_argument('paths', type=Path, nargs='+', help='databases or directories searched for *.etcv')
+    merge_parser.add_argument('-o', '--output', type=Path, required=True)
+    report_parser = commands.add_parser('report', help='report the hit bins of databases (merged)')
+    report_parser.add_argument('paths', type=Path, nargs='+', help='databases or directories searched for *.etcv')
+    report_parser.add_argument('--holes', action='store_true', help='list the bins never hit')
+    args = parser.parse_args()
+    cov = merge_dbs(get_db_paths(args.paths))
+    if cov is None:
+        print('Error: no coverage databases found')
+        exit(2)
+    if args.command == 'merge':
+        cov.save(args.output)
+    print(get_report(cov, args.command == 'report' and args.holes))
+
+if __name__ == '__main__':
+    main()
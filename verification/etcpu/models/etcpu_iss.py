@@ -0,0 +1,309 @@
+from array import array
+from bisect import bisect_left
+from collections import deque
+from typing import List, NamedTuple
+from models.riscv_infra import decode_inst, inst_int2str, inst_int2pcexp, inst_int2rgfexp, inst_int2mmexp, inst_str2int, BPConfig, BranchPredictor, BP_UPDATE_CYCLES
+
+NOP = inst_str2int('nop')
+OP_LOAD, OP_STORE, OP_RR, OP_IMM, OP_JALR, OP_BRANCH, OP_JAL, OP_LUI, OP_AUIPC = 0, 8, 12, 4, 25, 24, 27, 13, 5
+# reference model calls per opcode (inst_int2pcexp, inst_int2rgfexp, inst_int2mmexp), the
+# others can not write (no exceptions either), without inst_int2pcexp the next PC is sequential
+DISPATCH = {
+    OP_IMM: (False, True, False), OP_RR: (False, True, False), OP_LUI: (False, True, False), OP_AUIPC: (False, True, False),
+    OP_LOAD: (False, True, True), OP_STORE: (False, False, True),
+    OP_BRANCH: (True, False, False), OP_JAL: (True, True, False), OP_JALR: (True, True, False),
+}
+DISPATCH_ALL = (True, True, True) # any other opcode
+RD1_RE_OPS = (OP_IMM, OP_RR, OP_LOAD, OP_STORE, OP_JALR, OP_BRANCH) # opcodes reading rs1 in decode_top.v
+RD2_RE_OPS = (OP_RR, OP_STORE, OP_BRANCH) # opcodes reading rs2 in decode_top.v
+MAIN_EXC_SLOTS = 3 # a main memory exception is raised from the MA stage, 3 slots after fetch
+FLUSH_SLOTS = 2 # a flush bubbles the 2 instructions fetched after the flushing one
+# etcpu_top.v performance counters, in their register order
+PERF_CNTRS = ('cycles', 'retired', 'intrlock', 'br_flush', 'jr_flush', 'traps')
+
+class PFConfig(NamedTuple):
+    '''
+    instruction fetch parameters of etcpu_env_top.v (PF_DEPTH, INST_MEM_LAT)
+    '''
+    depth: int = 4
+    latency: int = 0
+
+class Checkpoint(NamedTuple):
+    '''
+    Architectural state between two instructions, with no trap in flight:
+        1. pc - address of the next instruction
+        2. rgf, mm - register file and main memory words
+        3. retired - instructions retired before it
+    '''
+    pc: int
+    rgf: tuple
+    mm: tuple
+    retired: int
+
+class ISS(object):
+    '''
+    RV32I instruction-set simulator of etcpu, no HDL simulator needed:
+        1. Executes an instruction memory image with the reference model semantics
+           (inst_int2pcexp, inst_int2rgfexp, inst_int2mmexp)
+        2. Tracks the fetch slot (cycle after CPU reset) of every instruction,
+           including interlock bubbles, flushes and the in-flight instructions
+           that still execute before a main memory exception traps
+        3. Records the retired-instruction, register-write, memory-write and
+           interlock / flush streams into compact arrays, each entry stamped with its fetch slot
+        4. Saves its architectural state into a Checkpoint and restarts from one,
+           as the CPU does when the state is loaded into it before leaving reset
+        5. Predicts the branches and jalr targets as the fetch stage configured by bp does,
+           its tables are trained in execute order and cleared by a restart
+        6. Delays the fetch slots by the instruction memory latency through the prefetch buffer
+           configured by pf: a stream of sequential requests, one per slot while the buffer has room,
+           restarted by any redirect, the instruction is fetched once its read returned
+    '''
+    def __init__(self, inst_mem: List[int], inst_mem_depth: int, main_mem_depth: int, trap_hdlr_addr: int, trace: bool=True, bp: BPConfig=BPConfig(), pf: PFConfig=PFConfig()):
+        self.inst_mem_depth = inst_mem_depth
+        self.main_mem_depth = main_mem_depth
+        self.inst_mem = list(inst_mem[:inst_mem_depth]) + [NOP] * max(0, inst_mem_depth - len(inst_mem))
+        self.insts = [None] * inst_mem_depth # (decoded instruction, DISPATCH entry) per word, once fetched
+        self.pc_range = inst_mem_depth << 2
+        self.trap_hdlr_addr = trap_hdlr_addr % (inst_mem_depth << 2)
+        self.trace = trace
+        self.bp = bp
+        self.pf = pf
+        # Architectural state
+        self.pc = 0
+        self.rgf = [0] * 32
+        self.mm = [0] * main_mem_depth
+        self.retired = 0
+        self._restart()
+
+    def _restart(self):
+        '''
+        pipeline timing, event counters and streams of a CPU leaving reset
+        '''
+        # Pipeline timing
+        self.cycle = 0
+        self.pending_traps = []
+        self.prev_slot = -2
+        self.prev_load_rd = 0
+        self.predictor = BranchPredictor(self.bp, self.inst_mem_depth)
+        # Prefetch buffer, the slot the next fetch's stream restarts on (None - sequential),
+        # the last request slot and the fetch slots of the last PF_DEPTH entries
+        self.pf_restart = 0
+        self.pf_req = -1
+        self.pf_pops = deque(maxlen=self.pf.depth)
+        # Event counters
+        self.intrlock_bubbles = 0
+        self.branch_flushes = 0
+        self.jalr_flushes = 0
+        self.traps = 0
+        # Streams
+        self.ret_slot, self.ret_pc, self.ret_inst = array('L'), array('L'), array('L')
+        self.rgf_slot, self.rgf_wa, self.rgf_wd = array('L'), array('L'), array('L')
+        self.mm_slot, self.mm_addr, self.mm_data = array('L'), array('L'), array('L')
+        self.exc_slot, self.exc_vec = array('L'), array('L')
+        self.intrlock_slot, self.br_flush_slot, self.jr_flush_slot = array('L'), array('L'), array('L')
+
+    def checkpoint(self)->Checkpoint:
+        '''
+        current architectural state, a main memory trap still in flight is taken first
+        '''
+        while self.pending_traps:
+            self.step()
+        return Checkpoint(self.pc, tuple(self.rgf), tuple(self.mm), self.retired)
+
+    def restore(self, checkpoint: Checkpoint):
+        '''
+        continues from a checkpoint, fetch slots count from the restart as after a CPU reset
+        '''
+        self.pc = checkpoint.pc
+        self.rgf = list(checkpoint.rgf)
+        self.mm = list(checkpoint.mm)
+        self.retired = checkpoint.retired
+        self._restart()
+
+    def _reads(self, inst, reg: int)->bool:
+        '''
+        True if the instruction reads the given register in the decode stage
+        '''
+        return (inst.opcode in RD1_RE_OPS and inst.rs1 == reg) or (inst.opcode in RD2_RE_OPS and inst.rs2 == reg)
+
+    def _fetch(self, idx: int)->tuple:
+        entry = self.insts[idx] = (decode_inst(self.inst_mem[idx]), DISPATCH.get(self.inst_mem[idx] >> 2 & 0x1f, DISPATCH_ALL))
+        return entry
+
+    def step(self):
+        '''
+        fetch, execute and retire a single instruction
+        '''
+        slot = self.cycle
+        pending_traps = self.pending_traps
+        restart = self.pf_restart
+        pf, pf_pops, insts = self.pf, self.pf_pops, self.insts
+        while True:
+            inst, dispatch = insts[self.pc >> 2] or self._fetch(self.pc >> 2)
+            # Prefetch buffer, requested once the buffer has room, fetched once the read returned
+            if restart is not None:
+                req = restart
+            else:
+                req = self.pf_req + 1
+                if len(pf_pops) == pf.depth and pf_pops[0] >= req:
+                    req = pf_pops[0] + 1
+            if req + pf.latency > slot:
+                slot = req + pf.latency
+            # Load-use interlock, the instruction waits one slot in decode
+            stalled = self.prev_load_rd != 0 and slot == self.prev_slot + 1 and self._reads(inst, self.prev_load_rd)
+            latch_slot = slot + 1 if stalled else slot
+            # A trap fired before this instruction was latched, fetch the handler instead
+            if pending_traps and pending_traps[0] < latch_slot:
+                trap_slot = pending_traps.pop(0)
+                self.pc = self.trap_hdlr_addr
+                self.traps += 1
+                slot = trap_slot + 1
+                restart = slot
+                continue
+            break
+        if restart is not None:
+            pf_pops.clear()
+        self.pf_req = req
+        pf_pops.append(slot)
+        trace = self.trace
+        if stalled:
+            self.intrlock_bubbles += 1
+            if trace:
+                self.intrlock_slot.append(latch_slot)
+
+        # Predict next PC, register file write and main memory write, only the calls the opcode needs
+        pc, rgf = self.pc, self.rgf
+        fetch_slot = slot
+        pc_call, rgf_call, mm_call = dispatch
+        if pc_call:
+            guess = self.predictor.guess(inst, pc, slot)
+            self.predictor.resolve(inst, pc, rgf, latch_slot + BP_UPDATE_CYCLES)
+            next_pc, flush, exc_inst_mis, exc_inst_oob = inst_int2pcexp(inst, rgf, pc, 0, self.inst_mem_depth, guess)
+        else:
+            # inst_int2pcexp of a sequential instruction
+            flush = False
+            exc_inst_mis, exc_inst_oob = pc % 4 != 0, ((pc + 8) >> 2) > self.inst_mem_depth
+            next_pc = (pc + 4) % self.pc_range
+        if mm_call:
+            mm_wen, mm_wa, mm_wd, exc_main_mis, exc_main_oob = inst_int2mmexp(inst, rgf, self.mm)
+        else:
+            mm_wen, exc_main_mis, exc_main_oob = 0, False, False
+        if rgf_call:
+            rgf_wen, rgf_wa, rgf_wd = inst_int2rgfexp(inst, rgf, self.mm, pc + 4)
+        else:
+            rgf_wen = 0
+        slot = latch_slot
+        if rgf_wen:
+            rgf[rgf_wa] = rgf_wd
+        if mm_wen:
+            self.mm[mm_wa >> 2] = mm_wd
+        if trace:
+            self.ret_slot.append(slot); self.ret_pc.append(pc); self.ret_inst.append(inst.word)
+            if rgf_wen:
+                self.rgf_slot.append(slot); self.rgf_wa.append(rgf_wa); self.rgf_wd.append(rgf_wd)
+            if mm_wen:
+                self.mm_slot.append(slot); self.mm_addr.append(mm_wa); self.mm_data.append(mm_wd)
+
+        # Flushes
+        if flush:
+            if inst.opcode == OP_JALR:
+                self.jalr_flushes += 1
+                if trace:
+                    self.jr_flush_slot.append(slot)
+            else:
+                self.branch_flushes += 1
+                if trace:
+                    self.br_flush_slot.append(slot)
+        redirect_slot = slot + FLUSH_SLOTS if flush else slot
+
+        # Exceptions
+        if exc_inst_mis or exc_inst_oob:
+            self._add_exc(redirect_slot, exc_inst_mis, exc_inst_oob, False, False)
+            pending_traps.append(redirect_slot)
+            pending_traps.sort()
+        if exc_main_mis or exc_main_oob:
+            self._add_exc(slot + MAIN_EXC_SLOTS, False, False, exc_main_mis, exc_main_oob)
+            pending_traps.append(slot + MAIN_EXC_SLOTS)
+            pending_traps.sort()
+        trapped = False
+        if pending_traps:
+            # a trap raised while a flush is in flight is overridden by the flush PC
+            while pending_traps and pending_traps[0] < redirect_slot:
+                pending_traps.pop(0)
+            if pending_traps and pending_traps[0] == redirect_slot:
+                pending_traps.pop(0)
+                next_pc = self.trap_hdlr_addr
+                self.traps += 1
+                trapped = True
+
+        # Advance, a flush or a trap restarts the prefetch stream, so does a predicted jump
+        if flush or trapped:
+            self.pf_restart = redirect_slot + 1
+        elif pc_call and next_pc != (pc + 4) % self.pc_range:
+            self.pf_restart = fetch_slot + 1
+        else:
+            self.pf_restart = None
+        self.prev_slot = slot
+        self.prev_load_rd = inst.rd if inst.opcode == OP_LOAD else 0
+        self.pc = next_pc
+        self.cycle = redirect_slot + 1
+        self.retired += 1
+
+    def _add_exc(self, slot: int, inst_mis: bool, inst_oob: bool, main_mis: bool, main_oob: bool):
+        if self.trace:
+            self.exc_slot.append(slot)
+            self.exc_vec.append(int(inst_mis) | (int(inst_oob) << 1) | (int(main_mis) << 2) | (int(main_oob) << 3))
+
+    def run(self, max_insts: int=None, max_cycles: int=None, stop_pc: int=None)->str:
+        '''
+        run until one of the limits is reached, returns the reason for stopping:
+            1. 'insts'  - max_insts instructions retired
+            2. 'cycles' - the next instruction can not be fetched before max_cycles
+            3. 'pc'     - PC reached stop_pc
+        '''
+        if max_insts is None and max_cycles is None and stop_pc is None:
+            print('Error: ISS.run needs at least one stopping condition')
+            exit(2)
+        while True:
+            if max_insts is not None and self.retired >= max_insts:
+                return 'insts'
+            if max_cycles is not None and self.cycle >= max_cycles:
+                return 'cycles'
+            if stop_pc is not None and self.pc == stop_pc:
+                return 'pc'
+            self.step()
+
+    def get_perf_cntrs(self, cycles: int)->dict:
+        '''
+        expected etcpu_top performance counters once the CPU ran cycles cycles out of reset,
+        every event counted on the cycle the RTL counts it (the run must reach cycles first):
+            1. retired  - the instruction leaves decode, a slot after its fetch
+            2. intrlock - the interlock bubble, the stalled instruction's slot
+            3. br_flush, jr_flush - the flush from execute, FLUSH_SLOTS after the fetch
+            4. traps    - a cycle raising exceptions (vectored to the trap handler)
+        '''
+        if not self.trace:
+            print('Error: ISS.get_perf_cntrs needs the streams of a trace=True run')
+            exit(2)
+        return {
+            'cycles': cycles,
+            'retired': bisect_left(self.ret_slot, cycles - 1),
+            'intrlock': bisect_left(self.intrlock_slot, cycles),
+            'br_flush': bisect_left(self.br_flush_slot, cycles - FLUSH_SLOTS),
+            'jr_flush': bisect_left(self.jr_flush_slot, cycles - FLUSH_SLOTS),
+            'traps': len({slot for slot in self.exc_slot if slot < cycles}),
+        }
+
+    def get_log_message(self, idx: int)->str:
+        '''
+        disassembly of the idx-th retired instruction
+        '''
+        return f' : {inst_int2str(self.ret_inst[idx]).ljust(20)} @ {hex(self.ret_pc[idx])} (cycle {self.ret_slot[idx]})'
+
+def get_checkpoint(inst_mem: List[int], inst_mem_depth: int, main_mem_depth: int, trap_hdlr_addr: int, inst_num: int)->Checkpoint:
+    '''
+    architectural state once inst_num instructions of the program retired, no streams recorded
+    '''
+    iss = ISS(inst_mem, inst_mem_depth, main_mem_depth, trap_hdlr_addr, trace=False)
+    iss.run(max_insts=inst_num)
+    return iss.checkpoint()
@@ -0,0 +1,261 @@
+'''
+Delta-debugging minimizer of failing random programs:
+    1. Starts from the failing program image, a JSON file (test_rand dumps it to
+       $ETCPU_IMAGE_OUT, etcpu_regress sets it per run) or captured by re-running a test_rand seed
+    2. Removes instruction chunks (branch, jal and absolute jalr targets move along with
+       the code) or replaces them with NOPs where a removal does not pass the pre-filter,
+       keeps the first candidate that still fails and halves the chunks otherwise
+    3. Pre-filters every candidate on the ISS: it has to run and raise no exception
+       the original program did not raise, only such candidates are simulated
+    4. Re-checks the candidates of a round in parallel simulator runs of tests.test_image,
+       --match also requires the failure message in their log
+    5. Writes the minimal program as a directed init_test / _driver_send test:
+        python -m models.etcpu_minimize --seed SEED -o tests/test_min_SEED.py
+the simulator command is the etcpu_regress one, the Python mock (models.etcpu_mock) by default
+'''
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List
+from models.etcpu_iss import ISS, NOP
+from models.etcpu_regress import MOCK_SIM_CMD, RegressJob, IMAGE_MODULE, IMAGE_TESTCASE, get_rand_job, run_job
+from models.riscv_asm import asm_line
+from models.riscv_infra import IMM_FORMATS, MASK32, decode_inst, encode_imm, inst_int2str
+
+TRAP_HDLR_ADDR = 0x80 # models.test_infra.TRAP_HDLR_ADDR, not imported to keep the minimizer free of cocotb
+OP_BRANCH, OP_JALR, OP_JAL = 24, 25, 27
+
+def set_imm(word: int, imm_type: str, value: int)->int:
+    '''
+    the instruction word with its immediate replaced by value
+    '''
+    mask = 1 << 31
+    for inst_lsb, seg_width, _ in IMM_FORMATS[imm_type][1]:
+        mask |= ((1 << seg_width) - 1) << inst_lsb
+    return (word & ~mask & MASK32) | encode_imm(imm_type, value)
+
+def strip_program(image: List[int])->List[int]:
+    '''
+    program words up to the last non-NOP one, the instruction memory is NOP filled
+    '''
+    end = len(image)
+    while end and image[end - 1] == NOP:
+        end -= 1
+    return list(image[:end])
+
+def remove_chunk(program: List[int], start: int, end: int)->List[int]:
+    '''
+    the program without words [start, end), branches, jal and jalr with rs1=x0 are
+    re-targeted to the new address of their target, a target inside the chunk
+    moves to the first word after it
+    '''
+    removed_bytes = (end - start) << 2
+    def new_addr(addr: int)->int:
+        if addr >> 2 >= end:
+            return addr - removed_bytes
+        return start << 2 if addr >> 2 >= start else addr
+    candidate = []
+    for idx, word in enumerate(program):
+        if start <= idx < end:
+            continue
+        inst, addr = decode_inst(word), idx << 2
+        if inst.opcode == OP_BRANCH:
+            word = set_imm(word, 'btype', new_addr(addr + inst.b_imm) - new_addr(addr))
+        elif inst.opcode == OP_JAL:
+            word = set_imm(word, 'jtype', new_addr(addr + inst.j_imm) - new_addr(addr))
+        elif inst.opcode == OP_JALR and inst.rs1 == 0 and inst.i_imm >= 0:
+            word = set_imm(word, 'itype', new_addr(inst.i_imm))
+        candidate.append(word)
+    return candidate
+
+def replace_chunk(program: List[int], start: int, end: int)->List[int]:
+    return program[:start] + [NOP] * (end - start) + program[end:]
+
+class ISSPreFilter(object):
+    '''
+    cheap candidate check on the ISS: the program runs max_cycles and raises
+    no exception kind (see etcpu_iss exc_vec) the original did not raise
+    '''
+    def __init__(self, program: List[int], inst_mem_depth: int, main_mem_depth: int, max_cycles: int):
+        self.inst_mem_depth = inst_mem_depth
+        self.main_mem_depth = main_mem_depth
+        self.max_cycles = max_cycles
+        self.exc_kinds = self.get_exc_kinds(program)
+        if self.exc_kinds is None:
+            print('Error: the original program does not run on the ISS')
+            exit(2)
+
+    def get_exc_kinds(self, program: List[int])->int:
+        '''
+        OR of the exception vectors the program raises, None if it does not run
+        '''
+        if len(program) > self.inst_mem_depth:
+            return None
+        iss = ISS(program, self.inst_mem_depth, self.main_mem_depth, TRAP_HDLR_ADDR)
+        try:
+            iss.run(max_cycles=self.max_cycles)
+        except (Exception, SystemExit): # the reference model exits on unsupported instructions
+            return None
+        exc_kinds = 0
+        for exc_vec in iss.exc_vec:
+            exc_kinds |= exc_vec
+        return exc_kinds
+
+    def __call__(self, program: List[int])->bool:
+        exc_kinds = self.get_exc_kinds(program)
+        return exc_kinds is not None and not (exc_kinds & ~self.exc_kinds)
+
+def minimize(program: List[int], check: Callable[[List[List[int]]], List[bool]], prefilter: Callable[[List[int]], bool], log=print)->List[int]:
+    '''
+    ddmin over the program words, check gets all candidates of a round at once
+    and returns which of them still fail
+    '''
+    program = strip_program(program)
+    chunks_num = 2
+    while program:
+        chunk_size = -(-len(program) // chunks_num)
+        candidates = []
+        for start in range(0, len(program), chunk_size):
+            end = min(start + chunk_size, len(program))
+            candidate = remove_chunk(program, start, end)
+            if not prefilter(candidate):
+                candidate = replace_chunk(program, start, end)
+                if candidate == program or not prefilter(candidate):
+                    continue
+            candidates.append(strip_program(candidate))
+        reduced = next((cand for cand, failing in zip(candidates, check(candidates) if candidates else []) if failing), None)
+        if reduced is not None:
+            program = reduced
+            chunks_num = max(chunks_num - 1, 2)
+            log(f'Minimize : {len(program)} words, {sum(word != NOP for word in program)} instructions')
+        elif chunk_size == 1:
+            break
+        else:
+            chunks_num = min(chunks_num * 2, len(program))
+    return program
+
+class SimCheck(object):
+    '''
+    runs candidate programs through tests.test_image in parallel simulator processes,
+    a candidate still fails if its run FAILs (and its log matches, if a pattern is given)
+    '''
+    def __init__(self, sim_cmd: str, sim_dir: Path, out_dir: Path, seed: int, workers: int, timeout: float, match: str=None):
+        self.sim_cmd = sim_cmd
+        self.sim_dir = sim_dir
+        self.out_dir = out_dir
+        self.seed = seed
+        self.workers = workers
+        self.timeout = timeout
+        self.match = re.compile(match) if match is not None else None
+        self.runs_num = 0
+
+    def _failing(self, result: dict)->bool:
+        if result['status'] != 'FAIL':
+            return False
+        return self.match is None or self.match.search(Path(result['log']).read_text(errors='replace')) is not None
+
+    def __call__(self, candidates: List[List[int]])->List[bool]:
+        jobs = []
+        for candidate in candidates:
+            jobs.append((RegressJob(IMAGE_MODULE, IMAGE_TESTCASE, self.seed, image=candidate), self.out_dir / f'run_{self.runs_num}'))
+            self.runs_num += 1
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = pool.map(lambda job: run_job(job[0], self.sim_cmd, self.sim_dir, job[1], self.timeout), jobs)
+            return [self._failing(result) for result in results]
+
+def get_inst_src(word: int)->str:
+    '''
+    _driver_send argument of a word, its disassembly if it assembles back to the same word
+    '''
+    inst_str = inst_int2str(word)
+    try:
+        if asm_line(inst_str) == word:
+            return repr(inst_str)
+    except (Exception, SystemExit):
+        pass
+    return hex(word)
+
+def render_test(program: List[int], testcase: str, origin: str, max_runtime: int)->str:
+    '''
+    directed test of the program in the init_test / _driver_send style
+    '''
+    lines = [
+        'import cocotb',
+        'from models.test_infra import init_test, close_test',
+        '',
+        '@cocotb.test()',
+        f'async def {testcase}(dut):',
+        "    '''",
+        f'    minimized {origin}: {sum(word != NOP for word in program)} instructions',
+        "    '''",
+        '    inst_driver, cpu_rst, rgf_sb, mm_sb = await init_test(dut)',
+    ]
+    idx = 0
+    while idx < len(program):
+        if program[idx] == NOP:
+            nops_num = 1
+            while idx + nops_num < len(program) and program[idx + nops_num] == NOP:
+                nops_num += 1
+            lines.append(f'    await inst_driver._load_nops({nops_num})'.ljust(64) + f'# {hex(idx << 2)}')
+            idx += nops_num
+            continue
+        lines.append(f'    await inst_driver._driver_send({get_inst_src(program[idx])})'.ljust(64) + f'# {hex(idx << 2)}')
+        idx += 1
+    lines.append(f'    await close_test(dut, cpu_rst, {max_runtime}, inst_driver.inst_mem_depth, rgf_sb, mm_sb)')
+    return '\n'.join(lines) + '\n'
+
+def main():
+    parser = argparse.ArgumentParser(description='minimize a failing etcpu random program')
+    parser.add_argument('--image', type=Path, default=None, help='failing program image, JSON list of words')
+    parser.add_argument('--seed', type=int, default=None, help='failing test_rand seed, its image is captured if --image is not given')
+    parser.add_argument('--sim-cmd', default=os.environ.get('ETCPU_SIM_CMD', MOCK_SIM_CMD), help='simulator command template, see etcpu_regress (default $ETCPU_SIM_CMD or the mock)')
+    parser.add_argument('--sim-dir', type=Path, default=Path.cwd(), help='directory the simulator command is run from')
+    parser.add_argument('--match', default=None, help='regex the failing run log has to match, e.g. MISMATCH')
+    parser.add_argument('--max-runtime', type=int, default=1000, help='cycles simulated per candidate, as in test_rand')
+    parser.add_argument('--inst-mem-depth', type=int, default=512)
+    parser.add_argument('--main-mem-depth', type=int, default=64)
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='parallel simulator processes')
+    parser.add_argument('--timeout', type=float, default=None, help='per-run timeout [s]')
+    parser.add_argument('--out-dir', type=Path, default=Path('minimize_out'), help='per-run logs and results')
+    parser.add_argument('-o', '--output', type=Path, default=None, help='directed test file (default tests/test_min_SEED.py)')
+    args = parser.parse_args()
+    if args.image is None and args.seed is None:
+        print('Error: give the failing program as --image or --seed')
+        exit(2)
+    seed = args.seed if args.seed is not None else 0
+    out_dir, sim_dir = args.out_dir.resolve(), args.sim_dir.resolve()
+    os.environ['ETCPU_MAX_RUNTIME'] = str(args.max_runtime) # read by tests.test_image
+
+    # 1. Failing program
+    if args.image is None:
+        job = get_rand_job(seed)
+        result = run_job(job, args.sim_cmd, sim_dir, out_dir, args.timeout)
+        image_path = out_dir / job.name / 'image.json'
+        if result['status'] != 'FAIL' or not image_path.exists():
+            print(f'Error: test_rand seed {seed} did not fail with its image dumped ({result["status"]}, {result["log"]})')
+            exit(2)
+    else:
+        image_path = args.image
+    program = strip_program(json.loads(image_path.read_text()))
+    check = SimCheck(args.sim_cmd, sim_dir, out_dir, seed, args.jobs, args.timeout, args.match)
+    if not check([program])[0]:
+        print(f'Error: the program of {image_path} does not fail, see {out_dir}')
+        exit(2)
+    print(f'Minimize : start from {len(program)} words, {sum(word != NOP for word in program)} instructions')
+
+    # 2. Reduce
+    prefilter = ISSPreFilter(program, args.inst_mem_depth, args.main_mem_depth, args.max_runtime)
+    program = minimize(program, check, prefilter)
+
+    # 3. Directed test
+    testcase = f'test_min_{seed}' if args.seed is not None else 'test_min'
+    output = args.output if args.output is not None else Path(__file__).resolve().parent.parent / 'tests' / f'{testcase}.py'
+    origin = f'from test_rand seed {seed}' if args.seed is not None else f'from {image_path}'
+    output.write_text(render_test(program, testcase, origin, args.max_runtime))
+    print(f'Minimize : {sum(word != NOP for word in program)} instructions left after {check.runs_num} simulator runs, written to {output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1073 @@
+'''
+Cycle-level Python stand-in for etcpu_env_top, no HDL simulator needed:
+    1. EtcpuEnvMock - the signal surface init_test and the monitors use (ports, the
+       i_etcpu_top probes, the regfile write port, both memories), driven by a
+       register-level model of etcpu_top.v: the five pipeline stages with the branch
+       predictor of fetch_branch_pred.v, the forwarding and load-use interlock of
+       decode_top.v, the flushes of execute_top.v and the exceptions and trap redirect
+    2. MockSim - a cycle-based scheduler for the trigger subset the environment awaits
+       (RisingEdge, ClockCycles, ReadOnly, Edge, First, Event, Timer, tasks)
+    3. run_test - runs a cocotb test function against the mock, the cocotb names are
+       swapped for the mock ones while it runs:
+        python -m models.etcpu_mock tests.test_rand test_rand [--seed N] [--param PF_DEPTH=2 ...]
+       the seed defaults to $RANDOM_SEED and a cocotb style results.xml is written to
+       $COCOTB_RESULTS_FILE, so it also serves as the etcpu_regress / etcpu_minimize simulator command
+the memories (read asynchronously) and the management registers are behavioural
+models of the library / generated blocks, only the trap handler address and the
+performance counters control are writable
+'''
+import argparse
+import importlib
+import logging
+import os
+import random
+import sys
+import xml.etree.ElementTree as ET
+from models.riscv_infra import decode_inst
+
+# utils_top.v
+OP_LUI, OP_AUIPC, OP_IMM, OP_RR = 0x37, 0x17, 0x13, 0x33
+OP_LOAD, OP_STORE, OP_JAL, OP_JALR, OP_BRANCH = 0x03, 0x23, 0x6f, 0x67, 0x63
+BUBBLE = 0x33
+MASK32 = 0xffffffff
+BYTE_MASKS = {0: 0xff, 4: 0xff, 1: 0xffff, 5: 0xffff} # funct3 -> partial load / store mask, word otherwise
+MNG_TRAP_HDLR_ADDR, MNG_EXC, MNG_EPC, MNG_PERF_CTRL, MNG_PERF = 0x0, 0x4, 0x8, 0xc, 0x10 # etcpu_mng_regs.json
+PERF_FREEZE, PERF_CLR = 0x1, 0x100 # perf_ctrl fields
+PERF_N = 6 # etcpu_top.v performance counters, see PERF_CNTRS in models.etcpu_iss
+MASK64 = (1 << 64) - 1
+
+def clog2(value: int)->int:
+    return (value - 1).bit_length()
+
+def alu(op: int, funct3: int, funct7_b30: int, a: int, b: int)->int:
+    '''
+    execute_alu.v, a and b are unsigned 32-bit
+    '''
+    if op in (OP_STORE, OP_LOAD, OP_JAL, OP_JALR, OP_LUI, OP_AUIPC):
+        return (a + b) & MASK32
+    sub = (a - b) & MASK32
+    slt = (a >> 31) if (a >> 31) != (b >> 31) else (sub >> 31)
+    if op == OP_BRANCH:
+        if funct3 in (6, 7):
+            return int(a < b)
+        if funct3 in (4, 5):
+            return slt
+        if funct3 in (0, 1):
+            return a ^ b
+        return 0
+    if op not in (OP_RR, OP_IMM):
+        return 0
+    shamt = b & 0x1f
+    if op == OP_IMM and funct3 not in (1, 5):
+        funct7_b30 = 0 # only the shifts decode funct7
+    key = (funct7_b30 << 3) | funct3
+    if key == 0:
+        return (a + b) & MASK32
+    if key == 8 and op == OP_RR:
+        return sub
+    if key == 7:
+        return a & b
+    if key == 6:
+        return a | b
+    if key == 4:
+        return a ^ b
+    if key == 2:
+        return slt
+    if key == 3:
+        return int(a < b)
+    if key == 1:
+        return (a << shamt) & MASK32
+    if key == 5:
+        return a >> shamt
+    if key == 13:
+        return ((a - (1 << 32) if a >> 31 else a) >> shamt) & MASK32
+    return 0
+
+def branch_taken(funct3: int, alu_out: int)->bool:
+    '''
+    execute_branch_flush.v, actual branch direction
+    '''
+    if funct3 in (7, 5):
+        return not (alu_out & 1)
+    if funct3 in (4, 6):
+        return bool(alu_out & 1)
+    if funct3 == 0:
+        return alu_out == 0
+    return alu_out != 0
+
+class MockValue(int):
+    '''
+    signal value, an int that is always resolvable
+    '''
+    is_resolvable = True
+
+    @property
+    def integer(self)->int:
+        return int(self)
+
+class MockSignal(object):
+    '''
+    signal handle, inputs written by the testbench wake the scheduler,
+    a register probe deposits the written value into the model through _on_write
+    '''
+    __slots__ = ('_name', '_width', '_value', '_is_input', '_sim', '_log', '_on_write')
+
+    def __init__(self, name: str, width: int=32, is_input: bool=False, value: int=0):
+        self._name = name
+        self._width = width
+        self._value = MockValue(value)
+        self._is_input = is_input
+        self._sim = None
+        self._log = logging.getLogger(f'mock.{name}')
+        self._on_write = None
+
+    @property
+    def value(self)->MockValue:
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = MockValue(int(value) & ((1 << self._width) - 1))
+        if self._on_write is not None:
+            self._on_write(int(self._value))
+        if (self._is_input or self._on_write is not None) and self._sim is not None:
+            self._sim.dirty = True
+
+    def _drive(self, value: int):
+        '''
+        model-side update, no scheduler wake-up
+        '''
+        if value != self._value:
+            self._value = MockValue(value)
+
+class MockWord(object):
+    '''
+    handle of a single memory word, for backdoor access
+    '''
+    __slots__ = ('_mem', '_idx')
+
+    def __init__(self, mem, idx: int):
+        self._mem = mem
+        self._idx = idx
+
+    @property
+    def value(self)->MockValue:
+        return MockValue(self._mem.words[self._idx])
+
+    @value.setter
+    def value(self, value):
+        self._mem.words[self._idx] = int(value) & MASK32
+        if self._mem.sim is not None:
+            self._mem.sim.dirty = True
+
+class MockMem(object):
+    '''
+    storage array of a memory, indexed by word
+    '''
+    is_mem_array = True # found by test_infra.find_mem_array
+
+    def __init__(self, depth: int):
+        self.words = [0] * depth
+        self.sim = None
+
+    def __len__(self):
+        return len(self.words)
+
+    def __getitem__(self, idx: int)->MockWord:
+        return MockWord(self, idx)
+
+    def __iter__(self):
+        return (MockWord(self, idx) for idx in range(len(self.words)))
+
+class MockScope(object):
+    '''
+    hierarchy level, iterating it yields its signals, memories and sub-scopes
+    '''
+    is_scope = True # searched by test_infra.find_mem_array
+
+    def __init__(self, name: str):
+        self._name = name
+        self._log = logging.getLogger(f'mock.{name}')
+
+    def _id(self, name: str, extended: bool=True):
+        return getattr(self, name)
+
+    def __iter__(self):
+        return (child for name, child in vars(self).items() if not name.startswith('_'))
+
+class EtcpuEnvMock(MockScope):
+    '''
+    etcpu_env_top with its INST_MEM_DEPTH / MAIN_MEM_DEPTH, branch predictor and instruction fetch parameters,
+    tick is the rising clock edge, settle recomputes the combinational signals
+    '''
+    INPUTS = (
+        ('clk', 1), ('rst_n_cpu', 1), ('rst_n_env', 1),
+        ('mng_apb4_s_paddr', 6), ('mng_apb4_s_pprot', 3), ('mng_apb4_s_psel', 1), ('mng_apb4_s_penable', 1),
+        ('mng_apb4_s_pwrite', 1), ('mng_apb4_s_pwdata', 32), ('mng_apb4_s_pstrb', 4), ('mng_apb4_s_pwakeup', 1),
+        ('inst_mem_wr_wen', 1), ('inst_mem_wr_addr', 32), ('inst_mem_wr_dat', 32),
+    )
+    OUTPUTS = (
+        ('mng_apb4_s_pready', 1), ('mng_apb4_s_prdata', 32), ('mng_apb4_s_pslverr', 1), ('etcpu_exc_evnt', 1),
+        ('main_mem_cs', 1), ('main_mem_wen', 1), ('main_mem_addr', 32), ('main_mem_dat_in', 32), ('main_mem_dat_out', 32),
+        ('inst_mem_rd_addr', 32), ('inst_mem_dat_out', 32),
+    )
+    TOP_PROBES = (
+        ('pc', 32), ('if2id_inst_next', 32), ('if2id_vld_next', 1), ('intrlock_bubble', 1), ('cfg_trap_hdlr_addr', 32),
+        ('exc_inst_addr_mis', 1), ('exc_inst_addr_oob', 1), ('exc_main_addr_mis', 1), ('exc_main_addr_oob', 1),
+        ('branch_flush', 1), ('branch_flush_pc', 32), ('if2id_pc', 32), ('if2id_inst', 32),
+        ('id2ex_inst', 32), ('ex2ma_inst', 32), ('ma2wb_inst', 32),
+    )
+
+    def __init__(self, inst_mem_depth: int=512, main_mem_depth: int=64, bp_dynamic: int=1, bht_idx_w: int=6, btb_idx_w: int=3,
+                 pf_depth: int=4, inst_mem_lat: int=0):
+        super().__init__('etcpu_env_top')
+        self.inst_byte_add_w = clog2(inst_mem_depth) + 2
+        self.main_byte_add_w = clog2(main_mem_depth) + 2
+        self.bp_dynamic, self.bht_mask, self.btb_mask = bp_dynamic, (1 << bht_idx_w) - 1, (1 << btb_idx_w) - 1
+        self.pf_depth, self.inst_mem_lat = pf_depth, inst_mem_lat
+        self.INST_MEM_DEPTH = MockSignal('INST_MEM_DEPTH', 32, value=inst_mem_depth)
+        self.MAIN_MEM_DEPTH = MockSignal('MAIN_MEM_DEPTH', 32, value=main_mem_depth)
+        self.BP_DYNAMIC = MockSignal('BP_DYNAMIC', 32, value=bp_dynamic)
+        self.BHT_IDX_W = MockSignal('BHT_IDX_W', 32, value=bht_idx_w)
+        self.BTB_IDX_W = MockSignal('BTB_IDX_W', 32, value=btb_idx_w)
+        self.PF_DEPTH = MockSignal('PF_DEPTH', 32, value=pf_depth)
+        self.INST_MEM_LAT = MockSignal('INST_MEM_LAT', 32, value=inst_mem_lat)
+        for name, width in self.INPUTS:
+            setattr(self, name, MockSignal(name, width, is_input=True))
+        for name, width in self.OUTPUTS:
+            setattr(self, name, MockSignal(name, width))
+        # hierarchy
+        self.i_etcpu_top = top = MockScope('i_etcpu_top')
+        for name, width in self.TOP_PROBES:
+            setattr(top, name, MockSignal(name, width))
+        top.pc._on_write = lambda value: setattr(self, 'pc', value) # backdoor deposit
+        top.i_decode_top = MockScope('i_decode_top')
+        top.i_decode_top.wb_inst, top.i_decode_top.wb_pc = MockSignal('wb_inst'), MockSignal('wb_pc')
+        top.i_decode_top.i_regfile = regfile = MockScope('i_regfile')
+        regfile.we, regfile.wa, regfile.wd = MockSignal('we', 1), MockSignal('wa', 5), MockSignal('wd')
+        regfile.reg_array = self.rgf = MockMem(32)
+        self.i_inst_mem = MockScope('i_inst_mem')
+        self.i_inst_mem.mem = self.inst_mem = MockMem(inst_mem_depth)
+        self.i_main_mem = MockScope('i_main_mem')
+        self.i_main_mem.mem = self.main_mem = MockMem(main_mem_depth)
+        self.cfg_trap_hdlr_addr, self.cfg_perf_ctrl, self.rst_n_cpu_prev = 0, 0, 0
+        self.reset_cpu()
+        self.settle()
+
+    def attach(self, sim):
+        for sig in self._signals():
+            sig._sim = sim
+        self.inst_mem.sim = self.main_mem.sim = self.rgf.sim = sim
+
+    def _signals(self):
+        scopes = [self]
+        while scopes:
+            scope = scopes.pop()
+            for child in scope:
+                if isinstance(child, MockSignal):
+                    yield child
+                elif isinstance(child, MockScope):
+                    scopes.append(child)
+
+    def reset_cpu(self):
+        '''
+        rst_n_cpu: pipeline registers, register file, exception status, performance counters, branch predictor,
+        prefetch buffer and the instruction memory reads in flight
+        '''
+        self.pc = 0
+        self.if2id_pc, self.if2id_inst, self.if2id_branch_taken, self.if2id_branch_nt_pc = 0, 0, 0, 0
+        self.if2id_vld = 0
+        self.id2ex_inst, self.id2ex_dat_a, self.id2ex_dat_b, self.id2ex_rd2, self.id2ex_pc = 0, 0, 0, 0, 0
+        self.id2ex_branch_taken, self.id2ex_branch_nt_pc = 0, 0
+        self.ex2ma_pc, self.ex2ma_inst, self.ex2ma_rd2, self.ex2ma_dat = 0, 0, 0, 0
+        self.ma2wb_pc, self.ma2wb_inst, self.ma2wb_dat = 0, 0, 0
+        self.rgf.words = [0] * 32
+        self.exc_status, self.epc = 0, 0
+        self.perf_cnt, self.perf_snap = [0] * PERF_N, [0] * PERF_N
+        self.bht = [1] * (self.bht_mask + 1) # weakly not-taken
+        self.btb = [(0, 0, 0)] * (self.btb_mask + 1) # (valid, pc, target)
+        self.pf_cnt, self.pf_fill, self.pf_drop, self.pf_nxt_addr, self.pf_req_addr, self.pf_redirect = 0, 0, 0, 0, 0, 0
+        self.pf_dat = [0] * self.pf_depth
+        self.im_lat = [(0, 0)] * self.inst_mem_lat # (valid, data) of the reads in flight, oldest last
+
+    def settle(self):
+        '''
+        combinational logic of all stages, written back to the signal handles
+        '''
+        n = self.__dict__
+        top, dec = self.i_etcpu_top, self.i_etcpu_top.i_decode_top
+        rgf = self.rgf.words
+
+        # Write-back
+        wb_inst = n['ma2wb_inst']
+        rgf_we = (wb_inst & 0x7f) not in (OP_STORE, OP_BRANCH)
+        rgf_wa, rgf_wd = (wb_inst >> 7) & 0x1f, n['ma2wb_dat']
+
+        # Memory access
+        ma_inst = n['ex2ma_inst']
+        ma_op, ma_f3 = ma_inst & 0x7f, (ma_inst >> 12) & 0x7
+        ma_mask = BYTE_MASKS.get(ma_f3, MASK32)
+        ma_addr = n['ex2ma_dat']
+        ma_mem = ma_op in (OP_STORE, OP_LOAD)
+        exc_main_mis = ma_mem and (ma_addr & 0x3) != 0
+        exc_main_oob = ma_mem and (ma_addr >> self.main_byte_add_w) != 0
+        main_dat_out = self.main_mem.words[(ma_addr & ((1 << self.main_byte_add_w) - 1)) >> 2]
+        if ma_op == OP_LOAD:
+            ma_wb_dat = main_dat_out & ma_mask
+        elif ma_op in (OP_JAL, OP_JALR):
+            ma_wb_dat = (n['ex2ma_pc'] + 4) & MASK32
+        else:
+            ma_wb_dat = ma_addr
+        ma_wb_inst = BUBBLE if exc_main_mis or exc_main_oob else ma_inst
+        ma_fwd_we = (ma_wb_inst & 0x7f) not in (OP_STORE, OP_BRANCH)
+        ma_fwd_dst = (ma_wb_inst >> 7) & 0x1f
+        self.main_mem_wr = ma_op == OP_STORE and not (exc_main_mis or exc_main_oob)
+        self.main_mem_wr_addr, self.main_mem_wr_dat = ma_addr, n['ex2ma_rd2'] & ma_mask
+        self.ma2wb_next = (n['ex2ma_pc'], ma_wb_inst, ma_wb_dat)
+
+        # Execute
+        ex_inst = n['id2ex_inst']
+        ex_op, ex_f3 = ex_inst & 0x7f, (ex_inst >> 12) & 0x7
+        ex_y = alu(ex_op, ex_f3, (ex_inst >> 30) & 1, n['id2ex_dat_a'], n['id2ex_dat_b'])
+        ex_branch, ex_jalr = ex_op == OP_BRANCH, ex_op == OP_JALR
+        ex_taken = branch_taken(ex_f3, ex_y)
+        if ex_jalr:
+            flush = not (n['id2ex_branch_taken'] and n['id2ex_branch_nt_pc'] == ex_y)
+        else:
+            flush = ex_branch and bool(n['id2ex_branch_taken']) != ex_taken
+        flush_pc = ex_y if ex_jalr else n['id2ex_branch_nt_pc']
+        # predictor update, jalr targets only if they can be fetched
+        if not self.bp_dynamic:
+            self.bp_update = None
+        elif ex_branch:
+            self.bp_update = (n['id2ex_pc'], False, ex_taken)
+        elif ex_jalr and (ex_y & 0x3) == 0 and (ex_y >> self.inst_byte_add_w) == 0:
+            self.bp_update = (n['id2ex_pc'], True, ex_y)
+        else:
+            self.bp_update = None
+        ex_fwd_we = ex_op not in (OP_STORE, OP_BRANCH)
+        ex_fwd_dst = (ex_inst >> 7) & 0x1f
+        ex_fwd_dat = (n['id2ex_pc'] + 4) & MASK32 if ex_op in (OP_JAL, OP_JALR) else ex_y
+        ex_load = ex_op == OP_LOAD
+        self.ex2ma_next = (n['id2ex_pc'], BUBBLE if flush and ex_branch else ex_inst, n['id2ex_rd2'], ex_y)
+
+        # Decode
+        id_inst = n['if2id_inst']
+        d = decode_inst(id_inst)
+        id_op = id_inst & 0x7f
+        if id_op in (OP_LUI, OP_AUIPC):
+            imm = d.u_imm
+        elif id_op == OP_STORE:
+            imm = d.s_imm
+        elif id_op == OP_JAL:
+            imm = d.j_imm
+        elif id_op == OP_BRANCH:
+            imm = d.b_imm
+        else:
+            imm = d.i_imm
+        imm &= MASK32
+        rd1_re = id_op in (OP_IMM, OP_RR, OP_LOAD, OP_STORE, OP_JALR, OP_BRANCH)
+        rd2_re = id_op in (OP_RR, OP_STORE, OP_BRANCH)
+        def fwd(rs, re):
+            if re and rs:
+                if ex_fwd_we and ex_fwd_dst == rs:
+                    return ex_fwd_dat
+                if ma_fwd_we and ma_fwd_dst == rs:
+                    return ma_wb_dat
+                if rgf_we and rgf_wa == rs:
+                    return rgf_wd
+            return rgf[rs]
+        fwd_rd1, fwd_rd2 = fwd(d.rs1, rd1_re), fwd(d.rs2, rd2_re)
+        intrlock = ex_load and ex_fwd_dst != 0 and ((rd1_re and ex_fwd_dst == d.rs1) or (rd2_re and ex_fwd_dst == d.rs2))
+        self.id2ex_next = (
+            BUBBLE if flush or intrlock else id_inst,
+            n['if2id_pc'] if id_op == OP_AUIPC else fwd_rd1,
+            fwd_rd2 if id_op in (OP_RR, OP_BRANCH) else imm,
+            fwd_rd2, n['if2id_pc'], n['if2id_branch_taken'], n['if2id_branch_nt_pc'],
+        )
+
+        # Prefetch buffer, a restart drops the stream and the reads of it still in flight
+        pc = n['pc']
+        im_mask = (1 << self.inst_byte_add_w) - 1
+        restart = n['pf_redirect'] or n['pf_nxt_addr'] != pc
+        if restart:
+            pf_cnt, pf_fill, pf_drop, im_rd_addr = 0, 0, n['pf_drop'] + n['pf_cnt'] - n['pf_fill'], pc
+        else:
+            pf_cnt, pf_fill, pf_drop, im_rd_addr = n['pf_cnt'], n['pf_fill'], n['pf_drop'], n['pf_req_addr']
+        im_req = pf_cnt < self.pf_depth and not self.inst_mem_wr_wen.value
+        if self.inst_mem_wr_wen.value:
+            im_addr = self.inst_mem_wr_addr.value
+        else:
+            im_addr = im_rd_addr & im_mask
+        im_dat = self.inst_mem.words[(im_addr & im_mask) >> 2]
+        im_rsp_vld, im_rsp_dat = (im_req, im_dat) if not self.inst_mem_lat else n['im_lat'][-1]
+        rsp_fill = im_rsp_vld and pf_drop == 0
+        if_vld = pf_fill != 0 or rsp_fill
+        if_dat = n['pf_dat'][0] if pf_fill else im_rsp_dat
+        pop = if_vld and not intrlock
+        pf_dat = n['pf_dat'][1:] + [0] if pop else list(n['pf_dat'])
+        if rsp_fill and 0 <= pf_fill - pop < self.pf_depth:
+            pf_dat[pf_fill - pop] = im_rsp_dat
+        self.pf_next = (
+            pf_cnt + int(im_req) - int(pop), pf_fill + int(rsp_fill) - int(pop), pf_drop - int(im_rsp_vld and pf_drop != 0),
+            (pc + 4) & im_mask if pop else pc, (im_rd_addr + 4) & im_mask if im_req else im_rd_addr, pf_dat,
+        )
+        self.im_lat_next = [(int(im_req), im_dat)] + n['im_lat'][:-1]
+
+        # Fetch
+        if_inst = BUBBLE if flush or not if_vld else if_dat
+        f = decode_inst(if_inst)
+        if_op = if_inst & 0x7f
+        btb_vld, btb_pc, btb_target = self.btb[(pc >> 2) & self.btb_mask]
+        if not self.bp_dynamic:
+            if_taken = if_op == OP_BRANCH and f.b_imm < 0
+            if_jalr_taken = False
+        else:
+            if_taken = if_op == OP_BRANCH and self.bht[(pc >> 2) & self.bht_mask] >= 2
+            if_jalr_taken = if_op == OP_JALR and btb_vld and btb_pc == pc
+        pc_pb = (pc + f.b_imm) & MASK32
+        if flush:
+            pc_next = flush_pc
+        elif intrlock:
+            pc_next = pc
+        elif not if_vld:
+            pc_next = pc
+        elif if_op == OP_JAL:
+            pc_next = (pc + f.j_imm) & MASK32
+        elif if_taken:
+            pc_next = pc_pb
+        elif if_jalr_taken:
+            pc_next = btb_target
+        else:
+            pc_next = (pc + 4) & MASK32
+        exc_inst_mis = (pc_next & 0x3) != 0
+        exc_inst_oob = (pc_next >> self.inst_byte_add_w) != 0
+        trap = exc_inst_mis or exc_inst_oob or exc_main_mis or exc_main_oob
+        self.pc_next = self.cfg_trap_hdlr_addr if trap else pc_next
+        if if_op == OP_JALR:
+            self.if2id_next = (pc, if_inst, int(if_jalr_taken), btb_target)
+        else:
+            self.if2id_next = (pc, if_inst, int(if_taken), (pc + 4) & MASK32 if if_taken else pc_pb)
+        self.intrlock, self.flush, self.trap, self.if_vld = intrlock, flush, trap, if_vld
+        exc_vec = int(exc_inst_mis) | (int(exc_inst_oob) << 8) | (int(exc_main_mis) << 16) | (int(exc_main_oob) << 24)
+        self.exc_next = exc_vec
+
+        # Performance counters, next values with this cycle's events
+        perf_evnt = (1, n['if2id_vld'] and not intrlock and not flush, intrlock, flush and ex_branch, flush and ex_jalr, trap)
+        if self.cfg_perf_ctrl & PERF_CLR:
+            self.perf_cnt_next = [0] * PERF_N
+        else:
+            self.perf_cnt_next = [(cnt + int(evnt)) & MASK64 for cnt, evnt in zip(n['perf_cnt'], perf_evnt)]
+
+        # Management registers APB read port, always ready
+        paddr = self.mng_apb4_s_paddr.value
+        if MNG_PERF <= paddr < MNG_PERF + 8 * PERF_N:
+            prdata = (self.perf_snap[(paddr - MNG_PERF) >> 3] >> (32 if paddr & 0x4 else 0)) & MASK32
+        else:
+            prdata = {MNG_TRAP_HDLR_ADDR: self.cfg_trap_hdlr_addr, MNG_EXC: self.exc_status, MNG_EPC: self.epc,
+                      MNG_PERF_CTRL: self.cfg_perf_ctrl}.get(paddr, 0)
+
+        # Outputs and probes
+        self.mng_apb4_s_pready._drive(1)
+        self.mng_apb4_s_prdata._drive(prdata)
+        self.etcpu_exc_evnt._drive(int(self.exc_status != 0))
+        self.main_mem_cs._drive(1)
+        self.main_mem_wen._drive(int(ma_op == OP_STORE and not (exc_main_mis or exc_main_oob)))
+        self.main_mem_addr._drive(ma_addr)
+        self.main_mem_dat_in._drive(self.main_mem_wr_dat)
+        self.main_mem_dat_out._drive(main_dat_out)
+        self.inst_mem_rd_addr._drive(im_rd_addr)
+        self.inst_mem_dat_out._drive(im_dat)
+        top.pc._drive(pc)
+        top.if2id_inst_next._drive(if_inst)
+        top.if2id_vld_next._drive(int(if_vld))
+        top.intrlock_bubble._drive(int(intrlock))
+        top.cfg_trap_hdlr_addr._drive(self.cfg_trap_hdlr_addr)
+        top.exc_inst_addr_mis._drive(int(exc_inst_mis))
+        top.exc_inst_addr_oob._drive(int(exc_inst_oob))
+        top.exc_main_addr_mis._drive(int(exc_main_mis))
+        top.exc_main_addr_oob._drive(int(exc_main_oob))
+        top.branch_flush._drive(int(flush))
+        top.branch_flush_pc._drive(flush_pc)
+        top.if2id_pc._drive(n['if2id_pc'])
+        top.if2id_inst._drive(id_inst)
+        top.id2ex_inst._drive(ex_inst)
+        top.ex2ma_inst._drive(ma_inst)
+        top.ma2wb_inst._drive(wb_inst)
+        dec.wb_inst._drive(wb_inst)
+        dec.wb_pc._drive(n['ma2wb_pc'])
+        dec.i_regfile.we._drive(int(rgf_we))
+        dec.i_regfile.wa._drive(rgf_wa)
+        dec.i_regfile.wd._drive(rgf_wd)
+        self.rgf_wr = (rgf_we and rgf_wa != 0, rgf_wa, rgf_wd)
+
+    def tick(self):
+        '''
+        rising clock edge, all registers sample the values of the last settle
+        '''
+        # Memories, reset by rst_n_env only
+        if not self.rst_n_env.value:
+            self.inst_mem.words = [0] * len(self.inst_mem.words)
+            self.main_mem.words = [0] * len(self.main_mem.words)
+        else:
+            if self.inst_mem_wr_wen.value:
+                self.inst_mem.words[(self.inst_mem_wr_addr.value & ((1 << self.inst_byte_add_w) - 1)) >> 2] = int(self.inst_mem_wr_dat.value)
+            if self.main_mem_wr:
+                self.main_mem.words[(self.main_mem_wr_addr & ((1 << self.main_byte_add_w) - 1)) >> 2] = self.main_mem_wr_dat
+
+        # Management registers, cleared as rst_n_cpu is asserted and writable while it is held
+        rst_n_cpu = int(self.rst_n_cpu.value)
+        if not rst_n_cpu and self.rst_n_cpu_prev:
+            self.cfg_trap_hdlr_addr, self.cfg_perf_ctrl = 0, 0
+        self.rst_n_cpu_prev = rst_n_cpu
+        perf_frozen = self.cfg_perf_ctrl & PERF_FREEZE
+        apb_wr = self.mng_apb4_s_psel.value and self.mng_apb4_s_penable.value and self.mng_apb4_s_pwrite.value
+        if apb_wr and self.mng_apb4_s_paddr.value in (MNG_TRAP_HDLR_ADDR, MNG_PERF_CTRL):
+            strb, wdata = self.mng_apb4_s_pstrb.value, self.mng_apb4_s_pwdata.value
+            byte_mask = sum(0xff << (8 * i) for i in range(4) if (strb >> i) & 1)
+            if self.mng_apb4_s_paddr.value == MNG_TRAP_HDLR_ADDR:
+                self.cfg_trap_hdlr_addr = (self.cfg_trap_hdlr_addr & ~byte_mask) | (wdata & byte_mask)
+            else:
+                self.cfg_perf_ctrl = (self.cfg_perf_ctrl & ~byte_mask) | (wdata & byte_mask & (PERF_FREEZE | PERF_CLR))
+
+        # CPU, synchronous reset
+        if not rst_n_cpu:
+            self.reset_cpu()
+            return
+        rgf_we, rgf_wa, rgf_wd = self.rgf_wr
+        if rgf_we:
+            self.rgf.words[rgf_wa] = rgf_wd
+        if self.exc_next:
+            self.epc = self.pc
+        self.exc_status = self.exc_next
+        self.perf_cnt = self.perf_cnt_next
+        if not perf_frozen:
+            self.perf_snap = self.perf_cnt_next
+        if self.bp_update is not None:
+            bp_pc, bp_jalr, bp_outcome = self.bp_update
+            if bp_jalr:
+                self.btb[(bp_pc >> 2) & self.btb_mask] = (1, bp_pc, bp_outcome)
+            else:
+                idx = (bp_pc >> 2) & self.bht_mask
+                self.bht[idx] = min(self.bht[idx] + 1, 3) if bp_outcome else max(self.bht[idx] - 1, 0)
+        self.pc = self.pc_next & ((1 << self.inst_byte_add_w) - 1)
+        self.pf_cnt, self.pf_fill, self.pf_drop, self.pf_nxt_addr, self.pf_req_addr, self.pf_dat = self.pf_next
+        self.pf_redirect = int(self.flush or self.trap)
+        self.im_lat = self.im_lat_next
+        if not self.intrlock:
+            self.if2id_vld = int(not self.flush and self.if_vld)
+            self.if2id_pc, self.if2id_inst, self.if2id_branch_taken, self.if2id_branch_nt_pc = self.if2id_next
+        (self.id2ex_inst, self.id2ex_dat_a, self.id2ex_dat_b, self.id2ex_rd2, self.id2ex_pc,
+         self.id2ex_branch_taken, self.id2ex_branch_nt_pc) = self.id2ex_next
+        self.ex2ma_pc, self.ex2ma_inst, self.ex2ma_rd2, self.ex2ma_dat = self.ex2ma_next
+        self.ma2wb_pc, self.ma2wb_inst, self.ma2wb_dat = self.ma2wb_next
+
+    def step(self):
+        '''
+        one clock cycle without a scheduler
+        '''
+        self.tick()
+        self.settle()
+
+##########################
+### cycle-based kernel ###
+##########################
+class MockTrigger(object):
+    '''
+    base trigger, awaiting it suspends the task until the scheduler fires it
+    '''
+    def __await__(self):
+        return (yield self)
+
+    def _prime(self, sim, task):
+        self._task = task
+
+    def _unprime(self, sim):
+        pass
+
+    def _result(self):
+        return self
+
+class RisingEdge(MockTrigger):
+    def __init__(self, signal):
+        self.signal = signal
+
+    def _prime(self, sim, task):
+        super()._prime(sim, task)
+        sim.watch(self, lambda prev, value: not prev and value)
+
+    def _unprime(self, sim):
+        sim.unwatch(self)
+
+class FallingEdge(RisingEdge):
+    def _prime(self, sim, task):
+        MockTrigger._prime(self, sim, task)
+        sim.watch(self, lambda prev, value: prev and not value)
+
+class Edge(RisingEdge):
+    def _prime(self, sim, task):
+        MockTrigger._prime(self, sim, task)
+        sim.watch(self, lambda prev, value: prev != value)
+
+class ClockCycles(MockTrigger):
+    def __init__(self, signal, num_cycles: int, rising: bool=True):
+        self.signal = signal
+        self.num_cycles = num_cycles
+
+    def _prime(self, sim, task):
+        super()._prime(sim, task)
+        sim.at_cycle(self, sim.cycle + self.num_cycles)
+
+    def _unprime(self, sim):
+        sim.cancel_at_cycle(self)
+
+class Timer(ClockCycles):
+    UNITS_NS = {'fs': 1e-6, 'ps': 1e-3, 'ns': 1, 'us': 1e3, 'ms': 1e6, 'sec': 1e9}
+
+    def __init__(self, time=1, units: str='step', round_mode=None):
+        self.time_ns = time * self.UNITS_NS.get(units, 1)
+        self.signal = None
+        self.num_cycles = None
+
+    def _prime(self, sim, task):
+        self.num_cycles = max(1, -(-int(self.time_ns) // sim.period_ns))
+        super()._prime(sim, task)
+
+class ReadOnly(MockTrigger):
+    def _prime(self, sim, task):
+        super()._prime(sim, task)
+        sim.read_only.append(self)
+
+    def _unprime(self, sim):
+        if self in sim.read_only:
+            sim.read_only.remove(self)
+
+ReadWrite = ReadOnly
+
+class NullTrigger(MockTrigger):
+    def __init__(self, name=None, outcome=None):
+        pass
+
+    def _prime(self, sim, task):
+        super()._prime(sim, task)
+        sim.fire(self)
+
+class _EventWait(MockTrigger):
+    def __init__(self, event):
+        self.event = event
+
+    def _prime(self, sim, task):
+        super()._prime(sim, task)
+        if self.event.is_set():
+            sim.fire(self)
+        else:
+            self.event._waiters.append(self)
+
+    def _unprime(self, sim):
+        if self in self.event._waiters:
+            self.event._waiters.remove(self)
+
+class Event(object):
+    def __init__(self, name=None):
+        self.name = name
+        self.data = None
+        self._set = False
+        self._waiters = []
+
+    def set(self, data=None):
+        self._set, self.data = True, data
+        waiters, self._waiters = self._waiters, []
+        for trigger in waiters:
+            MockSim.current.fire(trigger)
+
+    def clear(self):
+        self._set = False
+
+    def is_set(self)->bool:
+        return self._set
+
+    def wait(self)->_EventWait:
+        return _EventWait(self)
+
+class Lock(object):
+    def __init__(self, name=None):
+        self.locked = False
+        self._released = Event(name)
+
+    async def acquire(self):
+        while self.locked:
+            self._released.clear()
+            await self._released.wait()
+        self.locked = True
+
+    def release(self):
+        self.locked = False
+        self._released.set()
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *args):
+        self.release()
+
+class Join(MockTrigger):
+    def __init__(self, task):
+        self.task = task
+
+    def _prime(self, sim, task):
+        super()._prime(sim, task)
+        if self.task.done():
+            sim.fire(self)
+        else:
+            self.task._joins.append(self)
+
+    def _unprime(self, sim):
+        if self in self.task._joins:
+            self.task._joins.remove(self)
+
+    def _result(self):
+        return self.task._outcome
+
+class First(MockTrigger):
+    def __init__(self, *triggers):
+        self.triggers = [Join(trig) if isinstance(trig, MockTask) else trig for trig in triggers]
+        self.fired = None
+
+    def _prime(self, sim, task):
+        super()._prime(sim, task)
+        for trig in self.triggers:
+            trig._first = self
+            trig._prime(sim, self)
+            if self.fired is not None:
+                break
+
+    def _unprime(self, sim):
+        for trig in self.triggers:
+            trig._unprime(sim)
+
+    def _result(self):
+        return self.fired._result() if isinstance(self.fired, Join) else self.fired
+
+class Combine(First):
+    def _prime(self, sim, task):
+        self.pending = set(self.triggers)
+        super()._prime(sim, task)
+
+class MockTask(object):
+    '''
+    a coroutine run by the scheduler, awaiting it joins it
+    '''
+    def __init__(self, coro):
+        self._coro = coro
+        self._trigger = None
+        self._outcome = None
+        self._done = False
+        self._joins = []
+
+    def done(self)->bool:
+        return self._done
+
+    def result(self):
+        return self._outcome
+
+    def kill(self):
+        if self._done:
+            return
+        sim = MockSim.current
+        if self._trigger is not None:
+            self._trigger._unprime(sim)
+        self._coro.close()
+        sim.finish(self, None)
+
+    def __await__(self):
+        if not self._done:
+            yield Join(self)
+        return self._outcome
+
+class MockClock(object):
+    def __init__(self, signal, period, units: str='step'):
+        self.signal = signal
+        self.period_ns = int(period * Timer.UNITS_NS.get(units, 1))
+
+    async def start(self, start_high: bool=True, cycles=None):
+        MockSim.current.period_ns = self.period_ns
+        MockSim.current.clock = self.signal
+
+class MockSim(object):
+    '''
+    Cycle-based scheduler of the mock, one loop iteration per clock cycle:
+        1. Rising edge - model registers update, the tasks waiting on the clock run
+        2. Delta cycles - after every batch of tasks the model settles and the
+           Edge / RisingEdge waiters of the changed signals run, until nothing moves
+        3. ReadOnly phase, then the falling edge
+    an exception raised by any task fails the run
+    '''
+    current = None
+
+    def __init__(self, dut: EtcpuEnvMock, period_ns: int=1):
+        self.dut = dut
+        self.clock = dut.clk
+        self.period_ns = period_ns
+        self.cycle = 0
+        self.dirty = False
+        self.ready = []
+        self.read_only = []
+        self.watched = {} # trigger -> (signal, last value, condition)
+        self.timed = {} # trigger -> cycle
+        self.failure = None
+        dut.attach(self)
+        MockSim.current = self
+
+    @property
+    def time_ns(self)->int:
+        return self.cycle * self.period_ns
+
+    def get_sim_time(self, units: str='ns'):
+        return self.time_ns / Timer.UNITS_NS.get(units, 1)
+
+    # Task and trigger book-keeping
+    def start_soon(self, coro)->MockTask:
+        task = coro if isinstance(coro, MockTask) else MockTask(coro)
+        self.ready.append((task, None))
+        return task
+
+    async def start(self, coro)->MockTask:
+        task = self.start_soon(coro)
+        self.ready.remove((task, None))
+        self._resume(task, None)
+        return task
+
+    def watch(self, trigger, cond):
+        self.watched[trigger] = (trigger.signal, int(trigger.signal.value), cond)
+
+    def unwatch(self, trigger):
+        self.watched.pop(trigger, None)
+
+    def at_cycle(self, trigger, cycle: int):
+        self.timed[trigger] = cycle
+
+    def cancel_at_cycle(self, trigger):
+        self.timed.pop(trigger, None)
+
+    def fire(self, trigger):
+        '''
+        wakes the task (or First) waiting on a trigger
+        '''
+        first = getattr(trigger, '_first', None)
+        if first is not None:
+            if isinstance(first, Combine):
+                first.pending.discard(trigger)
+                if first.pending:
+                    return
+            if first.fired is not None:
+                return
+            first.fired = trigger
+            first._unprime(self)
+            self.fire(first)
+            return
+        task = trigger._task
+        if task._trigger is trigger:
+            task._trigger = None
+            self.ready.append((task, trigger))
+
+    def finish(self, task: MockTask, outcome):
+        task._done, task._outcome = True, outcome
+        joins, task._joins = task._joins, []
+        for join in joins:
+            self.fire(join)
+
+    def _resume(self, task: MockTask, trigger):
+        if task._done:
+            return
+        try:
+            nxt = task._coro.send(None if trigger is None else trigger._result())
+        except StopIteration as stop:
+            self.finish(task, stop.value)
+            return
+        except Exception as exc:
+            self.failure = self.failure or exc
+            self.finish(task, None)
+            return
+        if not isinstance(nxt, MockTrigger):
+            self.failure = self.failure or TypeError(f'unsupported trigger {nxt!r} awaited on the mock')
+            self.finish(task, None)
+            return
+        task._trigger = nxt
+        nxt._first = None
+        nxt._prime(self, task)
+
+    # Scheduling
+    def _run_ready(self):
+        while True:
+            while self.ready:
+                ready, self.ready = self.ready, []
+                for task, trigger in ready:
+                    self._resume(task, trigger)
+            self.dut.settle()
+            self.dirty = False
+            for trigger, (signal, prev, cond) in list(self.watched.items()):
+                value = int(signal.value)
+                if value != prev:
+                    if cond(prev, value):
+                        del self.watched[trigger]
+                        self.fire(trigger)
+                    else:
+                        self.watched[trigger] = (signal, value, cond)
+            if not self.ready:
+                return
+
+    def run_cycle(self):
+        self.cycle += 1
+        self.dut.tick()
+        self.dut.settle()
+        self.dut.clk._drive(1)
+        for trigger, cycle in list(self.timed.items()):
+            if cycle <= self.cycle:
+                del self.timed[trigger]
+                self.fire(trigger)
+        self._run_ready()
+        read_only, self.read_only = self.read_only, []
+        for trigger in read_only:
+            self.fire(trigger)
+        self._run_ready()
+        self.dut.clk._drive(0)
+        self._run_ready()
+
+    def run(self, task: MockTask, max_cycles: int)->bool:
+        '''
+        runs until the task is done, a task raised or max_cycles elapsed,
+        returns True if the task ended without a failure
+        '''
+        self._run_ready()
+        while not task.done() and self.failure is None and self.cycle < max_cycles:
+            self.run_cycle()
+        if self.failure is None and not task.done():
+            self.failure = TimeoutError(f'test did not end within {max_cycles} cycles')
+        return self.failure is None
+
+###################
+### test runner ###
+###################
+MOCK_TRIGGERS = ('RisingEdge', 'FallingEdge', 'Edge', 'ClockCycles', 'Timer', 'ReadOnly', 'ReadWrite',
+                 'NullTrigger', 'Event', 'Lock', 'Join', 'First', 'Combine')
+
+class MockScheduler(object):
+    def __init__(self, sim: MockSim):
+        self.add = sim.start_soon
+
+def patch_cocotb(sim: MockSim, seed: int):
+    '''
+    points the cocotb names used by the environment to the mock ones:
+        1. trigger classes and Clock, wherever they were imported into (by identity)
+        2. cocotb.start_soon / start / scheduler, get_sim_time, log and RANDOM_SEED
+    returns a function restoring everything
+    '''
+    import cocotb
+    import cocotb.clock
+    import cocotb.triggers
+    import cocotb.utils
+    mock = sys.modules[__name__]
+    swaps = [(getattr(cocotb.triggers, name), getattr(mock, name)) for name in MOCK_TRIGGERS if hasattr(cocotb.triggers, name)]
+    swaps.append((cocotb.clock.Clock, MockClock))
+    saved = []
+    def swap(obj, name, value):
+        saved.append((obj, name, getattr(obj, name, None)))
+        setattr(obj, name, value)
+
+    # 1. Trigger classes and Clock
+    for mod_name, module in list(sys.modules.items()):
+        if module is None or mod_name == 'cocotb' or mod_name.startswith('cocotb.') or module is mock:
+            continue
+        for name, value in list(vars(module).items()):
+            for orig, repl in swaps:
+                if value is orig:
+                    swap(module, name, repl)
+    for name in MOCK_TRIGGERS:
+        if hasattr(cocotb.triggers, name):
+            swap(cocotb.triggers, name, getattr(mock, name))
+    swap(cocotb.clock, 'Clock', MockClock)
+
+    # 2. Scheduler entry points, time, log and seed
+    swap(cocotb, 'start_soon', sim.start_soon)
+    swap(cocotb, 'start', sim.start)
+    swap(cocotb, 'scheduler', MockScheduler(sim))
+    swap(cocotb.utils, 'get_sim_time', sim.get_sim_time)
+    swap(cocotb, 'log', logging.getLogger('cocotb'))
+    swap(cocotb, 'RANDOM_SEED', seed)
+
+    def restore():
+        for obj, name, value in reversed(saved):
+            setattr(obj, name, value)
+    return restore
+
+def write_results(results_file: str, module_name: str, testcase: str, sim_time_ns: float, failure: BaseException):
+    '''
+    cocotb style JUnit results of a single test
+    '''
+    suite = ET.Element('testsuite', name='all')
+    case = ET.SubElement(suite, 'testcase', name=testcase, classname=module_name, sim_time_ns=str(sim_time_ns))
+    if failure is not None:
+        ET.SubElement(case, 'failure', message=repr(failure))
+    root = ET.Element('testsuites')
+    root.append(suite)
+    ET.ElementTree(root).write(results_file)
+
+ENV_PARAMS = ('BP_DYNAMIC', 'BHT_IDX_W', 'BTB_IDX_W', 'PF_DEPTH', 'INST_MEM_LAT') # settable by run_test, besides the memory depths
+
+def run_test(module_name: str, testcase: str, seed: int=None, max_cycles: int=1_000_000,
+             inst_mem_depth: int=512, main_mem_depth: int=64, results_file: str=None, params: dict=None)->bool:
+    '''
+    runs a cocotb test function of the tests package against a fresh EtcpuEnvMock,
+    params overrides its other parameters ({'PF_DEPTH': 2, ...}, see ENV_PARAMS),
+    returns True if it passed, its results are written to results_file if given
+    '''
+    seed = seed if seed is not None else random.getrandbits(32)
+    random.seed(seed)
+    module = importlib.import_module(module_name)
+    test = getattr(module, testcase)
+    func = getattr(test, '_func', None) or getattr(test, 'func', test) # unwrap @cocotb.test()
+    dut = EtcpuEnvMock(inst_mem_depth, main_mem_depth, **{name.lower(): value for name, value in (params or {}).items()})
+    sim = MockSim(dut)
+    restore = patch_cocotb(sim, seed)
+    log = logging.getLogger('cocotb')
+    try:
+        passed = sim.run(sim.start_soon(func(dut)), max_cycles)
+    finally:
+        restore()
+        MockSim.current = None
+    if passed:
+        log.info(f'{module_name}.{testcase} PASSED in {sim.cycle} cycles, seed {seed}')
+    else:
+        log.error(f'{module_name}.{testcase} FAILED after {sim.cycle} cycles, seed {seed}: {sim.failure!r}')
+    if results_file is not None:
+        write_results(results_file, module_name, testcase, sim.get_sim_time('ns'), sim.failure)
+    return passed
+
+def main():
+    parser = argparse.ArgumentParser(description='run a cocotb test on the Python mock of etcpu_env_top')
+    parser.add_argument('module', help='test module, e.g. tests.test_rand')
+    parser.add_argument('testcase', help='test function, e.g. test_rand')
+    parser.add_argument('--seed', type=int, default=None, help='random seed, $RANDOM_SEED or random by default')
+    parser.add_argument('--max-cycles', type=int, default=1_000_000, help='fail the test after this many cycles')
+    parser.add_argument('--inst-mem-depth', type=int, default=512)
+    parser.add_argument('--main-mem-depth', type=int, default=64)
+    parser.add_argument('--param', action='append', default=[], metavar='NAME=VALUE', help=f'etcpu_env_top parameter, one of {", ".join(ENV_PARAMS)}')
+    args = parser.parse_args()
+    params = {}
+    for param in args.param:
+        name, _, value = param.partition('=')
+        if name not in ENV_PARAMS or not value.isdigit():
+            print(f'Error: --param {param}, expected NAME=VALUE with NAME one of {", ".join(ENV_PARAMS)}')
+            exit(2)
+        params[name] = int(value)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    seed = args.seed if args.seed is not None else (int(os.environ['RANDOM_SEED']) if 'RANDOM_SEED' in os.environ else None)
+    passed = run_test(args.module, args.testcase, seed, args.max_cycles, args.inst_mem_depth, args.main_mem_depth,
+                      os.environ.get('COCOTB_RESULTS_FILE'), params)
+    exit(0 if passed else 1)
+
+if __name__ == '__main__':
+    # run as python -m, this module is __main__, the environment imports models.etcpu_mock,
+    # run from there so both see the same mock classes (the scheduler checks MockTrigger / MockTask, MockSim.current)
+    import models.etcpu_mock
+    models.etcpu_mock.main()
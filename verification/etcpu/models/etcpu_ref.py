@@ -1,67 +1,86 @@
 import cocotb.log
 from cocotb.clock import Clock
-from cocotb.triggers import RisingEdge, ClockCycles, ReadOnly
+from cocotb.triggers import RisingEdge, ClockCycles, ReadOnly, Edge, Event
 import cocotb.utils
 from cocotb_bus.bus import Bus
 from cocotb_bus.drivers import BusDriver
-from cocotb_bus.monitors import BusMonitor, Monitor
-from models.riscv_infra import inst_str2int, inst_int2str, inst_int2rgfexp, inst_int2mmexp, inst_int2pcexp, get_rand_inst
+from cocotb.log import SimLog
+from models.riscv_infra import inst_str2int, inst_int2str, inst_int2rgfexp, inst_int2mmexp, inst_int2pcexp, get_rand_inst, decode_inst, BPConfig, BranchPredictor, BP_UPDATE_CYCLES
+from models.etcpu_iss import ISS, NOP, MAIN_EXC_SLOTS
+from models.riscv_asm import assemble
+from models.etcpu_trace import TraceSink
+from models.etcpu_cov import Coverage
+from models.etcpu_trans import RGFTrans, MMTrans, IMTrans
+from bisect import bisect_left
+from collections import deque
+from typing import List, NamedTuple
 import logging
 
-class RGFTrans(object):
-    '''
-    register file write transaction
-        1. Data
-        2. Register name
-    '''
-    def __init__(self, data: int, reg_addr: int):
-        self.data = data
-        self.reg_addr = reg_addr
-    
-    def get_log_message(self)->str:
-        reg_num = ('x' + str(self.reg_addr)).ljust(3)
-        reg_val = (hex(self.data)).ljust(8)
-        return f' : {reg_num} <= {reg_val}'
-    
-    def __eq__(self, other):
-        return (self.data == other.data) and (self.reg_addr == other.reg_addr)
+GOLDEN_CHUNK_CYCLES = 256
+CLK_PERIOD_NS = 1
+SB_HIGH_WATER = 1024 # default bound on pending expected transactions per scoreboard
+SB_JOURNAL_DEPTH = 4096 # applied writes that can be undone by get_state_before
+EXC_NAMES = ('INST_MIS', 'INST_OOB', 'MAIN_MIS', 'MAIN_OOB') # exception vector bits, LSB first
+EXC_INST_MASK, EXC_MAIN_MASK = 0x3, 0xc
+
+def get_exc_names(exc: int)->str:
+    return '|'.join(name for i, name in enumerate(EXC_NAMES) if (exc >> i) & 1) or 'none'
 
-class MMTrans(object):
+class GoldenTrace(object):
     '''
-    Instruction memory transaction
-        1. Data
-        2. Address
+    Golden register file and main memory write sequences:
+        1. Precomputed by an ISS run of the loaded program once the CPU leaves reset
+        2. Extended in chunks only if the DUT runs past the precomputed horizon
+        3. Scoreboards in golden mode index into the sequences instead of
+           getting expected transactions from the PCMonitor cycle by cycle
+        4. The GoldenChecker compares the DUT PC and exceptions against the
+           retired-instruction and exception streams of the same run
     '''
-    def __init__(self, data: int, address: int):
-        self.data = data
-        self.address = address 
-    
-    def get_log_message(self)->str:
-        log_data = hex(self.data)
-        log_addr = hex(self.address)
-        return f' : MAIN_MEM[{log_addr}] <= {log_data}'
+    def __init__(self, iss: ISS, start_time_ns: float, clk_period_ns: float, horizon_cycles: int):
+        self.iss = iss
+        self.start_time_ns = start_time_ns
+        self.clk_period_ns = clk_period_ns
+        self.iss.run(max_cycles=horizon_cycles)
     
-    def __eq__(self, other):
-        return self.data==other.data and self.address==other.address
-
-class IMTrans(object):
-    '''
-    Instruction memory transaction
-        1. Data
-        2. Address
-    '''
-    def __init__(self, inst: str | int, address: int):
-        if isinstance(inst, str):
-            self.inst_str = inst
-            self.inst_int = inst_str2int(self.inst_str)
-        elif isinstance(inst, int):
-            self.inst_int = inst
-            self.inst_str = inst_int2str(self.inst_int)
-        self.address = address 
+    def get_cycle(self)->int:
+        '''
+        current DUT cycle counted from the CPU reset release
+        '''
+        return int(round((cocotb.utils.get_sim_time('ns') - self.start_time_ns) / self.clk_period_ns))
     
-    def get_log_message(self)->str:
-        log_inst = f"{self.inst_str}".ljust(20)
-        return f' : {log_inst}                                     @ {hex(self.address)}'
+    def _get_arrays(self, kind: str)->tuple:
+        if kind == 'rgf':
+            return self.iss.rgf_slot, self.iss.rgf_wa, self.iss.rgf_wd
+        return self.iss.mm_slot, self.iss.mm_addr, self.iss.mm_data
+
+    def get_trans(self, kind: str, idx: int):
+        '''
+        returns the idx-th expected transaction of kind 'rgf' or 'mm',
+        None if the program does not produce it by the current DUT cycle
+        '''
+        slots, addrs, datas = self._get_arrays(kind)
+        cycle = self.get_cycle()
+        while idx >= len(slots) and self.iss.cycle <= cycle:
+            self.iss.run(max_cycles=self.iss.cycle + GOLDEN_CHUNK_CYCLES)
+        if idx >= len(slots):
+            return None
+        return RGFTrans(datas[idx], addrs[idx]) if kind == 'rgf' else MMTrans(datas[idx], addrs[idx])
+
+    def run_past(self, cycle: int):
+        '''
+        extends the trace until every instruction fetched by the given cycle executed
+        '''
+        while self.iss.cycle <= cycle:
+            self.iss.run(max_cycles=self.iss.cycle + GOLDEN_CHUNK_CYCLES)
+
+    def get_expected_num(self, kind: str, cycle: int)->int:
+        '''
+        number of expected transactions from instructions fetched before the given cycle
+        '''
+        slots = self._get_arrays(kind)[0]
+        while self.iss.cycle < cycle:
+            self.iss.run(max_cycles=cycle)
+        return bisect_left(slots, cycle)
 
 class Scoreboard:
     '''
@@ -69,40 +88,197 @@ class Scoreboard:
         1. add_expected - adds an expected transaction
         2. add_actual - adds an actual transaction
         3. compare - compares two transactions
+        4. set_golden - compare against a precomputed GoldenTrace instead of added expected transactions
+        5. apply_write - updates the expected state in place, optionally journaling
+           the overwritten values so earlier states can be rebuilt by get_state_before
+    pending transactions are kept in a deque, bounded by high_water (None for no bound),
+    every expected transaction is added right before its apply_write
     '''
-    def __init__(self, depth: int, name: str):
-        self.expected_trns = []
-        self.actual_trns = []
+    def __init__(self, depth: int, name: str, journal: bool=False, high_water: int=SB_HIGH_WATER):
+        self.expected_trns = deque() # (time added, index of its applied write, transaction)
+        self.expected_num = 0
+        self.actual_trns = deque()
+        self.high_water = high_water
+        # statistics
+        self.max_depth = 0
+        self.matched_num = 0
+        self.total_latency_ns = 0
         self.expected_state = [0] * depth
+        self.journal = deque(maxlen=SB_JOURNAL_DEPTH) if journal else None # (addr, overwritten data) per applied write
+        self.applied_num = 0
+        self.matched_write_idx = None # applied write of the last matched expected transaction
         self.name = name
         self.lock_expected = False
+        self.golden = None
+        self.golden_kind = None
+        self.golden_idx = 0
+        self.lock_cycle = None
+        self.drained = Event() # set once locked with no pending expected transactions
+        self.failed = False # an actual transaction mismatched or had no expected one
+
+    def reset(self, keep_state: bool=False):
+        '''
+        back to an empty, unlocked scoreboard for the next program,
+        keep_state keeps the expected state (e.g. a memory the CPU reset does not clear)
+        '''
+        self.expected_trns.clear()
+        self.actual_trns.clear()
+        self.expected_num = 0
+        self.max_depth = 0
+        self.matched_num = 0
+        self.total_latency_ns = 0
+        if not keep_state:
+            self.expected_state = [0] * len(self.expected_state)
+        if self.journal is not None:
+            self.journal.clear()
+        self.applied_num = 0
+        self.matched_write_idx = None
+        self.lock_expected = False
+        self.golden = None
+        self.golden_kind = None
+        self.golden_idx = 0
+        self.lock_cycle = None
+        self.drained.clear()
+        self.failed = False
+
+    def set_golden(self, golden: GoldenTrace, kind: str):
+        self.golden = golden
+        self.golden_kind = kind
+        self.golden_idx = 0
+
+    def lock(self):
+        '''
+        stop expecting transactions from instructions fetched from now on,
+        once drained their actual transactions are not checked
+        '''
+        self.lock_expected = True
+        if self.golden is not None:
+            self.lock_cycle = self.golden.get_cycle()
+        self._check_drained()
+
+    def get_pending_num(self)->int:
+        '''
+        expected transactions not matched yet, in golden mode only the ones due before the lock
+        '''
+        if self.golden is not None:
+            cycle = self.golden.get_cycle() if self.lock_cycle is None else self.lock_cycle
+            return self.golden.get_expected_num(self.golden_kind, cycle) - self.golden_idx
+        return self.expected_num
+
+    def _check_drained(self):
+        if self.lock_expected and self.get_pending_num() <= 0:
+            self.drained.set()
 
     def add_expected(self, trans):
-        if not self.lock_expected:
-            self.expected_trns.append(trans)
+        if self.lock_expected:
+            return
+        self.expected_trns.append((cocotb.utils.get_sim_time('ns'), self.applied_num, trans))
+        self.expected_num += 1
+        self.max_depth = max(self.max_depth, self.expected_num)
+        if self.high_water is not None and self.expected_num > self.high_water:
+            cocotb.log.error(f'{self.name.ljust(16)} {self.expected_num} pending expected transactions, above the high-water mark ({self.high_water})')
+            assert False
     
     def add_actual(self, trans):
         self.actual_trns.append(trans)
+
+    def get_stats(self)->dict:
+        '''
+        max_depth - most pending expected transactions at once
+        avg_latency - average cycles from expected to matching actual transaction, None in golden mode
+        '''
+        if self.golden is not None:
+            avg_latency = None
+        else:
+            avg_latency = self.total_latency_ns / CLK_PERIOD_NS / self.matched_num if self.matched_num else 0
+        return {'matched': self.matched_num, 'max_depth': self.max_depth, 'avg_latency': avg_latency}
+
+    def log_stats(self):
+        stats = self.get_stats()
+        latency = 'n/a' if stats['avg_latency'] is None else f"{stats['avg_latency']:.2f} cycles"
+        cocotb.log.info(f"{self.name.ljust(16)} matched {stats['matched']} transactions, max depth {stats['max_depth']}, average latency {latency}")
     
+    def apply_write(self, addr: int, data: int):
+        if self.journal is not None:
+            self.journal.append((addr, self.expected_state[addr]))
+        self.expected_state[addr] = data
+        self.applied_num += 1
+
+    def get_state_before(self, write_idx: int)->list:
+        '''
+        expected state right before the write_idx-th applied write,
+        None without a journal or if the write is older than the journal
+        '''
+        undo_num = self.applied_num - write_idx
+        if self.journal is None or undo_num <= 0 or undo_num > len(self.journal):
+            return None
+        state = self.expected_state.copy()
+        for i in range(1, undo_num + 1):
+            addr, data = self.journal[-i]
+            state[addr] = data
+        return state
+
+    def _pop_expected(self):
+        if self.golden is not None:
+            # precomputed, there is no expected time to take a latency from
+            expected_trns = self.golden.get_trans(self.golden_kind, self.golden_idx)
+            self.golden_idx += 1
+            if expected_trns is not None:
+                self.matched_num += 1
+            return expected_trns
+        if not self.expected_trns:
+            self.matched_write_idx = None
+            return None
+        time_ns, self.matched_write_idx, expected_trns = self.expected_trns.popleft()
+        self.expected_num -= 1
+        self.matched_num += 1
+        self.total_latency_ns += cocotb.utils.get_sim_time('ns') - time_ns
+        return expected_trns
+
     def compare(self)->bool:
-        actual_trns = self.actual_trns.pop(0)
-        if len(self.expected_trns)<1:
+        actual_trns = self.actual_trns.popleft()
+        if self.lock_expected and self.get_pending_num() <= 0:
+            # written by an instruction fetched after the lock, never predicted
+            if cocotb.log.isEnabledFor(logging.INFO):
+                cocotb.log.info(f'{self.name.ljust(16)} {actual_trns.get_log_message()} written after the lock, not checked')
+            return True
+        expected_trns = self._pop_expected()
+        self._check_drained()
+        if expected_trns is None:
             cocotb.log.error(f'{self.name.ljust(16)} found actual transaction {actual_trns.get_log_message()} with no matching expected transaction')
+            self.failed = True
             return False
-        expected_trns = self.expected_trns.pop(0)
         if (expected_trns == actual_trns):
-            cocotb.log.info(f"{self.name.ljust(16)} {expected_trns.get_log_message()} matches expected value")
+            if cocotb.log.isEnabledFor(logging.INFO):
+                cocotb.log.info(f"{self.name.ljust(16)} {expected_trns.get_log_message()} matches expected value")
             return True
         else:
             cocotb.log.error(f"{self.name.ljust(16)} MISMATCH!!\nexpected {expected_trns.get_log_message()} but got {actual_trns.get_log_message()}")
+            self.failed = True
             return False
     
-    def is_empty(self):
-        if len(self.expected_trns)!=0:
-            cocotb.log.error(f'{self.name.ljust(16)} SCOREBOARD NOT EMPTY, {len(self.expected_trns)} remaining expected transactions:')
-            for i, trns in enumerate(self.expected_trns):
+    def is_empty(self, fatal: bool=True)->bool:
+        '''
+        logs the remaining expected transactions, if any,
+        and fails the test unless fatal=False, then returns whether the scoreboard is empty
+        '''
+        if self.golden is not None:
+            remaining = self.get_pending_num()
+            if remaining>0:
+                cocotb.log.error(f'{self.name.ljust(16)} SCOREBOARD NOT EMPTY, {remaining} remaining expected transactions:')
+                for i in range(remaining):
+                    trns = self.golden.get_trans(self.golden_kind, self.golden_idx + i)
+                    cocotb.log.info(f' --> TRNS #{i} {trns.get_log_message()}')
+                assert not fatal
+                return False
+            return True
+        if self.expected_num!=0:
+            cocotb.log.error(f'{self.name.ljust(16)} SCOREBOARD NOT EMPTY, {self.expected_num} remaining expected transactions:')
+            for i, (_, _, trns) in enumerate(self.expected_trns):
                 cocotb.log.info(f' --> TRNS #{i} {trns.get_log_message()}')
-            assert False
+            assert not fatal
+            return False
+        return True
 
 class MMScoreboard(Scoreboard):
     '''
@@ -110,8 +286,8 @@ class MMScoreboard(Scoreboard):
         1. Holds the expected state of the main memory
         2. Enables comparing expected and actual writes to main memory
     '''
-    def __init__(self, depth):
-        super().__init__(depth, 'MMSB')
+    def __init__(self, depth, journal=False, high_water=SB_HIGH_WATER):
+        super().__init__(depth, 'MMSB', journal, high_water)
     def add_actual(self, trans: MMTrans):
         super().add_actual(trans)
     def add_expected(self, trans: MMTrans):
@@ -125,8 +301,8 @@ class RGFScoreboard(Scoreboard):
         1. Holds the expected state of the register file
         2. Enables comparing expected and actual writes to register file
     '''
-    def __init__(self):
-        super().__init__(32, 'RGFSB')
+    def __init__(self, journal=False, high_water=SB_HIGH_WATER):
+        super().__init__(32, 'RGFSB', journal, high_water)
     def add_actual(self, trans: RGFTrans):
         super().add_actual(trans)
     def add_expected(self, trans: RGFTrans):
@@ -139,7 +315,9 @@ class IMDriver(BusDriver):
     Instruction write driver
         * gets an instruction
         * keeps internal running address
-        * drives the instruction memory write interface
+        * drives the instruction memory write interface, one word per clock
+        * or, with a backdoor attached, deposits words straight into the
+          instruction memory array in zero simulation time
     '''
     _signals = ['wen', 'addr', 'dat']
 
@@ -153,21 +331,59 @@ class IMDriver(BusDriver):
         self.main_mem_depth = main_mem_depth 
         self.opcode_probs = opcode_probs
         self.avoid_exceptions = avoid_exceptions
+        self.image = [NOP] * inst_mem_depth # what was written to the instruction memory so far
+        self.reg_hist = [] # destinations of the last random instructions, latest first
+        self.backdoor = None # handle of the instruction memory storage array
+        self.monitor = None # IMMonitor logging backdoor writes
+
+    def attach_backdoor(self, mem_array, monitor=None):
+        '''
+        write through the given storage array handle instead of the inst_mem_wr bus,
+        backdoor writes are reported to the monitor for logging
+        '''
+        self.backdoor = mem_array
+        self.monitor = monitor
+
+    def _backdoor_write(self, trans: IMTrans):
+        self.backdoor[trans.address >> 2].value = trans.inst_int
+        if self.monitor is not None:
+            self.monitor.log_trans(trans)
+
+    async def load_image(self, image: List[int], base_addr: int = 0):
+        '''
+        loads a whole program image (list or uint32 array) starting at base_addr,
+        in a single step if a backdoor is attached
+        '''
+        self.running_addr = base_addr
+        for inst_int in image:
+            await self._driver_send(int(inst_int))
+
+    async def load_asm(self, src: str, base_addr: int = 0):
+        '''
+        assembles a multi-line program (see models.riscv_asm) and loads it at base_addr
+        '''
+        await self.load_image(assemble(src, base_addr), base_addr)
 
-    async def _driver_send(self, cmd: str, sync = True):
+    async def _driver_send(self, cmd: str | int, sync = True):
         '''
-        gets an RV32I command as a string
+        gets an RV32I command as a string (or an encoded instruction)
         drives the command write bus to the instruction memory        
         '''
         # Build the transaction
         trans = IMTrans(cmd, self.running_addr)
-        
+        self.image[trans.address >> 2] = trans.inst_int
+        # Update running address
+        self.running_addr = 0 if ((self.running_addr + 4) >> 2) == self.inst_mem_depth else self.running_addr + 4 
+
+        # Backdoor, no bus cycle needed
+        if self.backdoor is not None:
+            self._backdoor_write(trans)
+            return
+
         # Drive IM with the transaction
         self.bus.wen.value = 1 
         self.bus.addr.value = trans.address
         self.bus.dat.value = trans.inst_int
-        # Update running address
-        self.running_addr = 0 if ((self.running_addr + 4) >> 2) == self.inst_mem_depth else self.running_addr + 4 
 
         # Wait for the next clock and disable WEN
         await RisingEdge(self.clock)
@@ -177,8 +393,10 @@ class IMDriver(BusDriver):
         '''
         drive a random valid RV32I instruction
         '''
-        _, rand_inst_str = get_rand_inst(self.opcode_probs, self.avoid_exceptions, self.running_addr, self.inst_mem_depth, self.main_mem_depth)
-        await self._driver_send(rand_inst_str)
+        rand_inst = get_rand_inst(self.opcode_probs, self.avoid_exceptions, self.running_addr, self.inst_mem_depth, self.main_mem_depth, self.reg_hist)
+        inst = decode_inst(rand_inst)
+        self.reg_hist = [0 if inst.opcode in (8, 24) else inst.rd] + self.reg_hist[:2] # stores and branches write no register
+        await self._driver_send(rand_inst)
 
     async def _load_nops(self, num_of_nops: int):
         '''
@@ -186,11 +404,10 @@ class IMDriver(BusDriver):
             entire instruction memory with nops
         '''
         if num_of_nops == -1:
-            for _ in range(self.inst_mem_depth):
-                await self._driver_send('nop')
+            await self.load_image([NOP] * self.inst_mem_depth, self.running_addr)
         else:
             for _ in range(num_of_nops):
-                await self._driver_send('nop')
+                await self._driver_send(NOP)
 
 class PCScoreboard(Scoreboard):
     '''
@@ -200,6 +417,8 @@ class PCScoreboard(Scoreboard):
     '''
     def __init__(self):
         self.expected_pc = 0 
+    def reset(self):
+        self.expected_pc = 0
     def compare(self, actual_pc)->bool:
         name = 'PCSB'.ljust(16)
         if (self.expected_pc != actual_pc):
@@ -207,227 +426,567 @@ class PCScoreboard(Scoreboard):
             return False
         return True
 
-class EXCScoreboard(Scoreboard):
-    def __init__(self, name):
-        depth = 5
-        name = name.ljust(16)
-        super().__init__(depth, name)
-    def compare(self):
-        actual_trns = self.actual_trns.pop(0)
-        if len(self.expected_trns)<1:
-            cocotb.log.error(f'{self.name.ljust(16)} EXCEPTION FOUND and not expected')
-            return False
-        expected_trns = self.expected_trns.pop(0)
-        if (expected_trns == actual_trns and actual_trns):
-            cocotb.log.info(f"{self.name.ljust(16)} EXCEPTION FOUND as predicted")
-            return True
-        elif (expected_trns!=actual_trns):
-            cocotb.log.error(f"{self.name.ljust(16)} EXCEPTION MISMATCH!! predicted {expected_trns} but got {actual_trns}")
-            return False
-        return True
+class SignalSnapshot(NamedTuple):
+    '''
+    All monitored DUT signals of a single cycle, read in its ReadOnly phase,
+    data fields are only read (otherwise 0) when their enable is set
+    '''
+    cycle: int
+    rst_n_cpu: int
+    # instruction fetch
+    pc: int
+    inst: int
+    inst_vld: int
+    intrlock: int
+    trap_base: int
+    # exceptions vector, see EXC_NAMES
+    exc: int
+    # register file write
+    rgf_we: int
+    rgf_wa: int
+    rgf_wd: int
+    wb_inst: int
+    wb_pc: int
+    # main memory write
+    mm_wr: int
+    mm_addr: int
+    mm_dat_in: int
+    # instruction memory write
+    im_wen: int
+    im_addr: int
+    im_dat: int
+
+class SignalSampler(object):
+    '''
+    Single per-cycle sampler for all checkers:
+        1. Resolves the monitored DUT handles once
+        2. Reads them in one ReadOnly phase per cycle into a SignalSnapshot
+        3. Hands the snapshot to every registered checker (sample method), in registration order
+        4. Fails the test 5 cycles after a checker reports a failure
+    '''
+    def __init__(self, dut, clock):
+        top = dut.i_etcpu_top
+        self.clock = clock
+        self.rst_n_cpu = dut.rst_n_cpu
+        self.pc, self.inst, self.intrlock, self.trap_base = top.pc, top.if2id_inst_next, top.intrlock_bubble, top.cfg_trap_hdlr_addr
+        self.inst_vld = top.if2id_vld_next
+        self.exc = (top.exc_inst_addr_mis, top.exc_inst_addr_oob, top.exc_main_addr_mis, top.exc_main_addr_oob)
+        regfile = top.i_decode_top.i_regfile
+        self.rgf_we, self.rgf_wa, self.rgf_wd = regfile.we, regfile.wa, regfile.wd
+        self.wb_inst, self.wb_pc = top.i_decode_top.wb_inst, top.i_decode_top.wb_pc
+        self.mm_cs, self.mm_wen, self.mm_addr, self.mm_dat_in = dut.main_mem_cs, dut.main_mem_wen, dut.main_mem_addr, dut.main_mem_dat_in
+        self.im_wen, self.im_addr, self.im_dat = dut.inst_mem_wr_wen, dut.inst_mem_wr_addr, dut.inst_mem_wr_dat
+        self.checkers = []
+        self.cycle = 0
+        self.fail_cycle = None
+        self.fatal = True # False leaves failures to the checkers' failed flags (program batches)
+        self.snapshot = None
+        self._thread = cocotb.start_soon(self._run())
+
+    def add_checker(self, checker):
+        checker.sampler = self
+        self.checkers.append(checker)
+
+    def fail(self):
+        if self.fail_cycle is None:
+            self.fail_cycle = self.cycle + 5
+
+    def reset(self):
+        '''
+        clears a pending failure and resets every checker, for the next program
+        '''
+        self.fail_cycle = None
+        for checker in self.checkers:
+            checker.reset()
+
+    def _read(self)->SignalSnapshot:
+        rst_n = self.rst_n_cpu.value
+        rst_n_cpu = int(rst_n) if rst_n.is_resolvable else 0
+        if rst_n_cpu:
+            pc, inst, intrlock, trap_base = int(self.pc.value), int(self.inst.value), int(self.intrlock.value), int(self.trap_base.value)
+            inst_vld = int(self.inst_vld.value)
+            exc = 0
+            for i, h in enumerate(self.exc):
+                exc |= int(h.value) << i
+        else:
+            pc, inst, inst_vld, intrlock, trap_base, exc = 0, 0, 0, 0, 0, 0
+        rgf_we = int(self.rgf_we.value == 1 and self.rgf_wa.value != 0)
+        if rgf_we:
+            rgf_wa, rgf_wd, wb_inst, wb_pc = int(self.rgf_wa.value), int(self.rgf_wd.value), int(self.wb_inst.value), int(self.wb_pc.value)
+        else:
+            rgf_wa, rgf_wd, wb_inst, wb_pc = 0, 0, 0, 0
+        mm_wr = int(self.mm_wen.value == 1 and self.mm_cs.value == 1)
+        mm_addr, mm_dat_in = (int(self.mm_addr.value), int(self.mm_dat_in.value)) if mm_wr else (0, 0)
+        im_wen = int(self.im_wen.value == 1)
+        im_addr, im_dat = (int(self.im_addr.value), int(self.im_dat.value)) if im_wen else (0, 0)
+        return SignalSnapshot(
+            self.cycle, rst_n_cpu, pc, inst, inst_vld, intrlock, trap_base, exc,
+            rgf_we, rgf_wa, rgf_wd, wb_inst, wb_pc, mm_wr, mm_addr, mm_dat_in, im_wen, im_addr, im_dat
+        )
 
-class RGFMonitor(Monitor):
+    async def _run(self):
+        while True:
+            await ReadOnly()
+            self.snapshot = snap = self._read()
+            for checker in self.checkers:
+                checker.sample(snap)
+            if self.fatal and self.fail_cycle is not None and self.cycle >= self.fail_cycle:
+                assert False
+            self.cycle += 1
+            await RisingEdge(self.clock)
+
+class SampledChecker(object):
+    '''
+    Base of the monitors fed by a SignalSampler:
+        1. sample - called once per cycle with the cycle's SignalSnapshot
+        2. _recv - hands a found transaction to the registered callbacks
+        3. fail - reports a mismatch, the sampler fails the test 5 cycles later
+        4. reset - back to a clean state for the next program of a batch
+    '''
+    def __init__(self, log_level, callback=None):
+        self.log = SimLog(f'cocotb.monitor.{type(self).__qualname__}', id(self))
+        self.log.setLevel(log_level)
+        self._callbacks = [] if callback is None else [callback]
+        self.sampler = None
+        self.failed = False
+
+    def add_callback(self, callback):
+        self._callbacks.append(callback)
+
+    def _recv(self, trans):
+        for callback in self._callbacks:
+            callback(trans)
+
+    def fail(self):
+        self.failed = True
+        self.sampler.fail()
+
+    def reset(self):
+        self.failed = False
+
+    def sample(self, snap: SignalSnapshot):
+        raise NotImplementedError
+
+class RGFMonitor(SampledChecker):
     '''
     Register file writes monitor:
         1. Listens to RGF write-enalbe, write address and write data signals
         2. Logs valid write transactions to the CPU's register file
     '''
-    def __init__(self, scoreboard: RGFScoreboard, rgf_wen, rgf_wa, rgf_wd, wb_inst, wb_pc, clock, log_level, callback=None, event=None):
-        super().__init__(callback, event)
+    def __init__(self, scoreboard: RGFScoreboard, log_level, callback=None):
+        super().__init__(log_level, callback)
         self.scoreboard = scoreboard
-        self.wen = rgf_wen
-        self.wa = rgf_wa
-        self.wd = rgf_wd
-        self.wb_inst = wb_inst
-        self.wb_pc = wb_pc
-        self.clock = clock
         self.title = 'RGFM'.ljust(16)
-        self.log.setLevel(log_level)
     
-    async def _monitor_recv(self):
-        while True:
-            await ReadOnly()
-            write_cond = self.wen.value==1 and self.wa!=0
-            if write_cond:
-                rgf_wr_trans = RGFTrans(int(self.wd.value), int(self.wa.value))
-                rgf_wb_inst = IMTrans(int(self.wb_inst.value), int(self.wb_pc.value))
-                self.log.info(f'{self.title} {rgf_wr_trans.get_log_message()} \n-->WB instruction{rgf_wb_inst.get_log_message()}')
-                self.scoreboard.add_actual(rgf_wr_trans)
-                equal = self.scoreboard.compare()
-                if not equal:
-                    rgf_state_str = 'RGF state at failure point:\n'
-                    for i, reg in enumerate(self.scoreboard.expected_state):
-                        rgf_state_str += f'x{str(i).ljust(2)} = {hex(reg)}\n'
-                    self.log.warning(rgf_state_str)
-                    await ClockCycles(self.clock, 5)
-                    assert False
-                self._recv(rgf_wr_trans)
-            await RisingEdge(self.clock)
+    def sample(self, snap: SignalSnapshot):
+        if self.failed or not snap.rgf_we:
+            return
+        rgf_wr_trans = RGFTrans(snap.rgf_wd, snap.rgf_wa)
+        if self.log.isEnabledFor(logging.INFO):
+            rgf_wb_inst = IMTrans(snap.wb_inst, snap.wb_pc)
+            self.log.info(f'{self.title} {rgf_wr_trans.get_log_message()} \n-->WB instruction{rgf_wb_inst.get_log_message()}')
+        self.scoreboard.add_actual(rgf_wr_trans)
+        equal = self.scoreboard.compare()
+        if not equal:
+            if self.scoreboard.golden is not None:
+                rgf_state_str = f'RGF failure at golden write #{self.scoreboard.golden_idx-1}\n'
+            else:
+                rgf_state = None
+                if self.scoreboard.matched_write_idx is not None:
+                    rgf_state = self.scoreboard.get_state_before(self.scoreboard.matched_write_idx)
+                if rgf_state is None:
+                    rgf_state = self.scoreboard.expected_state
+                rgf_state_str = 'RGF state at failure point:\n'
+                for i, reg in enumerate(rgf_state):
+                    rgf_state_str += f'x{str(i).ljust(2)} = {hex(reg)}\n'
+            self.log.warning(rgf_state_str)
+            self.fail()
+            return
+        self._recv(rgf_wr_trans)
 
-class IMMonitor(BusMonitor):
+class IMMonitor(SampledChecker):
     '''
     Instruction memory monitor:
         1. Logs valid write transactions over the inst_mem_wr IF
         2. Fills the IM SB with the instruction LUT
     '''
-    _signals = ['wen', 'addr', 'dat']
-
-    def __init__(self, entity, name, clock, log_level, reset=None, reset_n=None, callback=None, event=None, **kwargs):
+    def __init__(self, log_level, callback=None):
+        super().__init__(log_level, callback)
         self.title = 'IMM'.ljust(16)
-        super().__init__(entity, name, clock, reset, reset_n, callback, event, **kwargs)
-        self.log.setLevel(log_level)
 
-    async def _monitor_recv(self):
-        while True:
-            await ReadOnly()
-            if self.bus.wen.value==1:
-                # Build found transaction
-                trans = IMTrans(int(self.bus.dat.value), int(self.bus.addr.value))
-                if trans.inst_str!='nop':
-                    self.log.debug(f'{self.title} {trans.get_log_message()}')
-                    
-                self._recv(trans)
-            await RisingEdge(self.clock)
+    def log_trans(self, trans: IMTrans):
+        '''
+        logs a write transaction, also used by IMDriver for backdoor writes
+        '''
+        if self.log.isEnabledFor(logging.DEBUG) and trans.inst_str!='nop':
+            self.log.debug(f'{self.title} {trans.get_log_message()}')
+        self._recv(trans)
+
+    def sample(self, snap: SignalSnapshot):
+        if snap.im_wen:
+            self.log_trans(IMTrans(snap.im_dat, snap.im_addr))
 
-class MMMonitor(BusMonitor):
+class MMMonitor(SampledChecker):
     '''
     Main memory monitor:
         1. Listnes to the write interface to the main memory
     '''
-    _signals = ['cs', 'wen', 'addr', 'dat_in']
-    
-    def __init__(self, entity, name, clock, scoreboard: MMScoreboard, log_level, reset=None, reset_n=None, callback=None, event=None, **kwargs):
+    def __init__(self, scoreboard: MMScoreboard, log_level, callback=None):
+        super().__init__(log_level, callback)
         self.title = 'MMM'.ljust(16)
         self.scoreboard = scoreboard
-        super().__init__(entity, name, clock, reset, reset_n, callback, event, **kwargs)
-        self.log.setLevel(log_level)
     
-    async def _monitor_recv(self):
-        while True:
-            await ReadOnly()
-            if self.bus.wen.value==1 and self.bus.cs.value==1:
-                trans = MMTrans(int(self.bus.dat_in.value), int(self.bus.addr.value))
-                self.log.info(f'{self.title} {trans.get_log_message()}')
-                self.scoreboard.add_actual(trans)
-                equal = self.scoreboard.compare()
-                if not equal:
-                    await ClockCycles(self.clock, 5)
-                    assert False
-                self._recv(trans)
-            await RisingEdge(self.clock)
+    def sample(self, snap: SignalSnapshot):
+        if self.failed or not snap.mm_wr:
+            return
+        trans = MMTrans(snap.mm_dat_in, snap.mm_addr)
+        if self.log.isEnabledFor(logging.INFO):
+            self.log.info(f'{self.title} {trans.get_log_message()}')
+        self.scoreboard.add_actual(trans)
+        equal = self.scoreboard.compare()
+        if not equal:
+            self.fail()
+            return
+        self._recv(trans)
 
-class EXCMonitor(Monitor):
+class TraceMonitor(SampledChecker):
     '''
-    Exceptions monitor:
-        1. Listens to exception triggers on the IF stage
+    Binary trace monitor:
+        1. Records every cycle the CPU fetches an instruction or writes the RGF or main memory
+        2. The values are the sampled ones, the fetch is left out on interlock bubbles (fetched again)
     '''
-    def __init__(self, clock, reset_n, act_exc, exc_sb: EXCScoreboard, log_level, callback=None, event=None):
-        super().__init__(callback, event)
-        self.clock = clock
-        self.reset_n = reset_n
-        self.act = act_exc
-        self.sb = exc_sb
-        self.log.setLevel(log_level)
-        self.title = (self.sb.name.rstrip()[:-2] + 'M').ljust(16)
-    
-    async def _monitor_recv(self):
-        while True:
-            await ReadOnly()
-            if self.reset_n.value!=0:
-                if bool(self.act.value):
-                    self.log.warning(f'{self.title} exception triggered')
-            self._recv(self.act.value)
-            await RisingEdge(self.clock)
+    def __init__(self, trace: TraceSink, log_level, callback=None):
+        super().__init__(log_level, callback)
+        self.trace = trace
+
+    def sample(self, snap: SignalSnapshot):
+        if not snap.rst_n_cpu:
+            return
+        fetch = snap.inst_vld and not snap.intrlock
+        if fetch or snap.rgf_we or snap.mm_wr:
+            self.trace.record(
+                snap.cycle, snap.pc if fetch else None, snap.inst,
+                snap.rgf_wa if snap.rgf_we else None, snap.rgf_wd,
+                snap.mm_addr if snap.mm_wr else None, snap.mm_dat_in
+            )
+
+class EXCChecker(SampledChecker):
+    '''
+    Exceptions checker, the four exception triggers as a single vector (see EXC_NAMES):
+        1. predict - compares the predicted instruction exceptions right away and puts
+           the main memory ones on a fixed-length delay line, MA raises them 3 cycles later
+        2. sample - logs triggered exceptions and compares the delay line output
+    '''
+    def __init__(self, log_level, callback=None):
+        super().__init__(log_level, callback)
+        self.title = 'EXCM'.ljust(16)
+        self.delay_line = [None] * (MAIN_EXC_SLOTS + 1)
+        self.pending_num = 0 # main memory predictions still on the delay line
+        self.found_num = 0
+        self.drained = Event() # set while no prediction is pending
+        self.drained.set()
+
+    def reset(self):
+        super().reset()
+        self.delay_line = [None] * len(self.delay_line)
+        self.pending_num = 0
+        self.found_num = 0
+        self.drained.set()
+
+    def _compare(self, expected: int, actual: int):
+        if expected != actual:
+            self.log.error(f'{self.title} EXCEPTION MISMATCH!! predicted {get_exc_names(expected)} but got {get_exc_names(actual)}')
+            self.fail()
+        elif actual:
+            self.found_num += 1
+            if self.log.isEnabledFor(logging.INFO):
+                self.log.info(f'{self.title} EXCEPTION FOUND as predicted: {get_exc_names(actual)}')
+
+    def predict(self, snap: SignalSnapshot, exc: int):
+        if self.failed:
+            return
+        self._compare(exc & EXC_INST_MASK, snap.exc & EXC_INST_MASK)
+        self.delay_line[(snap.cycle + MAIN_EXC_SLOTS) % len(self.delay_line)] = exc & EXC_MAIN_MASK
+        self.pending_num += 1
+        self.drained.clear()
+
+    def sample(self, snap: SignalSnapshot):
+        if snap.rst_n_cpu and snap.exc:
+            self.log.warning(f'{self.title} exception triggered: {get_exc_names(snap.exc)}')
+        slot = snap.cycle % len(self.delay_line)
+        expected = self.delay_line[slot]
+        if expected is not None:
+            self.delay_line[slot] = None
+            self.pending_num -= 1
+            if not self.pending_num:
+                self.drained.set()
+            if not self.failed:
+                self._compare(expected, snap.exc & EXC_MAIN_MASK)
+        self._recv(snap.exc)
+
+class GoldenChecker(SampledChecker):
+    '''
+    Golden-mode program counter and exceptions checker, in place of the PCMonitor predictions:
+        1. set_golden - takes the GoldenTrace of the scoreboards, the same ISS run
+        2. sample - compares the PC on every cycle an instruction retires and the exceptions
+           vector on every cycle against the ISS streams, cycles counted from the CPU reset release
+    '''
+    def __init__(self, log_level, callback=None):
+        super().__init__(log_level, callback)
+        self.title = 'GOLDC'.ljust(16)
+        self.found_num = 0
+        self.set_golden(None)
+
+    def set_golden(self, golden: GoldenTrace):
+        self.golden = golden
+        self.ret_idx = 0
+        self.exc_idx = 0
+        self.exc_due = {} # cycle -> exceptions vector, ISS exceptions not sampled yet
+
+    def reset(self):
+        super().reset()
+        self.set_golden(None)
+        self.found_num = 0
+
+    def sample(self, snap: SignalSnapshot):
+        if self.failed or self.golden is None or not snap.rst_n_cpu:
+            return
+        cycle = self.golden.get_cycle()
+        self.golden.run_past(cycle)
+        iss = self.golden.iss
 
-async def update_exc(clock, mon: EXCMonitor, exc: bool, delay: bool=False)->bool:
-    mon.sb.add_expected(exc)
-    if delay:
-        await ClockCycles(clock, 3)
-    await ReadOnly()
-    mon.sb.add_actual(bool(mon.act.value))
-    equal = mon.sb.compare()
-    if not equal:
-        await ClockCycles(clock, 5)
-        assert False
+        # Exceptions, several instructions may raise on the same cycle
+        while self.exc_idx < len(iss.exc_slot):
+            slot = iss.exc_slot[self.exc_idx]
+            self.exc_due[slot] = self.exc_due.get(slot, 0) | iss.exc_vec[self.exc_idx]
+            self.exc_idx += 1
+        expected = self.exc_due.pop(cycle, 0)
+        if expected != snap.exc:
+            self.log.error(f'{self.title} EXCEPTION MISMATCH!! golden {get_exc_names(expected)} but got {get_exc_names(snap.exc)} (cycle {cycle})')
+            self.fail()
+            return
+        if expected:
+            self.found_num += 1
+            if self.log.isEnabledFor(logging.INFO):
+                self.log.info(f'{self.title} EXCEPTION FOUND as golden: {get_exc_names(expected)}')
 
-class PCMonitor(Monitor):
+        # Program counter of the instruction retiring on this cycle
+        if self.ret_idx < len(iss.ret_slot) and iss.ret_slot[self.ret_idx] == cycle:
+            if snap.pc != iss.ret_pc[self.ret_idx]:
+                self.log.error(f'{self.title} MISMATCH!!\nexpected{iss.get_log_message(self.ret_idx)} but got PC={hex(snap.pc)}')
+                self.fail()
+                return
+            self.ret_idx += 1
+
+class PCMonitor(SampledChecker):
     '''
     Program counter monitor:
         1. Listens to program counter and instruction from DUT
         2. Logs valid instructions
+        3. Hands every checked instruction (IMTrans, once per interlock) to the callbacks
+        4. Samples the functional coverage of every checked instruction, if a collector is given
+        5. Predicts the fetch stage branch predictor (configured by bp) to know which branches and jalr flush
+    after a flush the 2 flushed cycles are skipped (and the load-use bubble of the flushing instruction),
+    the exception and next PC update of the flushing instruction happen on the cycle after them,
+    a cycle the prefetch buffer has no instruction for fetch holds the PC and is skipped too
     '''
-    def __init__(self, clock, rst_n, pc, inst, inst_mem_depth, intrlock, trap_base,
+    def __init__(self, clock, inst_mem_depth,
                   pc_scoreboard: PCScoreboard, rgf_scoreboard: RGFScoreboard, mm_scoreboard: MMScoreboard,
-                  inst_mis_mon: EXCMonitor, inst_oob_mon: EXCMonitor, main_mis_mon: EXCMonitor, main_oob_mon: EXCMonitor, 
-                    log_level, callback=None, event=None):
-        super().__init__(callback, event)
+                  exc_checker: EXCChecker, log_level, coverage: Coverage=None, callback=None,
+                  bp: BPConfig=BPConfig()):
+        super().__init__(log_level, callback)
         self.clock = clock
-        self.rst_n = rst_n
-        self.pc = pc 
-        self.inst = inst
         self.inst_mem_depth = inst_mem_depth
+        self.predictor = BranchPredictor(bp, inst_mem_depth)
         self.pc_scoreboard = pc_scoreboard
         self.rgf_scoreboard = rgf_scoreboard
         self.mm_scoreboard = mm_scoreboard
-        self.inst_mis_mon = inst_mis_mon 
-        self.inst_oob_mon = inst_oob_mon
-        self.main_mis_mon = main_mis_mon
-        self.main_oob_mon = main_oob_mon
-        self.intrlock = intrlock
-        self.trap_base = trap_base 
+        self.exc_checker = exc_checker
+        self.coverage = coverage # optional functional coverage collector
         self.title = 'PCM'.ljust(16)
-        self.log.setLevel(log_level)
+        self.skip_cycles = 0
+        self.pending = None # (next_pc, exceptions) waiting for the flushed cycles
+
+    def reset(self):
+        super().reset()
+        self.skip_cycles = 0
+        self.pending = None
+        self.predictor.reset()
+        if self.coverage is not None:
+            self.coverage.reset()
     
-    async def _monitor_recv(self):
-        while True:
-            await ReadOnly()
-            if self.rst_n.value!=0:
-                # Log current instruction
-                curr_inst_str = inst_int2str(int(self.inst.value))
-                if curr_inst_str!='nop':
-                    padded_inst_str = curr_inst_str.ljust(31)
-                    self.log.info(f'{self.title}  : current instruction is - {padded_inst_str} @ {hex(int(self.pc.value))}')
-                
-                # PC Scoreboard update
-                equal = self.pc_scoreboard.compare(int(self.pc.value))
-                if not equal:
-                    await ClockCycles(self.clock, 5)
-                    assert False
-                next_pc, flush, exc_inst_mis, exc_inst_oob = inst_int2pcexp(
-                    int(self.inst.value), self.rgf_scoreboard.expected_state, self.pc_scoreboard.expected_pc, int(self.intrlock.value), self.inst_mem_depth)
-                # TODO: this assumes that the pipe interlock implementation is correct
-                # and does not try to predict whether a pipe interlock is required
-                
-                # RGF Scoreboard update
-                expected_rgf_wen, expected_rgf_wa, expected_rgf_wd, expected_rgf_next_state = inst_int2rgfexp(
-                    int(self.inst.value), self.rgf_scoreboard.expected_state, self.mm_scoreboard.expected_state, self.pc_scoreboard.expected_pc+4)
-                if expected_rgf_wen:
-                    rgf_wr_trans = RGFTrans(expected_rgf_wd, expected_rgf_wa)
-                    self.rgf_scoreboard.add_expected(rgf_wr_trans)
-                    self.rgf_scoreboard.expected_state = expected_rgf_next_state.copy()
-                
-                # Main memory Scoreboard update
-                expected_mm_wen, expected_mm_wa, expected_mm_wd, expected_mm_next_state, exc_main_mis, exc_main_oob = inst_int2mmexp(
-                    int(self.inst.value), self.rgf_scoreboard.expected_state, self.mm_scoreboard.expected_state)
-                if expected_mm_wen:
-                    mm_wr_trans = MMTrans(expected_mm_wd, expected_mm_wa)
-                    self.mm_scoreboard.add_expected(mm_wr_trans)
-                    self.mm_scoreboard.expected_state = expected_mm_next_state.copy()
-                
-                # If flush, don't monitor the next 2 instructions as they should be flushed
-                if flush: 
-                   await ClockCycles(self.clock, 2) 
-
-                # update expected exception predictions
-                await ReadOnly()
-                cocotb.start_soon(update_exc(self.clock, self.inst_mis_mon, exc_inst_mis))
-                cocotb.start_soon(update_exc(self.clock, self.inst_oob_mon, exc_inst_oob))
-                cocotb.start_soon(update_exc(self.clock, self.main_mis_mon, exc_main_mis, True))
-                cocotb.start_soon(update_exc(self.clock, self.main_oob_mon, exc_main_oob, True))
-                
-                # update program counter
-                trap = bool(self.inst_mis_mon.act.value) or bool(self.inst_oob_mon.act.value) or bool(self.main_mis_mon.act.value) or bool(self.main_oob_mon.act.value)
-                self.pc_scoreboard.expected_pc = int(self.trap_base.value) if trap else next_pc 
-                
-            await RisingEdge(self.clock)
+    def sample(self, snap: SignalSnapshot):
+        if self.failed or not snap.rst_n_cpu:
+            return
+        if self.skip_cycles:
+            if snap.intrlock:
+                return # the flushing instruction is held in decode, it flushes a cycle later
+            self.skip_cycles -= 1
+            if self.skip_cycles == 0:
+                self._update(snap, *self.pending)
+            return
+        if not snap.inst_vld and not snap.intrlock:
+            # nothing fetched, the PC holds unless a main memory exception traps
+            if snap.exc:
+                self.pc_scoreboard.expected_pc = snap.trap_base
+            return
+
+        # Decode current instruction once for all predictors
+        curr_inst = decode_inst(snap.inst)
+
+        # Log current instruction
+        if self.log.isEnabledFor(logging.INFO):
+            curr_inst_str = inst_int2str(curr_inst)
+            if curr_inst_str!='nop':
+                padded_inst_str = curr_inst_str.ljust(31)
+                self.log.info(f'{self.title}  : current instruction is - {padded_inst_str} @ {hex(snap.pc)}')
+        
+        # PC Scoreboard update
+        equal = self.pc_scoreboard.compare(snap.pc)
+        if not equal:
+            self.fail()
+            return
+        if self._callbacks and not snap.intrlock:
+            self._recv(IMTrans(snap.inst, snap.pc))
+        # Branch predictor, the instruction fetched on the previous cycle is the stalled one
+        guess = None
+        if snap.intrlock:
+            self.predictor.stall(snap.cycle)
+        else:
+            guess = self.predictor.guess(curr_inst, self.pc_scoreboard.expected_pc, snap.cycle)
+            self.predictor.resolve(curr_inst, self.pc_scoreboard.expected_pc, self.rgf_scoreboard.expected_state, snap.cycle + BP_UPDATE_CYCLES)
+        next_pc, flush, exc_inst_mis, exc_inst_oob = inst_int2pcexp(
+            curr_inst, self.rgf_scoreboard.expected_state, self.pc_scoreboard.expected_pc, snap.intrlock, self.inst_mem_depth, guess)
+        # TODO: this assumes that the pipe interlock implementation is correct
+        # and does not try to predict whether a pipe interlock is required
+
+        # The instruction fetched on an interlock bubble is fetched again on the next cycle, predicted then
+        if snap.intrlock:
+            if self.coverage is not None:
+                self.coverage.sample_inst(snap.inst, snap.intrlock, flush)
+            self._update(snap, next_pc, 0)
+            return
+        
+        # RGF Scoreboard update
+        expected_rgf_wen, expected_rgf_wa, expected_rgf_wd = inst_int2rgfexp(
+            curr_inst, self.rgf_scoreboard.expected_state, self.mm_scoreboard.expected_state, self.pc_scoreboard.expected_pc+4)
+        if expected_rgf_wen:
+            rgf_wr_trans = RGFTrans(expected_rgf_wd, expected_rgf_wa)
+            self.rgf_scoreboard.add_expected(rgf_wr_trans)
+            self.rgf_scoreboard.apply_write(expected_rgf_wa, expected_rgf_wd)
+        
+        # Main memory Scoreboard update
+        expected_mm_wen, expected_mm_wa, expected_mm_wd, exc_main_mis, exc_main_oob = inst_int2mmexp(
+            curr_inst, self.rgf_scoreboard.expected_state, self.mm_scoreboard.expected_state)
+        if expected_mm_wen:
+            mm_wr_trans = MMTrans(expected_mm_wd, expected_mm_wa)
+            self.mm_scoreboard.add_expected(mm_wr_trans)
+            self.mm_scoreboard.apply_write(expected_mm_wa >> 2, expected_mm_wd)
+
+        # Coverage
+        if self.coverage is not None:
+            self.coverage.sample_inst(snap.inst, snap.intrlock, flush)
+        
+        # If flush, don't monitor the next 2 instructions as they should be flushed
+        exceptions = int(exc_inst_mis) | (int(exc_inst_oob) << 1) | (int(exc_main_mis) << 2) | (int(exc_main_oob) << 3)
+        if flush: 
+            self.skip_cycles = 2
+            self.pending = (next_pc, exceptions)
+            return
+        self._update(snap, next_pc, exceptions)
+
+    def _update(self, snap: SignalSnapshot, next_pc: int, exceptions: int):
+        '''
+        update expected exception predictions and the next expected program counter
+        '''
+        self.exc_checker.predict(snap, exceptions)
+        
+        # update program counter
+        trap = snap.exc != 0
+        self.pc_scoreboard.expected_pc = snap.trap_base if trap else next_pc 
+
+IDLE_LOOP_INST = inst_str2int('jal x0, 0')
+
+class EndCondition(object):
+    '''
+    Program end condition, run_program ends at the first armed condition to fire:
+        1. arm - hooks the condition to the test environment, once per program
+        2. wait - returns once the condition fired, woken by value changes or
+           monitor callbacks, never by polling every cycle
+    '''
+    name = 'end'
+
+    def __init__(self):
+        self.event = Event()
+
+    def arm(self, env):
+        self.event.clear()
+
+    async def wait(self):
+        await self.event.wait()
+
+class PCSentinel(EndCondition):
+    '''
+    the fetch PC reaches addr, the instruction memory read address runs ahead of it through the prefetch buffer
+    '''
+    name = 'sentinel'
+
+    def __init__(self, addr: int):
+        super().__init__()
+        self.addr = addr
+        self.signal = None
+
+    def arm(self, env):
+        self.signal = env.dut.i_etcpu_top.pc
+
+    async def wait(self):
+        while not (self.signal.value.is_resolvable and self.signal.value == self.addr):
+            await Edge(self.signal)
+
+class RetiredInsts(EndCondition):
+    '''
+    num instructions checked by the PCMonitor since the CPU left reset
+    '''
+    name = 'retired'
+
+    def __init__(self, num: int):
+        super().__init__()
+        self.num = num
+        self.retired_num = 0
+        self.monitor = None
+
+    def arm(self, env):
+        super().arm(env)
+        self.retired_num = 0
+        if env.pc_monitor is None:
+            cocotb.log.warning('Test Manage       : no PCMonitor in golden mode, retired instructions are not counted')
+        elif self.monitor is not env.pc_monitor:
+            self.monitor = env.pc_monitor
+            self.monitor.add_callback(self._retire)
+
+    def _retire(self, trans: IMTrans):
+        self.retired_num += 1
+        if self.retired_num == self.num:
+            self.event.set()
+
+class IdleLoop(EndCondition):
+    '''
+    the PCMonitor checks a jal x0, 0 self-loop
+    '''
+    name = 'idle'
+
+    def __init__(self):
+        super().__init__()
+        self.monitor = None
+
+    def arm(self, env):
+        super().arm(env)
+        if env.pc_monitor is None:
+            cocotb.log.warning('Test Manage       : no PCMonitor in golden mode, idle loops are not detected')
+        elif self.monitor is not env.pc_monitor:
+            self.monitor = env.pc_monitor
+            self.monitor.add_callback(self._check)
 
+    def _check(self, trans: IMTrans):
+        if trans.inst_int == IDLE_LOOP_INST:
+            self.event.set()
@@ -0,0 +1,278 @@
+'''
+Parallel seeded regression runner:
+    1. Launches independent simulator processes across the local cores,
+       test_rand runs get a distinct seed each, the instruction count and
+       opcode_probs mix of a run are derived from its seed alone
+    2. Optionally adds every directed test (tests/test_*.py) to the run
+    3. Streams one JSON line per finished run (status, wall time) into the report
+       and prints an aggregated summary at the end
+    4. With --cov every run collects functional coverage, the databases are merged
+       into OUT_DIR/coverage.etcv and reported at the end (see models.etcpu_cov)
+    5. With --adapt N runs N batches of test_rand runs, every batch after the first with the opcode_probs
+       mix adapted to the coverage merged so far (see models.etcpu_adapt), the seeds and mix of
+       every batch are logged to OUT_DIR/adapt.jsonl
+    6. Reproduces a run from its seed (and its mix, for adapted runs):
+        python -m models.etcpu_regress --sim-cmd CMD --seed SEED [--opcode-probs JSON]
+the simulator command is a template, the Python mock (models.etcpu_mock) by default,
+it is run from --sim-dir with {module} and {testcase} replaced and gets RANDOM_SEED, COCOTB_RESULTS_FILE, ETCPU_INST_NUM and ETCPU_OPCODE_PROBS
+in its environment (ETCPU_IMAGE for program image runs, ETCPU_IMAGE_OUT to dump the program
+of every run next to its log), e.g. for a cocotb makefile flow:
+    python -m models.etcpu_regress --sim-cmd 'make MODULE={module} TESTCASE={testcase}' -n 64
+'''
+import argparse
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import List, NamedTuple
+from models.etcpu_adapt import adapt_probs
+from models.etcpu_cov import Coverage, get_report, merge_dbs
+
+TESTS_DIR = Path(__file__).resolve().parent.parent / 'tests'
+MOCK_SIM_CMD = f'{shlex.quote(sys.executable)} -m models.etcpu_mock {{module}} {{testcase}}'
+RAND_MODULE, RAND_TESTCASE = 'tests.test_rand', 'test_rand'
+IMAGE_MODULE, IMAGE_TESTCASE = 'tests.test_image', 'test_image' # see models.etcpu_minimize
+RAND_INST_NUM_RANGE = (16, 1024) # test_rand clips it to the instruction memory
+OPCODE_TYPES = ('itype', 'rtype', 'store', 'load', 'jalr', 'jal', 'btype')
+OPCODE_PROB_MAX = 16
+
+class RegressJob(NamedTuple):
+    module: str
+    testcase: str
+    seed: int
+    inst_num: int = None
+    opcode_probs: dict = None
+    image: list = None
+
+    @property
+    def name(self)->str:
+        return f'{self.testcase}_{self.seed}'
+
+def get_rand_job(seed: int, opcode_probs: dict=None)->RegressJob:
+    '''
+    test_rand run of a seed, the instruction count and opcode_probs mix are a function of the seed,
+    unless the mix is given
+    '''
+    rng = random.Random(seed)
+    inst_num = rng.randint(*RAND_INST_NUM_RANGE)
+    if opcode_probs is None:
+        opcode_probs = {op_type: rng.randint(0, OPCODE_PROB_MAX) for op_type in OPCODE_TYPES}
+        opcode_probs['itype'] = max(opcode_probs['itype'], 1) # never an all-zero mix
+    return RegressJob(RAND_MODULE, RAND_TESTCASE, seed, inst_num, opcode_probs)
+
+def get_directed_jobs(seed: int)->List[RegressJob]:
+    '''
+    one run per cocotb test found under tests/, except the random and program image ones
+    '''
+    jobs = []
+    for path in sorted(TESTS_DIR.glob('test_*.py')):
+        lines = path.read_text().splitlines()
+        for idx, line in enumerate(lines[:-1]):
+            if line.startswith('@cocotb.test') and lines[idx + 1].startswith('async def '):
+                testcase = lines[idx + 1][len('async def '):].split('(')[0]
+                if not testcase.startswith('test_rand') and testcase != IMAGE_TESTCASE:
+                    jobs.append(RegressJob(f'tests.{path.stem}', testcase, seed))
+    return jobs
+
+def get_job_env(job: RegressJob, results_file: Path, coverage: bool=False)->dict:
+    env = dict(os.environ)
+    env['RANDOM_SEED'] = str(job.seed)
+    env['COCOTB_RESULTS_FILE'] = str(results_file)
+    if job.inst_num is not None:
+        env['ETCPU_INST_NUM'] = str(job.inst_num)
+    if job.opcode_probs is not None:
+        env['ETCPU_OPCODE_PROBS'] = json.dumps(job.opcode_probs)
+    if job.image is not None:
+        env['ETCPU_IMAGE'] = json.dumps(job.image)
+    env['ETCPU_IMAGE_OUT'] = str(results_file.parent / 'image.json')
+    if coverage:
+        env['ETCPU_COV_OUT'] = str(results_file.parent / 'coverage.etcv')
+    return env
+
+def parse_results(results_file: Path, testcase: str)->str:
+    '''
+    status of a testcase in a cocotb results.xml, 'PASS', 'FAIL' or 'ERROR' (no result recorded)
+    '''
+    if not results_file.exists():
+        return 'ERROR'
+    try:
+        root = ET.parse(results_file).getroot()
+    except ET.ParseError:
+        return 'ERROR'
+    for case in root.iter('testcase'):
+        if case.get('name') == testcase:
+            failed = case.find('failure') is not None or case.find('error') is not None
+            return 'FAIL' if failed else 'PASS'
+    return 'ERROR'
+
+def run_job(job: RegressJob, sim_cmd: str, sim_dir: Path, out_dir: Path, timeout: float, coverage: bool=False)->dict:
+    work_dir = out_dir / job.name
+    work_dir.mkdir(parents=True, exist_ok=True)
+    results_file = work_dir / 'results.xml'
+    results_file.unlink(missing_ok=True)
+    (work_dir / 'coverage.etcv').unlink(missing_ok=True)
+    cmd = sim_cmd.format(module=job.module, testcase=job.testcase)
+    start = time.monotonic()
+    with open(work_dir / 'sim.log', 'w') as log:
+        try:
+            subprocess.run(shlex.split(cmd), cwd=sim_dir, env=get_job_env(job, results_file, coverage), stdout=log, stderr=subprocess.STDOUT, timeout=timeout)
+            status = parse_results(results_file, job.testcase)
+        except subprocess.TimeoutExpired:
+            status = 'TIMEOUT'
+    return {
+        'test': f'{job.module}.{job.testcase}',
+        'seed': job.seed,
+        'inst_num': job.inst_num,
+        'opcode_probs': job.opcode_probs,
+        'status': status,
+        'wall_s': round(time.monotonic() - start, 3),
+        'log': str(work_dir / 'sim.log'),
+    }
+
+def get_repro_cmd(result: dict, sim_cmd: str)->str:
+    repro = f'python -m models.etcpu_regress --sim-cmd {shlex.quote(sim_cmd)} --seed {result["seed"]}'
+    if not result['test'].endswith(f'.{RAND_TESTCASE}'):
+        repro += f' --test {result["test"]}'
+    elif result['opcode_probs'] != get_rand_job(result['seed']).opcode_probs:
+        repro += f' --opcode-probs {shlex.quote(json.dumps(result["opcode_probs"]))}'
+    return repro
+
+def run_regression(jobs: List[RegressJob], sim_cmd: str, sim_dir: Path, out_dir: Path, report_path: Path, workers: int, timeout: float,
+                   coverage: bool=False, append: bool=False)->List[dict]:
+    '''
+    runs the jobs on workers parallel simulator processes,
+    every result is appended to the report as soon as its run ends
+    '''
+    results = []
+    with open(report_path, 'a' if append else 'w') as report, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_job, job, sim_cmd, sim_dir, out_dir, timeout, coverage) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            report.write(json.dumps(result) + '\n')
+            report.flush()
+            print(f'[{len(results)}/{len(jobs)}] {result["status"].ljust(7)} {result["test"]} seed={result["seed"]} '
+                  f'wall={result["wall_s"]}s', flush=True)
+    return results
+
+def merge_job_cov(jobs: List[RegressJob], out_dir: Path)->Coverage:
+    '''
+    coverage of the jobs merged, None if none of them saved a database
+    '''
+    paths = [out_dir / job.name / 'coverage.etcv' for job in jobs]
+    return merge_dbs(path for path in paths if path.exists())
+
+def run_adaptive(rng: random.Random, batches: int, batch_runs: int, sim_cmd: str, sim_dir: Path, out_dir: Path,
+                 report_path: Path, workers: int, timeout: float, append: bool=False)->tuple:
+    '''
+    batches of test_rand runs with coverage, the first with the per-seed mixes, every next one
+    with the mix adapted to the coverage merged so far, one adapt.jsonl line per batch
+    returns the results and the merged coverage
+    '''
+    results, cov, opcode_probs = [], None, None
+    with open(out_dir / 'adapt.jsonl', 'w') as adapt_log:
+        for batch in range(batches):
+            seeds = rng.sample(range(2**32), batch_runs)
+            jobs = [get_rand_job(seed, opcode_probs) for seed in seeds]
+            results += run_regression(jobs, sim_cmd, sim_dir, out_dir, report_path, workers, timeout, True, append or batch > 0)
+            batch_cov = merge_job_cov(jobs, out_dir)
+            if batch_cov is not None:
+                if cov is None:
+                    cov = batch_cov
+                else:
+                    cov.merge(batch_cov)
+            hit_num, goals_num = cov.get_hit_num() if cov is not None else (0, 0)
+            adapt_log.write(json.dumps({'batch': batch, 'seeds': seeds, 'opcode_probs': opcode_probs,
+                                        'bins_hit': hit_num, 'bins': goals_num, 'runs': len(results)}) + '\n')
+            adapt_log.flush()
+            print(f'Adapt batch {batch} : {hit_num}/{goals_num} bins hit after {len(results)} runs', flush=True)
+            if cov is not None:
+                opcode_probs = adapt_probs(cov, opcode_probs or {})
+    return results, cov
+
+def print_summary(results: List[dict], sim_cmd: str, wall_s: float):
+    failed = [result for result in results if result['status'] != 'PASS']
+    print(f'Regression summary : {len(results) - len(failed)}/{len(results)} passed in {wall_s:.1f}s wall')
+    for result in failed:
+        print(f'    {result["status"]} {result["test"]} seed={result["seed"]} log={result["log"]}')
+        print(f'        reproduce : {get_repro_cmd(result, sim_cmd)}')
+        if result['test'].endswith(f'.{RAND_TESTCASE}'):
+            print(f'        minimize  : python -m models.etcpu_minimize --sim-cmd {shlex.quote(sim_cmd)} --seed {result["seed"]}')
+
+def main():
+    parser = argparse.ArgumentParser(description='parallel seeded etcpu regression')
+    parser.add_argument('--sim-cmd', default=os.environ.get('ETCPU_SIM_CMD', MOCK_SIM_CMD), help='simulator command template, {module} and {testcase} are replaced (default $ETCPU_SIM_CMD or the mock)')
+    parser.add_argument('--sim-dir', type=Path, default=Path.cwd(), help='directory the simulator command is run from')
+    parser.add_argument('--build-cmd', default=None, help='run once before the regression, so parallel runs share one build')
+    parser.add_argument('-n', '--rand-runs', type=int, default=16, help='number of test_rand runs')
+    parser.add_argument('--directed', action='store_true', help='run the directed tests as well')
+    parser.add_argument('--base-seed', type=int, default=None, help='seed of the per-run seeds, random by default')
+    parser.add_argument('--seed', type=int, default=None, help='reproduce the single run of this seed')
+    parser.add_argument('--test', default=None, help='with --seed, the module.testcase to reproduce (test_rand by default)')
+    parser.add_argument('--opcode-probs', type=json.loads, default=None, help='with --seed, the opcode_probs mix (JSON) of an adapted run')
+    parser.add_argument('--adapt', type=int, default=None, metavar='N', help='N batches of --rand-runs runs, coverage-directed mixes (implies --cov)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='parallel simulator processes')
+    parser.add_argument('--timeout', type=float, default=None, help='per-run timeout [s]')
+    parser.add_argument('--out-dir', type=Path, default=Path('regress_out'), help='per-run logs and results')
+    parser.add_argument('--cov', action='store_true', help='collect functional coverage, merged into OUT_DIR/coverage.etcv')
+    parser.add_argument('--report', type=Path, default=None, help='JSON lines report (default OUT_DIR/report.jsonl)')
+    args = parser.parse_args()
+
+    # 1. Jobs
+    if args.seed is not None:
+        if args.test is None:
+            jobs = [get_rand_job(args.seed, args.opcode_probs)]
+        else:
+            module, testcase = args.test.rsplit('.', 1)
+            jobs = [RegressJob(module, testcase, args.seed)]
+    else:
+        base_seed = args.base_seed if args.base_seed is not None else random.getrandbits(32)
+        print(f'Regression base seed : {base_seed}')
+        rng = random.Random(base_seed)
+        seeds = rng.sample(range(2**32), args.rand_runs) if args.adapt is None else [] # adaptive batches draw theirs
+        jobs = [get_rand_job(seed) for seed in seeds]
+        if args.directed:
+            jobs += get_directed_jobs(base_seed)
+
+    # 2. Shared build
+    if args.build_cmd is not None:
+        if subprocess.run(shlex.split(args.build_cmd), cwd=args.sim_dir).returncode != 0:
+            print('Error: build command failed')
+            exit(2)
+
+    # 3. Run
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    report_path = args.report if args.report is not None else args.out_dir / 'report.jsonl'
+    start = time.monotonic()
+    sim_dir, out_dir = args.sim_dir.resolve(), args.out_dir.resolve()
+    coverage = args.cov or args.adapt is not None
+    results = run_regression(jobs, args.sim_cmd, sim_dir, out_dir, report_path, args.jobs, args.timeout, coverage) if jobs else []
+    cov = merge_job_cov(jobs, out_dir) if coverage else None
+    if args.adapt is not None and args.seed is None:
+        adapt_results, adapt_cov = run_adaptive(rng, args.adapt, args.rand_runs, args.sim_cmd, sim_dir, out_dir, report_path,
+                                                args.jobs, args.timeout, bool(jobs))
+        results += adapt_results
+        if adapt_cov is not None:
+            if cov is None:
+                cov = adapt_cov
+            else:
+                cov.merge(adapt_cov)
+    print_summary(results, args.sim_cmd, time.monotonic() - start)
+
+    # 4. Coverage
+    if coverage:
+        if cov is None:
+            print('Warning: no coverage databases were saved')
+        else:
+            cov.save(args.out_dir / 'coverage.etcv')
+            print(get_report(cov))
+    exit(0 if all(result['status'] == 'PASS' for result in results) else 1)
+
+if __name__ == '__main__':
+    main()
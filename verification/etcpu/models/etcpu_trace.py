@@ -0,0 +1,110 @@
+'''
+Compact binary DUT trace:
+    1. TraceSink - records (cycle, pc, inst word, rd, wd, mem addr, mem data)
+       per active cycle as fixed-width little-endian records, the values sampled
+       from the DUT (see etcpu_ref.TraceMonitor): the instruction fetched on the
+       cycle and the register file / main memory writes of older ones
+    2. read_trace - iterates the records of a trace file
+    3. CLI - renders a trace file to text offline:
+        python -m models.etcpu_trace trace.etct [--first-cycle N] [--last-cycle N]
+'''
+import argparse
+import struct
+from typing import Iterator, NamedTuple
+from models.riscv_infra import inst_int2str
+
+TRACE_MAGIC = b'ETCT\x02\x00\x00\x00' # magic + format version
+# cycle, pc, inst, flags, rd, wd, mem addr, mem data
+TRACE_RECORD = struct.Struct('<IIIBBIII')
+TRACE_FLAG_RGF_WR = 0x1
+TRACE_FLAG_MM_WR = 0x2
+TRACE_FLAG_FETCH = 0x4
+TRACE_FLUSH_RECORDS = 4096 # records buffered before a write to the file
+
+class TraceRecord(NamedTuple):
+    cycle: int
+    pc: int
+    inst: int
+    flags: int
+    rd: int
+    wd: int
+    mm_addr: int
+    mm_data: int
+
+class TraceSink(object):
+    '''
+    Binary trace writer, records are buffered and written in blocks,
+    close_all closes every sink still open (used by close_test)
+    '''
+    open_sinks = []
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(TRACE_MAGIC)
+        self.buf = bytearray()
+        self.records_num = 0
+        TraceSink.open_sinks.append(self)
+
+    def record(self, cycle: int, pc: int=None, inst: int=0, rd: int=None, wd: int=0, mm_addr: int=None, mm_data: int=0):
+        '''
+        pc / rd / mm_addr are None when nothing is fetched / the RGF / main memory is not written on the cycle
+        '''
+        flags = (TRACE_FLAG_FETCH if pc is not None else 0) | (TRACE_FLAG_RGF_WR if rd is not None else 0) | (TRACE_FLAG_MM_WR if mm_addr is not None else 0)
+        self.buf += TRACE_RECORD.pack(cycle, pc or 0, inst, flags, rd or 0, wd, mm_addr or 0, mm_data)
+        self.records_num += 1
+        if self.records_num % TRACE_FLUSH_RECORDS == 0:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buf)
+        self.buf.clear()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.close()
+        TraceSink.open_sinks.remove(self)
+
+    @classmethod
+    def close_all(cls):
+        for sink in list(cls.open_sinks):
+            sink.close()
+
+def read_trace(path: str)->Iterator[TraceRecord]:
+    with open(path, 'rb') as file:
+        if file.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            print(f'Error: {path} is not an etcpu trace file')
+            exit(2)
+        while True:
+            chunk = file.read(TRACE_RECORD.size * TRACE_FLUSH_RECORDS)
+            if not chunk:
+                return
+            for fields in TRACE_RECORD.iter_unpack(chunk[:len(chunk) - len(chunk) % TRACE_RECORD.size]):
+                yield TraceRecord(*fields)
+
+def format_record(rec: TraceRecord)->str:
+    fetch = f'{hex(rec.pc).ljust(8)} {inst_int2str(rec.inst)}' if rec.flags & TRACE_FLAG_FETCH else ''
+    line = f'{str(rec.cycle).rjust(8)} : {fetch.ljust(33)}'
+    if rec.flags & TRACE_FLAG_RGF_WR:
+        line += f' x{str(rec.rd).ljust(2)} <= {hex(rec.wd)}'
+    if rec.flags & TRACE_FLAG_MM_WR:
+        line += f' MAIN_MEM[{hex(rec.mm_addr)}] <= {hex(rec.mm_data)}'
+    return line
+
+def main():
+    parser = argparse.ArgumentParser(description='render an etcpu binary trace to text')
+    parser.add_argument('path', help='trace file')
+    parser.add_argument('--first-cycle', type=int, default=0, help='skip records before this cycle')
+    parser.add_argument('--last-cycle', type=int, default=None, help='stop after this cycle')
+    args = parser.parse_args()
+    for rec in read_trace(args.path):
+        if rec.cycle < args.first_cycle:
+            continue
+        if args.last_cycle is not None and rec.cycle > args.last_cycle:
+            break
+        print(format_record(rec))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+'''
+Transaction types shared by the drivers, monitors and scoreboards:
+    1. RGFTrans - register file write
+    2. MMTrans  - main memory write
+    3. IMTrans  - instruction memory write / fetched instruction
+slotted, compared on their raw integers, log strings built on first use and cached,
+picklable (e.g. for trace export), no cocotb needed
+'''
+from models.riscv_infra import inst_int2str
+from models.riscv_asm import asm_line
+
+class RGFTrans(object):
+    '''
+    register file write transaction
+        1. Data
+        2. Register name
+    '''
+    __slots__ = ('data', 'reg_addr', '_log_msg')
+
+    def __init__(self, data: int, reg_addr: int):
+        self.data = data
+        self.reg_addr = reg_addr
+        self._log_msg = None
+
+    def get_log_message(self)->str:
+        if self._log_msg is None:
+            reg_num = ('x' + str(self.reg_addr)).ljust(3)
+            reg_val = (hex(self.data)).ljust(8)
+            self._log_msg = f' : {reg_num} <= {reg_val}'
+        return self._log_msg
+
+    def __eq__(self, other):
+        return (self.data == other.data) and (self.reg_addr == other.reg_addr)
+
+    def __hash__(self):
+        return hash((self.data, self.reg_addr))
+
+    def __getstate__(self):
+        return self.data, self.reg_addr
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __repr__(self):
+        return f'RGFTrans({hex(self.data)}, {self.reg_addr})'
+
+class MMTrans(object):
+    '''
+    Main memory write transaction
+        1. Data
+        2. Address
+    '''
+    __slots__ = ('data', 'address', '_log_msg')
+
+    def __init__(self, data: int, address: int):
+        self.data = data
+        self.address = address
+        self._log_msg = None
+
+    def get_log_message(self)->str:
+        if self._log_msg is None:
+            self._log_msg = f' : MAIN_MEM[{hex(self.address)}] <= {hex(self.data)}'
+        return self._log_msg
+
+    def __eq__(self, other):
+        return self.data==other.data and self.address==other.address
+
+    def __hash__(self):
+        return hash((self.data, self.address))
+
+    def __getstate__(self):
+        return self.data, self.address
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __repr__(self):
+        return f'MMTrans({hex(self.data)}, {hex(self.address)})'
+
+class IMTrans(object):
+    '''
+    Instruction memory transaction
+        1. Data
+        2. Address
+    an encoded instruction is disassembled only when inst_str is first read
+    '''
+    __slots__ = ('inst_int', 'address', '_inst_str', '_log_msg')
+
+    def __init__(self, inst: str | int, address: int):
+        if isinstance(inst, str):
+            self._inst_str = inst
+            self.inst_int = asm_line(inst)
+        else:
+            self._inst_str = None
+            self.inst_int = inst
+        self.address = address
+        self._log_msg = None
+
+    @property
+    def inst_str(self)->str:
+        if self._inst_str is None:
+            self._inst_str = inst_int2str(self.inst_int)
+        return self._inst_str
+
+    def get_log_message(self)->str:
+        if self._log_msg is None:
+            log_inst = f"{self.inst_str}".ljust(20)
+            self._log_msg = f' : {log_inst}                                     @ {hex(self.address)}'
+        return self._log_msg
+
+    def __eq__(self, other):
+        return self.inst_int == other.inst_int and self.address == other.address
+
+    def __hash__(self):
+        return hash((self.inst_int, self.address))
+
+    def __getstate__(self):
+        return self.inst_int, self.address
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __repr__(self):
+        return f'IMTrans({hex(self.inst_int)}, {hex(self.address)})'
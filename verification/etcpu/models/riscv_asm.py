@@ -0,0 +1,131 @@
+'''
+Program-level RV32I assembler:
+    1. Multi-line source, one instruction or directive per line
+    2. Comments start with '#' or '//'
+    3. Labels end with ':' and may share a line with an instruction,
+       jal and branch operands are PC-relative, any other use is the absolute byte address
+    4. Directives:
+        .word v[, v...] - raw 32-bit words
+        .fill n[, v]    - n copies of v, nop by default
+    5. Numbers may be given in any Python integer notation (4, -8, 0x10)
+every assembled line goes through a bounded LRU, so repeated lines are encoded once
+'''
+import re
+from functools import lru_cache
+from typing import List
+from models.riscv_infra import inst_str2int
+
+ASM_CACHE_SIZE = 4096
+NOP = inst_str2int('nop')
+PC_RELATIVE_INSTS = ('jal', 'beq', 'bne', 'blt', 'bge', 'bltu', 'bgeu')
+LABEL_RE = re.compile(r'^([A-Za-z_.][\w.]*)\s*:')
+SYMBOL_RE = re.compile(r'^[A-Za-z_.][\w.]*$')
+REGISTER_RE = re.compile(r'^x([0-9]|[12][0-9]|3[01])$')
+MEM_OPERAND_RE = re.compile(r'^(.+)\((\s*x\d+\s*)\)$')
+
+@lru_cache(maxsize=ASM_CACHE_SIZE)
+def asm_line(line: str)->int:
+    '''
+    cached inst_str2int for a single, label-free line
+    '''
+    return inst_str2int(line)
+
+def strip_comment(line: str)->str:
+    return line.split('#', 1)[0].split('//', 1)[0].strip()
+
+def asm_error(line_num: int, line: str, msg: str):
+    print(f'Error: line {line_num}: {msg}\n    {line}')
+    exit(2)
+
+def parse_int(value: str, labels: dict, line_num: int, line: str)->int:
+    value = value.strip()
+    if value in labels:
+        return labels[value]
+    try:
+        return int(value, 0)
+    except ValueError:
+        asm_error(line_num, line, f'{value} is neither a number nor a known label')
+
+def resolve_operand(operand: str, labels: dict, pc: int, pc_relative: bool, line_num: int, line: str)->str:
+    '''
+    replaces a label or a non-decimal number in an operand by the decimal value inst_str2int expects
+    '''
+    operand = operand.strip()
+    mem_operand = MEM_OPERAND_RE.match(operand)
+    if mem_operand:
+        imm = resolve_operand(mem_operand.group(1), labels, pc, False, line_num, line)
+        return f'{imm}({mem_operand.group(2).strip()})'
+    if REGISTER_RE.match(operand):
+        return operand
+    if SYMBOL_RE.match(operand):
+        if operand not in labels:
+            asm_error(line_num, line, f'undefined label {operand}')
+        return str(labels[operand] - pc if pc_relative else labels[operand])
+    return str(parse_int(operand, labels, line_num, line))
+
+def parse_lines(src: str)->list:
+    '''
+    splits the source into (line number, labels, statement) entries, the statement may be empty
+    '''
+    entries = []
+    for line_num, line in enumerate(src.splitlines(), start=1):
+        stmt, labels = strip_comment(line), []
+        label = LABEL_RE.match(stmt)
+        while label:
+            labels.append(label.group(1))
+            stmt = stmt[label.end():].strip()
+            label = LABEL_RE.match(stmt)
+        entries.append((line_num, labels, stmt))
+    return entries
+
+def get_words_num(stmt: str, labels: dict, line_num: int)->int:
+    '''
+    number of instruction memory words a statement takes
+    '''
+    if not stmt:
+        return 0
+    if stmt.startswith('.word'):
+        return stmt[len('.word'):].count(',') + 1
+    if stmt.startswith('.fill'):
+        return parse_int(stmt[len('.fill'):].split(',')[0], labels, line_num, stmt)
+    return 1
+
+def assemble(src: str, base_addr: int = 0)->List[int]:
+    '''
+    assembles a multi-line program placed at base_addr
+    returns its memory image, one instruction word per entry
+    '''
+    entries = parse_lines(src)
+
+    # 1. place labels
+    labels, addr = {}, base_addr
+    for line_num, line_labels, stmt in entries:
+        for label in line_labels:
+            if label in labels:
+                asm_error(line_num, stmt, f'label {label} defined twice')
+            labels[label] = addr
+        addr += get_words_num(stmt, labels, line_num) << 2
+
+    # 2. encode
+    image, addr = [], base_addr
+    for line_num, _, stmt in entries:
+        if not stmt:
+            continue
+        if stmt.startswith('.word'):
+            words = [parse_int(v, labels, line_num, stmt) & 0xffffffff for v in stmt[len('.word'):].split(',')]
+        elif stmt.startswith('.fill'):
+            args = stmt[len('.fill'):].split(',')
+            value = parse_int(args[1], labels, line_num, stmt) & 0xffffffff if len(args) > 1 else NOP
+            words = [value] * parse_int(args[0], labels, line_num, stmt)
+        elif stmt.startswith('.'):
+            asm_error(line_num, stmt, f'non-supported directive {stmt.split()[0]}')
+        else:
+            inst = stmt.split()[0]
+            operands = stmt[len(inst):].strip()
+            if operands:
+                pc_relative = inst in PC_RELATIVE_INSTS
+                operands = ', '.join(resolve_operand(op, labels, addr, pc_relative, line_num, stmt) for op in operands.split(','))
+            words = [asm_line(f'{inst} {operands}'.strip())]
+        image += words
+        addr += len(words) << 2
+    return image
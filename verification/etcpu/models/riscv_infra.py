@@ -1,5 +1,6 @@
-from typing import Tuple, List
-from math import floor
+from typing import Tuple, List, NamedTuple
+from functools import lru_cache
+from collections import deque
 import constraint
 import random
 
@@ -176,6 +177,86 @@ def add_reg(param_value: str, offset: int, running_sum: int)->int:
     reg_idx = int(param_value[1:])
     return running_sum + (reg_idx << offset)
 
+########################
+### bitfield helpers ###
+########################
+MASK32 = 0xFFFFFFFF
+
+# Instruction fields: name -> (lsb, mask)
+FIELD_OPCODE = (2, 0x1f) # inst[6:2], inst[1:0] is fixed to 2'b11
+FIELD_RD = (7, 0x1f)
+FIELD_FUNCT3 = (12, 0x7)
+FIELD_RS1 = (15, 0x1f)
+FIELD_RS2 = (20, 0x1f)
+FIELD_FUNCT7 = (25, 0x7f)
+
+# Immediate formats: imm_type -> (width, segments)
+# each segment is (inst lsb, segment width, imm lsb)
+IMM_FORMATS = {
+    'itype': (12, ((20, 12, 0),)),
+    'stype': (12, ((7, 5, 0), (25, 7, 5))),
+    'btype': (13, ((8, 4, 1), (25, 6, 5), (7, 1, 11), (31, 1, 12))),
+    'utype': (32, ((12, 20, 12),)),
+    'jtype': (21, ((21, 10, 1), (20, 1, 11), (12, 8, 12), (31, 1, 20))),
+}
+
+# Magnitude bits kept by the assembler per immediate type, the sign
+# always comes from the sign of the given value and lands on inst[31]
+IMM_ENC_MASKS = {
+    'itype': 0x7ff,
+    'itype_shamt': 0xf,
+    'stype': 0x7ff,
+    'btype': 0xffe,
+    'utype': 0xfffff,
+    'jtype': 0xffffe,
+}
+
+def get_field(word: int, field: Tuple[int, int])->int:
+    '''
+    extracts an unsigned field given as (lsb, mask) from a word
+    '''
+    return (word >> field[0]) & field[1]
+
+def sign_extend(value: int, width: int)->int:
+    '''
+    interprets the lower width bits of value as a 2's complement number
+    '''
+    sign = 1 << (width - 1)
+    return ((value & ((sign << 1) - 1)) ^ sign) - sign
+
+def decode_imm(word: int, imm_type: str)->int:
+    '''
+    gathers the immediate bits of an instruction word
+    and returns the sign-extended immediate
+    '''
+    width, segments = IMM_FORMATS[imm_type]
+    imm = 0
+    for inst_lsb, seg_width, imm_lsb in segments:
+        imm |= ((word >> inst_lsb) & ((1 << seg_width) - 1)) << imm_lsb
+    return sign_extend(imm, width)
+
+def encode_imm(imm_type: str, value: int, special_itype: bool=False)->int:
+    '''
+    scatters an immediate value into its instruction word position
+    '''
+    if imm_type=='utype':
+        # U-type immediates are given as the upper 20 bits value
+        value_bits = value & IMM_ENC_MASKS['utype']
+        segments = ((0, 20, 12),)
+    else:
+        value_bits = value & IMM_ENC_MASKS['itype_shamt' if special_itype else imm_type]
+        segments = tuple((imm_lsb, seg_width, inst_lsb) for inst_lsb, seg_width, imm_lsb in IMM_FORMATS[imm_type][1])
+    imm = 0
+    for val_lsb, seg_width, inst_lsb in segments:
+        imm |= ((value_bits >> val_lsb) & ((1 << seg_width) - 1)) << inst_lsb
+    if value < 0:
+        imm |= 1 << 31
+    return imm
+
+###################################################
+### list-of-bits helpers                        ###
+### kept as the reference for the bitfield ones ###
+###################################################
 def int_to_twos_complement(num, bit_length):
     # Handle negative numbers by adjusting to two's complement
     if num < 0:
@@ -235,40 +316,64 @@ def binary_array_to_int_reversed_2s_complement(binary_array: list) -> int:
     
     return result
 
+class DecodedInst(NamedTuple):
+    '''
+    RV32I instruction word decoded once into all of its fields:
+        1. word - the raw 32-bit instruction
+        2. opcode, funct3, funct7, rd, rs1, rs2 - unsigned fields
+        3. i_imm, s_imm, b_imm, u_imm, j_imm - immediates, already sign-extended
+    '''
+    word: int
+    opcode: int
+    funct3: int
+    funct7: int
+    rd: int
+    rs1: int
+    rs2: int
+    i_imm: int
+    s_imm: int
+    b_imm: int
+    u_imm: int
+    j_imm: int
+
+DECODE_CACHE_SIZE = 4096
+
+@lru_cache(maxsize=DECODE_CACHE_SIZE)
+def decode_inst(cmd_int: int)->DecodedInst:
+    '''
+    decodes an RV32I instruction word into a DecodedInst,
+    results are cached by the 32-bit word since the same
+    instructions are fetched over and over again
+    '''
+    w = cmd_int
+    # immediates are gathered with the masks of IMM_FORMATS, unrolled per format
+    return DecodedInst(
+        w,                                        # word
+        (w >> 2) & 0x1f,                          # opcode
+        (w >> 12) & 0x7,                          # funct3
+        (w >> 25) & 0x7f,                         # funct7
+        (w >> 7) & 0x1f,                          # rd
+        (w >> 15) & 0x1f,                         # rs1
+        (w >> 20) & 0x1f,                         # rs2
+        sign_extend(w >> 20, 12),                 # i_imm
+        sign_extend(((w >> 20) & 0xfe0) | ((w >> 7) & 0x1f), 12), # s_imm
+        sign_extend(((w >> 19) & 0x1000) | ((w << 4) & 0x800) | ((w >> 20) & 0x7e0) | ((w >> 7) & 0x1e), 13), # b_imm
+        sign_extend(w & 0xfffff000, 32),          # u_imm
+        sign_extend(((w >> 11) & 0x100000) | (w & 0xff000) | ((w >> 9) & 0x800) | ((w >> 20) & 0x7fe), 21), # j_imm
+    )
+
+def as_decoded(cmd: 'int | DecodedInst')->DecodedInst:
+    '''
+    accepts either a raw instruction word or an already decoded one
+    '''
+    return cmd if isinstance(cmd, DecodedInst) else decode_inst(cmd)
+
 def add_imm(imm_type: str, param_value: str, running_sum: int, special_itype: bool=False)->int:
     '''
     adds to the current running sum the 
     value specified by the given immediate
     '''
-    param_int = int(param_value)
-    if imm_type=='itype':
-        if special_itype:
-            param_abs = twos_complement_to_int(int_to_twos_complement(param_int, 5))
-        else:
-            param_abs = twos_complement_to_int(int_to_twos_complement(param_int, 12))
-        imm = param_abs<<20
-    elif imm_type=='stype':
-        param_abs = twos_complement_to_int(int_to_twos_complement(param_int, 12))
-        imm = ((param_abs % 32) << 7) + (floor(param_abs / 32) << 25)
-    elif imm_type=='btype':
-        param_abs = twos_complement_to_int(int_to_twos_complement(param_int, 13))
-        imm_12_1 = floor(param_abs / 2)
-        imm_12_5, imm_4_1 = floor(imm_12_1 / 16), imm_12_1 % 16 
-        imm_11_5 = imm_12_5 % 128
-        imm_11, imm_10_5 = floor(imm_11_5 / 64), imm_11_5 % 64
-        imm = (imm_11 << 7) + (imm_4_1 << 8) + (imm_10_5 << 25)
-    elif imm_type=='utype':
-        param_abs = twos_complement_to_int(int_to_twos_complement(param_int, 32))
-        imm = (param_abs % (2**20)) << 12
-    else: # jtype 
-        param_abs = twos_complement_to_int(int_to_twos_complement(param_int, 21))
-        imm_19_12, imm_11_0 = floor(param_abs / (2**12)), param_abs % (2**12)
-        imm_11_1 = floor(imm_11_0 / (2))
-        imm_11, imm_10_1 =  floor(imm_11_1 / (2**10)), imm_11_1 % (2**10)
-        imm = (imm_19_12 << 12) + (imm_11 << 20) + (imm_10_1 << 21)
-    if param_int<0:
-        imm += 1<<31
-    return running_sum + imm
+    return running_sum + encode_imm(imm_type, int(param_value), special_itype)
 
 def add_functs(running_sum: int, funct3: int=None, funct7: int=None)->int:
     if funct3:
@@ -308,14 +413,10 @@ def inst_str2int(cmd_str: str)->int:
 
     return cmd_bin
 
-def inst_int2str(cmd_int: int)->str:
-    inst_bin_arr = int_to_binary_array(cmd_int)
-    opcode = binary_array_to_int(inst_bin_arr[2:7])
-    funct3 = binary_array_to_int(inst_bin_arr[12:15])
-    rd = binary_array_to_int(inst_bin_arr[7:12])
-    rs1 = binary_array_to_int(inst_bin_arr[15:20])
-    rs2 = binary_array_to_int(inst_bin_arr[20:25])
-    funct7 = binary_array_to_int(inst_bin_arr[25:])
+def inst_int2str(cmd: 'int | DecodedInst')->str:
+    inst = as_decoded(cmd)
+    opcode, funct3, funct7 = inst.opcode, inst.funct3, inst.funct7
+    rd, rs1, rs2 = inst.rd, inst.rs1, inst.rs2
     rtype, stype, jtype, itype, btype, utype  = [12], [8], [27], [0, 25, 4], [24], [13, 5]
     # Rtype Instruction
     if opcode in rtype: 
@@ -347,7 +448,7 @@ def inst_int2str(cmd_int: int)->str:
             exit(1)
     # Stype instruction
     elif opcode in stype:
-        imm = binary_array_to_int_reversed_2s_complement(inst_bin_arr[7:12] + inst_bin_arr[25:])
+        imm = inst.s_imm
         if funct3==i_sb['funct3']:
             inst_str = 'sb '
         elif funct3==i_sh['funct3']:
@@ -360,14 +461,14 @@ def inst_int2str(cmd_int: int)->str:
         return inst_str + f'x{rs2}, {imm}(x{rs1})'
     # Jtype inst
     elif opcode in jtype:
-        imm = binary_array_to_int_reversed_2s_complement([0] + inst_bin_arr[21:31] + [inst_bin_arr[20]] + inst_bin_arr[12:20] + [inst_bin_arr[31]])
+        imm = inst.j_imm
         return f'jal x{rd}, {imm}'
     # Itype inst
     elif opcode in itype:
-        if funct3==5:
-            imm = binary_array_to_int_reversed_2s_complement(inst_bin_arr[20:25])
+        if opcode==4 and funct3==5:
+            imm = ((inst.i_imm & 0x1f) ^ 0x10) - 0x10 # 5-bit shift amount, shown signed
         else:
-            imm = binary_array_to_int_reversed_2s_complement(inst_bin_arr[20:])
+            imm = inst.i_imm
         if opcode==4: # register-immediate calculations
             if funct3==i_addi['funct3']:
                 return f'addi x{rd}, x{rs1}, {imm}'
@@ -411,7 +512,7 @@ def inst_int2str(cmd_int: int)->str:
             exit(1)
     # Btype inst
     elif opcode in btype:
-        imm = binary_array_to_int_reversed_2s_complement([0] + inst_bin_arr[8:12] + inst_bin_arr[25:31] + [inst_bin_arr[7]] + [inst_bin_arr[31]])
+        imm = inst.b_imm
         if funct3==i_beq['funct3']:
             inst_str = 'beq '
         elif funct3==i_bge['funct3']:
@@ -430,7 +531,7 @@ def inst_int2str(cmd_int: int)->str:
         return inst_str + f'x{rs1}, x{rs2}, {imm}'
     # Utype inst
     elif opcode in utype:
-        imm = binary_array_to_int_reversed_2s_complement(inst_bin_arr[12:])
+        imm = inst.u_imm >> 12
         if opcode==i_lui['opcode']:
             return f'lui x{rd}, {imm}'
         elif opcode==i_auipc['opcode']:
@@ -443,22 +544,17 @@ def inst_int2str(cmd_int: int)->str:
         print(f'error, found a non-supported opcode {opcode}')
         exit(2)
 
-def inst_int2rgfexp(cmd_int: int, rgf_state: List[int], mm_state: List[int], next_pc: int)->Tuple[bool, int, int, List[int]]:
+def inst_int2rgfexp(cmd: 'int | DecodedInst', rgf_state: List[int], mm_state: List[int], next_pc: int)->Tuple[bool, int, int]:
     '''
-    This function gets lists of the current RGF and main memory states and a RV32I command and returns:
+    This function gets lists of the current RGF and main memory states and a RV32I command (raw or decoded) and returns:
         1. wen (bool) - write-enable signal to the RGF
         2. wa (int) - pointer to the register that should be written
         3. wd (int) - write data to the register that should be written
-        4. rgf_next_state (List[int]) - next state of the register file as a result of the write
-    '''
-    inst_bin_arr = int_to_binary_array(cmd_int)
-    opcode = binary_array_to_int(inst_bin_arr[2:7])
-    funct3 = binary_array_to_int(inst_bin_arr[12:15])
-    wa = binary_array_to_int(inst_bin_arr[7:12])
-    rs1 = binary_array_to_int(inst_bin_arr[15:20])
-    rs2 = binary_array_to_int(inst_bin_arr[20:25])
-    funct7 = binary_array_to_int(inst_bin_arr[25:])
-    rgf_next_state = rgf_state.copy() 
+    the states are not modified, the caller applies the write (rgf_state[wa] = wd when wen)
+    '''
+    inst = as_decoded(cmd)
+    opcode, funct3, funct7 = inst.opcode, inst.funct3, inst.funct7
+    wa, rs1, rs2 = inst.rd, inst.rs1, inst.rs2
     rtype, stype, jtype, itype, btype, utype  = [12], [8], [27], [0, 25, 4], [24], [13, 5]
     # Rtype Instruction
     if opcode in rtype: 
@@ -476,12 +572,8 @@ def inst_int2rgfexp(cmd_int: int, rgf_state: List[int], mm_state: List[int], nex
         elif funct3==i_sltu['funct3'] and funct7==i_sltu['funct7']:
             wd = 1 if (rgf_state[rs1] < rgf_state[rs2]) else 0
         elif funct3==i_slt['funct3'] and funct7==i_slt['funct7']:
-            rs1_arr = int_to_binary_array(rgf_state[rs1])
-            rs2_arr = int_to_binary_array(rgf_state[rs2])
-            rs1_signbit = rs1_arr[31]
-            rs2_signbit = rs2_arr[31]
-            rs1_abs_val = binary_array_to_int(rs1_arr[:31])
-            rs2_abs_val = binary_array_to_int(rs2_arr[:31])
+            rs1_signbit, rs1_abs_val = rgf_state[rs1] >> 31, rgf_state[rs1] & 0x7fffffff
+            rs2_signbit, rs2_abs_val = rgf_state[rs2] >> 31, rgf_state[rs2] & 0x7fffffff
             if rs1_signbit==rs2_signbit:
                 wd = 1 if (rs1_abs_val < rs2_abs_val) else 0 
             else:
@@ -491,7 +583,7 @@ def inst_int2rgfexp(cmd_int: int, rgf_state: List[int], mm_state: List[int], nex
         elif funct3==i_srl['funct3'] and funct7==i_srl['funct7']:
             wd = (rgf_state[rs1] & 0xFFFFFFFF) >> (rgf_state[rs2] % 32)
         elif funct3==i_sra['funct3'] and funct7==i_sra['funct7']:
-            wd = rgf_state[rs1] >> (rgf_state[rs2] % 32)
+            wd = sign_extend(rgf_state[rs1], 32) >> (rgf_state[rs2] % 32)
         elif funct3==i_or['funct3'] and funct7==i_or['funct7']:
             wd = rgf_state[rs1] | rgf_state[rs2]
         elif funct3==i_and['funct3'] and funct7==i_and['funct7']:
@@ -501,8 +593,8 @@ def inst_int2rgfexp(cmd_int: int, rgf_state: List[int], mm_state: List[int], nex
             exit(1)
     # Itype Instruction
     elif opcode in itype:
-        imm = binary_array_to_int_reversed_2s_complement(inst_bin_arr[20:])
-        shift_imm = binary_array_to_int(inst_bin_arr[20:25])
+        imm = inst.i_imm
+        shift_imm = imm & 0x1f
         wen = True
         if opcode==4: # register-immediate calculations
             if funct3==i_addi['funct3']:
@@ -510,11 +602,9 @@ def inst_int2rgfexp(cmd_int: int, rgf_state: List[int], mm_state: List[int], nex
             elif funct3==i_sltiu['funct3']:
                 wd = 1 if (rgf_state[rs1] < imm) else 0 
             elif funct3==i_slti['funct3']:
-                rs1_arr = int_to_binary_array(rgf_state[rs1])
-                rs1_signbit = rs1_arr[31]
+                rs1_signbit, rs1_abs_val = rgf_state[rs1] >> 31, rgf_state[rs1] & 0x7fffffff
                 imm_signbit = 1 if imm < 0 else 0 
-                rs1_abs_val = binary_array_to_int(rs1_arr[:31])
-                imm_abs_val = binary_array_to_int(inst_bin_arr[20:32])
+                imm_abs_val = imm & 0xfff
                 if rs1_signbit==imm_signbit:
                     wd = 1 if (rs1_abs_val < imm_abs_val) else 0 
                 else:
@@ -530,7 +620,7 @@ def inst_int2rgfexp(cmd_int: int, rgf_state: List[int], mm_state: List[int], nex
             elif funct3==i_srli['funct3'] and funct7==i_srli['funct7']:
                 wd = (rgf_state[rs1] & 0xFFFFFFFF) >> shift_imm 
             elif funct3==i_srai['funct3'] and funct7==i_srai['funct7']:
-                wd = rgf_state[rs1] >> shift_imm 
+                wd = sign_extend(rgf_state[rs1], 32) >> shift_imm 
             else:
                 print(f'error, found a non-existing funct3=({funct3}) and funct7=({funct7}) combination for register-immediate operation')
                 exit(1)
@@ -567,7 +657,7 @@ def inst_int2rgfexp(cmd_int: int, rgf_state: List[int], mm_state: List[int], nex
         wd = next_pc
     # Utype Instruction
     elif opcode in utype:
-        imm = binary_array_to_int_reversed_2s_complement([0]*12 + inst_bin_arr[12:])
+        imm = inst.u_imm
         if opcode==13: # lui
             wen = True
             wd = imm 
@@ -588,28 +678,23 @@ def inst_int2rgfexp(cmd_int: int, rgf_state: List[int], mm_state: List[int], nex
         wen = 0
     if wd < 0:
          wd = (1 << 32) + wd
-    wd = wd % 2**32
-    if wen:
-        rgf_next_state[wa] = wd
-    return wen, wa, wd, rgf_next_state
+    wd = wd & MASK32
+    return wen, wa, wd
 
-def inst_int2mmexp(cmd_int: int, rgf_state: List[int], mm_state: List[int])->Tuple[bool, int, int, List[int], bool, bool]:
+def inst_int2mmexp(cmd: 'int | DecodedInst', rgf_state: List[int], mm_state: List[int])->Tuple[bool, int, int, bool, bool]:
     '''
-    This function gets lists of the current RGF and main memory states and a RV32I command and returns:
+    This function gets lists of the current RGF and main memory states and a RV32I command (raw or decoded) and returns:
         1. wen (bool) - write-enable signal
-        2. wa (int) - memory write address
+        2. wa (int) - memory write (byte) address
         3. wd (int) - memory write data
-        4. mm_next_state (List[int]) - next state of the main memory as a result of the write
+        4. exc_main_mis (bool) - misaligned main memory access exception
+        5. exc_main_oob (bool) - out-of-bounds main memory access exception
+    the states are not modified, the caller applies the write (mm_state[wa >> 2] = wd when wen)
     '''
     exc_main_oob, exc_main_mis = False, False
-    inst_bin_arr = int_to_binary_array(cmd_int)
-    opcode = binary_array_to_int(inst_bin_arr[2:7])
-    rs1 = binary_array_to_int(inst_bin_arr[15:20])
-    rs2 = binary_array_to_int(inst_bin_arr[20:25])
-    f3 = binary_array_to_int(inst_bin_arr[12:15])
-    stype_imm = binary_array_to_int_reversed_2s_complement(inst_bin_arr[7:12] + inst_bin_arr[25:])
-    itype_imm = binary_array_to_int_reversed_2s_complement(inst_bin_arr[20:])
-    mm_next_state = mm_state.copy() 
+    inst = as_decoded(cmd)
+    opcode, rs1, rs2, f3 = inst.opcode, inst.rs1, inst.rs2, inst.funct3
+    stype_imm, itype_imm = inst.s_imm, inst.i_imm
     
     # update the output write interface and mem next state
     wa = (rgf_state[rs1] + stype_imm)
@@ -634,71 +719,71 @@ def inst_int2mmexp(cmd_int: int, rgf_state: List[int], mm_state: List[int])->Tup
         exc_main_oob = True
     
     wen = 1 if opcode==8 and (not exc_main_mis) and (not exc_main_oob) else 0
-    if wen:
-        virt_addr = wa >> 2
-        mm_next_state[virt_addr] = wd 
 
-    return wen, wa, wd, mm_next_state, exc_main_mis, exc_main_oob
+    return wen, wa, wd, exc_main_mis, exc_main_oob
 
-def inst_int2pcexp(cmd_int: int, rgf_state: List[int], curr_pc: int, intrlock: int, mem_depth: int)->Tuple[int, bool, bool, bool]:
+def get_branch_taken(inst: DecodedInst, rgf_state: List[int])->bool:
+    '''
+    True if the B-type instruction is taken with the given RGF state
     '''
-    This function gets lists of the current RGF and main memory states and a RV32I command and returns:
+    funct3, rs1, rs2 = inst.funct3, inst.rs1, inst.rs2
+    rs1_signbit, rs1_abs_val = rgf_state[rs1] >> 31, rgf_state[rs1] & 0x7fffffff
+    rs2_signbit, rs2_abs_val = rgf_state[rs2] >> 31, rgf_state[rs2] & 0x7fffffff
+    if funct3==i_beq['funct3']:
+        branch_actually_taken = (rgf_state[rs1]==rgf_state[rs2])
+    elif funct3==i_bge['funct3']:
+        if rs1_signbit==rs2_signbit:
+            branch_actually_taken = (rgf_state[rs1]>=rgf_state[rs2])
+        else:
+            branch_actually_taken = bool(rs2_signbit)
+    elif funct3==i_bgeu['funct3']:
+        if rs1_signbit==rs2_signbit:
+            branch_actually_taken = rs1_abs_val >= rs2_abs_val
+        else:
+            branch_actually_taken = bool(rs1_signbit)
+    elif funct3==i_blt['funct3']:
+        if rs1_signbit==rs2_signbit:
+            branch_actually_taken = (rgf_state[rs1]<rgf_state[rs2])
+        else:
+            branch_actually_taken = bool(rs1_signbit)
+    elif funct3==i_bltu['funct3']:
+        if rs1_signbit==rs2_signbit:
+            branch_actually_taken = rs1_abs_val < rs2_abs_val
+        else:
+            branch_actually_taken = bool(rs2_signbit)
+    elif funct3==i_bne['funct3']:
+        branch_actually_taken = (rgf_state[rs1]!=rgf_state[rs2])
+    else:
+        print(f'error, found a non-supported f3 for B-type inst: funct3={funct3}')
+        exit(1)
+    return branch_actually_taken
+
+def inst_int2pcexp(cmd: 'int | DecodedInst', rgf_state: List[int], curr_pc: int, intrlock: int, mem_depth: int, guess: Tuple[bool, int]=None)->Tuple[int, bool, bool, bool]:
+    '''
+    This function gets lists of the current RGF and main memory states and a RV32I command (raw or decoded) and returns:
         1. next_pc (int) - next program counter value
         2. flush (bool) - True if the expected branch prediction should fail and a flush should occur
+    guess is the fetch stage prediction of the instruction, BranchPredictor.guess, the static
+    policy if not given (backward branches taken, jalr never predicted)
     '''
     exc_inst_mis, exc_inst_oob = False, False
     if intrlock==1:
         return curr_pc, False, False, False
     jtype, btype = 27, 24
-    inst_bin_arr = int_to_binary_array(cmd_int)
-    opcode = binary_array_to_int(inst_bin_arr[2:7])
-    funct3 = binary_array_to_int(inst_bin_arr[12:15])
-    rs1 = binary_array_to_int(inst_bin_arr[15:20])
-    rs2 = binary_array_to_int(inst_bin_arr[20:25])
-    rs1_arr = int_to_binary_array(rgf_state[rs1])
-    rs2_arr = int_to_binary_array(rgf_state[rs2])
-    rs1_signbit = rs1_arr[31]
-    rs2_signbit = rs2_arr[31]
-    rs1_abs_val = binary_array_to_int(rs1_arr[:31])
-    rs2_abs_val = binary_array_to_int(rs2_arr[:31])
+    inst = as_decoded(cmd)
+    opcode, funct3, rs1 = inst.opcode, inst.funct3, inst.rs1
     if opcode == jtype:
-        imm = binary_array_to_int_reversed_2s_complement([0] + inst_bin_arr[21:31] + [inst_bin_arr[20]] + inst_bin_arr[12:20] + [inst_bin_arr[31]])
+        imm = inst.j_imm
         next_pc = curr_pc + imm
         flush = False
     elif opcode == i_jalr['opcode'] and funct3 == i_jalr['funct3']:
-        imm = binary_array_to_int_reversed_2s_complement(inst_bin_arr[20:])
+        imm = inst.i_imm
         next_pc = rgf_state[rs1] + imm
-        flush = True
+        flush = guess is None or not guess[0] or guess[1] != next_pc & 0xffffffff
     elif opcode == btype:
-        imm = binary_array_to_int_reversed_2s_complement([0] + inst_bin_arr[8:12] + inst_bin_arr[25:31] + [inst_bin_arr[7]] + [inst_bin_arr[31]])
-        branch_predictor_guess = (imm < 0)
-        if funct3==i_beq['funct3']:
-            branch_actually_taken = (rgf_state[rs1]==rgf_state[rs2])
-        elif funct3==i_bge['funct3']:
-            if rs1_signbit==rs2_signbit:
-                branch_actually_taken = (rgf_state[rs1]>=rgf_state[rs2])
-            else:
-                branch_actually_taken = bool(rs2_signbit)
-        elif funct3==i_bgeu['funct3']:
-            if rs1_signbit==rs2_signbit:
-                branch_actually_taken = rs1_abs_val >= rs2_abs_val
-            else:
-                branch_actually_taken = bool(rs1_signbit)
-        elif funct3==i_blt['funct3']:
-            if rs1_signbit==rs2_signbit:
-                branch_actually_taken = (rgf_state[rs1]<rgf_state[rs2])
-            else:
-                branch_actually_taken = bool(rs1_signbit)
-        elif funct3==i_bltu['funct3']:
-            if rs1_signbit==rs2_signbit:
-                branch_actually_taken = rs1_abs_val < rs2_abs_val
-            else:
-                branch_actually_taken = bool(rs2_signbit)
-        elif funct3==i_bne['funct3']:
-            branch_actually_taken = (rgf_state[rs1]!=rgf_state[rs2])
-        else:
-            print(f'error, found a non-supported f3 for B-type inst: funct3={funct3}')
-            exit(1)
+        imm = inst.b_imm
+        branch_predictor_guess = (imm < 0) if guess is None else guess[0]
+        branch_actually_taken = get_branch_taken(inst, rgf_state)
         next_pc = curr_pc + imm if branch_actually_taken else curr_pc + 4
         flush = branch_actually_taken != branch_predictor_guess
     else:
@@ -715,9 +800,102 @@ def inst_int2pcexp(cmd_int: int, rgf_state: List[int], curr_pc: int, intrlock: i
 
     return next_pc, flush, exc_inst_mis, exc_inst_oob
 
-def get_rand_inst(opcode_probs: dict, avoid_exceptions: bool=True, running_addr: int=0, inst_mem_depth: int=0x100, main_mem_depth: int=0x100):
+BHT_INIT = 1 # BHT counters reset to weakly not-taken
+BP_UPDATE_CYCLES = 3 # the execute stage trains the predictor, seen by the fetches 3 cycles after the instruction's
+
+class BPConfig(NamedTuple):
     '''
-    Generate a random instruction
+    fetch branch predictor parameters of etcpu_top.v (BP_DYNAMIC, BHT_IDX_W, BTB_IDX_W)
+    '''
+    dynamic: bool = True
+    bht_idx_w: int = 6
+    btb_idx_w: int = 3
+
+class BranchPredictor(object):
+    '''
+    Model of fetch_branch_pred.v, the guess argument of inst_int2pcexp:
+        1. guess - (taken, jalr target) predicted for the instruction fetched at pc on the given cycle,
+           None for the static policy
+        2. resolve - trains the predictor with the actual outcome of the instruction, its update is
+           seen from the given cycle on (BP_UPDATE_CYCLES after its fetch, the RTL trains from execute)
+        3. stall - the instruction fetched on the previous cycle waits a cycle in decode, so does its update
+    dynamic: a BHT of 2-bit saturating counters indexed by PC for the branches and a direct-mapped
+    BTB tagged by PC for the jalr targets (in range, aligned ones only), static: backward branches taken
+    and jalr never predicted
+    '''
+    def __init__(self, config: BPConfig=BPConfig(), inst_mem_depth: int=0x100):
+        self.config = config
+        self.inst_mem_depth = inst_mem_depth
+        self.bht_mask = (1 << config.bht_idx_w) - 1
+        self.btb_mask = (1 << config.btb_idx_w) - 1
+        self.reset()
+
+    def reset(self):
+        self.bht = [BHT_INIT] * (self.bht_mask + 1)
+        self.btb = [None] * (self.btb_mask + 1) # (pc, target) of the latest jalr per index
+        self.pending = deque() # (cycle, pc, jalr, taken or target) updates not seen yet
+
+    def _apply(self, cycle: int):
+        pending = self.pending
+        while pending and pending[0][0] <= cycle:
+            _, pc, jalr, outcome = pending.popleft()
+            if jalr:
+                self.btb[(pc >> 2) & self.btb_mask] = (pc, outcome)
+            else:
+                idx = (pc >> 2) & self.bht_mask
+                self.bht[idx] = min(self.bht[idx] + 1, 3) if outcome else max(self.bht[idx] - 1, 0)
+
+    def guess(self, inst: DecodedInst, pc: int, cycle: int)->Tuple[bool, int]:
+        if not self.config.dynamic:
+            return None
+        self._apply(cycle)
+        if inst.opcode == i_beq['opcode']:
+            return (self.bht[(pc >> 2) & self.bht_mask] >= 2, None)
+        if inst.opcode == i_jalr['opcode']:
+            entry = self.btb[(pc >> 2) & self.btb_mask]
+            return (True, entry[1]) if entry is not None and entry[0] == pc else (False, None)
+        return None
+
+    def resolve(self, inst: DecodedInst, pc: int, rgf_state: List[int], cycle: int):
+        if not self.config.dynamic:
+            return
+        if inst.opcode == i_beq['opcode']:
+            self.pending.append((cycle, pc, False, get_branch_taken(inst, rgf_state)))
+        elif inst.opcode == i_jalr['opcode']:
+            target = (rgf_state[inst.rs1] + inst.i_imm) & 0xffffffff
+            if target & 0x3 == 0 and target < (self.inst_mem_depth << 2):
+                self.pending.append((cycle, pc, True, target))
+
+    def stall(self, cycle: int):
+        pending = self.pending
+        if pending and pending[-1][0] == cycle - 1 + BP_UPDATE_CYCLES:
+            pending[-1] = (pending[-1][0] + 1,) + pending[-1][1:]
+
+BRANCH_FUNCT3 = {'beq': 0, 'bne': 1, 'blt': 4, 'bge': 5, 'bltu': 6, 'bgeu': 7}
+
+def get_rand_reg(opcode_probs: dict)->int:
+    reg_weights = opcode_probs.get('reg_weights')
+    return random.randint(0,31) if reg_weights is None else random.choices(range(32), weights=reg_weights, k=1)[0]
+
+def get_rand_src_reg(opcode_probs: dict, reg_hist: List[int])->int:
+    '''
+    a register one of the last instructions wrote (reg_hist, latest first) with probability rs_reuse,
+    their distance drawn with the raw_dist [EX, MA, WB] weights, a random register otherwise
+    '''
+    if reg_hist and 'rs_reuse' in opcode_probs and random.random() < opcode_probs['rs_reuse']:
+        dist_weights = opcode_probs.get('raw_dist', [1, 1, 1])[:len(reg_hist)]
+        return reg_hist[random.choices(range(len(dist_weights)), weights=dist_weights, k=1)[0]]
+    return get_rand_reg(opcode_probs)
+
+def get_rand_inst(opcode_probs: dict, avoid_exceptions: bool=True, running_addr: int=0, inst_mem_depth: int=0x100, main_mem_depth: int=0x100, reg_hist: List[int]=None):
+    '''
+    Generate a random instruction, returns the encoded instruction
+    use inst_int2str to disassemble it, only where it is actually printed
+    opcode_probs may also hold the knobs of models.etcpu_adapt, the draws they replace are unchanged without them:
+        1. btype_funct3 - {branch name: weight}, beq / bne / blt / bge equally likely otherwise
+        2. btype_bwd - probability of a backward branch, branches only go forward with avoid_exceptions otherwise
+        3. reg_weights - weights of the 32 register numbers
+        4. rs_reuse, raw_dist - source register reuse of the destinations in reg_hist, see get_rand_src_reg
     '''
     running_addr = running_addr >> 2
     # 0. choose opcode
@@ -736,11 +914,11 @@ def get_rand_inst(opcode_probs: dict, avoid_exceptions: bool=True, running_addr:
     else:
         op = random.choice(opcode_dict[op_type])
     # 1. randomize RD
-    rd = 0 if op in opcode_dict['btype'] or op in opcode_dict['stype'] else random.randint(0,31)
+    rd = 0 if op in opcode_dict['btype'] or op in opcode_dict['stype'] else get_rand_reg(opcode_probs)
     # 2. randomize RS1
-    rs1 = 0 if op in opcode_dict['utype'] or op in opcode_dict['jtype'] or ((op==0 or op==8 or op==25) and avoid_exceptions) else random.randint(0,31)
+    rs1 = 0 if op in opcode_dict['utype'] or op in opcode_dict['jtype'] or ((op==0 or op==8 or op==25) and avoid_exceptions) else get_rand_src_reg(opcode_probs, reg_hist)
     # 3. randomize RS2 
-    rs2 = 0 if op in opcode_dict['utype'] or op in opcode_dict['jtype']  or op in opcode_dict['itype'] else random.randint(0,31)
+    rs2 = 0 if op in opcode_dict['utype'] or op in opcode_dict['jtype']  or op in opcode_dict['itype'] else get_rand_src_reg(opcode_probs, reg_hist)
     # 4. randomize FUNCT3
     if op in opcode_dict['utype'] or op in opcode_dict['jtype'] or op==25 or op==27:
         f3 = 0 
@@ -748,14 +926,20 @@ def get_rand_inst(opcode_probs: dict, avoid_exceptions: bool=True, running_addr:
         f3 = random.choice([i for i in range(0,6) if i not in [3]]) 
     elif op_type=='store':
         f3 = random.randint(0,2)
+    elif op in opcode_dict['btype'] and 'btype_funct3' in opcode_probs:
+        btype_funct3 = opcode_probs['btype_funct3']
+        f3 = BRANCH_FUNCT3[random.choices(list(btype_funct3), weights=list(btype_funct3.values()), k=1)[0]]
     elif op in opcode_dict['btype']: 
         f3 = random.choice([i for i in range(0,6) if i not in [2,3]]) 
     else:
-        f3 = random.randint(0,8)
+        f3 = random.randint(0,7)
     # 5. randomize FUNCT7
-    f7 = 0 if not (op in opcode_dict['itype'] and f3==5 or op in opcode_dict['rtype'] and (f3==0 or f3==5)) else random.choice([0,32]) 
+    f7 = 0 if not (op==4 and f3==5 or op in opcode_dict['rtype'] and (f3==0 or f3==5)) else random.choice([0,32]) 
     # 6. Randomize IMM
-    if op in opcode_dict['btype']:
+    if op in opcode_dict['btype'] and avoid_exceptions and running_addr and 'btype_bwd' in opcode_probs and random.random() < opcode_probs['btype_bwd']:
+        imm = -(random.randint(1, min(running_addr, 1024)) << 2)
+        imm_type = 'btype'
+    elif op in opcode_dict['btype']:
         imm = (((random.randint(1, max((inst_mem_depth-running_addr) >> 2, 2))) << 2)) if avoid_exceptions else ((random.randint(0, 2**12-1)) << 1)
         imm_type = 'btype'
     elif op in opcode_dict['itype']:
@@ -782,6 +966,4 @@ def get_rand_inst(opcode_probs: dict, avoid_exceptions: bool=True, running_addr:
         print(f'solver returned an unknown opcode {op}')
         exit(1)  
     i = 3 + (op << 2) + (rd << 7) + (f3 << 12) + (rs1 << 15) + (rs2 << 20) + (f7 << 25)
-    inst_int = add_imm(imm_type, imm, i, special_itype=(op==4 and f3==5))
-    inst_str = inst_int2str(inst_int)
-    return inst_int, inst_str
\ No newline at end of file
+    return add_imm(imm_type, imm, i, special_itype=(op==4 and f3==5))
\ No newline at end of file
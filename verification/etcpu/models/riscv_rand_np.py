@@ -0,0 +1,128 @@
+'''
+NumPy batch generator of random RV32I programs:
+    1. Follows the get_rand_inst distribution, a whole program per call,
+       including the models.etcpu_adapt knobs of opcode_probs
+    2. Returns the encoded instructions as a uint32 array, ready for
+       IMDriver.load_image (backdoor) or IMDriver._driver_send word by word
+numpy is only needed by this module
+'''
+import numpy as np
+from models.riscv_infra import BRANCH_FUNCT3, IMM_FORMATS, IMM_ENC_MASKS
+
+OP_TYPES = ('itype', 'rtype', 'store', 'load', 'jalr', 'jal', 'btype')
+ITYPE, RTYPE, STORE, LOAD, JALR, JAL, BTYPE = range(len(OP_TYPES))
+OP_TYPE_OPCODES = np.array([4, 12, 8, 0, 25, 27, 24], dtype=np.int64)
+LOAD_FUNCT3 = np.array([0, 1, 2, 4, 5], dtype=np.int64)
+BTYPE_FUNCT3 = np.array([0, 1, 4, 5], dtype=np.int64)
+REG_HIST_LEN = 3 # destinations of the last instructions a source register may reuse, like IMDriver.reg_hist
+
+def encode_imms(imm_type: str, values: np.ndarray, special_itype: np.ndarray=None)->np.ndarray:
+    '''
+    vectorized encode_imm
+    '''
+    bits = values & IMM_ENC_MASKS[imm_type]
+    if special_itype is not None:
+        bits = np.where(special_itype, values & IMM_ENC_MASKS['itype_shamt'], bits)
+    imm = np.zeros_like(values)
+    for inst_lsb, seg_width, imm_lsb in IMM_FORMATS[imm_type][1]:
+        imm |= ((bits >> imm_lsb) & ((1 << seg_width) - 1)) << inst_lsb
+    return imm | np.where(values < 0, 1 << 31, 0)
+
+def get_rand_regs(rng: np.random.Generator, num: int, opcode_probs: dict)->np.ndarray:
+    '''
+    vectorized get_rand_reg
+    '''
+    reg_weights = opcode_probs.get('reg_weights')
+    if reg_weights is None:
+        return rng.integers(0, 31, size=num, endpoint=True)
+    weights = np.array(reg_weights, dtype=np.float64)
+    return rng.choice(32, size=num, p=weights / weights.sum())
+
+def get_rand_src_regs(rng: np.random.Generator, num: int, opcode_probs: dict, rd: np.ndarray)->np.ndarray:
+    '''
+    vectorized get_rand_src_reg, the history of an instruction is the rd of the ones before it in the program
+    (0 for stores and branches), empty for the first one
+    '''
+    regs = get_rand_regs(rng, num, opcode_probs)
+    if 'rs_reuse' not in opcode_probs:
+        return regs
+    weights = np.array(opcode_probs.get('raw_dist', [1, 1, 1]), dtype=np.float64)[:REG_HIST_LEN]
+    reuse = rng.random(num) < opcode_probs['rs_reuse']
+    dist = rng.choice(len(weights), size=num, p=weights / weights.sum())
+    for idx in range(min(num, len(weights))):
+        # shorter history, the distance drawn from the weights it has
+        if idx == 0 or not weights[:idx].any():
+            reuse[idx] = False
+        elif dist[idx] >= idx:
+            dist[idx] = rng.choice(idx, p=weights[:idx] / weights[:idx].sum())
+    src = np.arange(num) - 1 - dist
+    return np.where(reuse, rd[np.maximum(src, 0)], regs)
+
+def get_rand_insts(num: int, opcode_probs: dict, avoid_exceptions: bool=True, running_addr: int=0,
+                   inst_mem_depth: int=0x100, main_mem_depth: int=0x100, seed: int=None)->np.ndarray:
+    '''
+    Generate num random instructions to be loaded from running_addr on,
+    the address constraints of every instruction use its own address
+    (wrapping at the end of the instruction memory like IMDriver),
+    the same seed always returns the same program
+    '''
+    rng = np.random.default_rng(seed)
+    randint = lambda low, high: rng.integers(low, high, size=num, endpoint=True) # inclusive, like random.randint
+
+    # 0. choose opcode
+    weights = np.array([opcode_probs[op_type] for op_type in OP_TYPES], dtype=np.float64)
+    op_type = rng.choice(len(OP_TYPES), size=num, p=weights / weights.sum())
+    op = OP_TYPE_OPCODES[op_type]
+    is_itype, is_rtype, is_store, is_load = op_type==ITYPE, op_type==RTYPE, op_type==STORE, op_type==LOAD
+    is_jalr, is_jal, is_btype = op_type==JALR, op_type==JAL, op_type==BTYPE
+    inst_addr = ((running_addr >> 2) + np.arange(num, dtype=np.int64)) % inst_mem_depth
+    # 1. randomize RD
+    rd = np.where(is_btype | is_store, 0, get_rand_regs(rng, num, opcode_probs))
+    # 2. randomize RS1
+    rs1 = np.where(is_jal | ((is_load | is_store | is_jalr) & avoid_exceptions), 0, get_rand_src_regs(rng, num, opcode_probs, rd))
+    # 3. randomize RS2
+    rs2 = np.where(is_jal | is_itype | is_load | is_jalr, 0, get_rand_src_regs(rng, num, opcode_probs, rd))
+    # 4. randomize FUNCT3
+    load_f3, store_f3 = rng.choice(LOAD_FUNCT3, size=num), randint(0, 2)
+    if 'btype_funct3' in opcode_probs:
+        btype_funct3 = opcode_probs['btype_funct3']
+        weights = np.array(list(btype_funct3.values()), dtype=np.float64)
+        branch_f3 = rng.choice([BRANCH_FUNCT3[name] for name in btype_funct3], size=num, p=weights / weights.sum())
+    else:
+        branch_f3 = rng.choice(BTYPE_FUNCT3, size=num)
+    f3 = np.select(
+        [is_jal | is_jalr, is_load, is_store, is_btype],
+        [0, load_f3, store_f3, branch_f3],
+        default=randint(0, 7)
+    )
+    # 5. randomize FUNCT7
+    f7 = np.where((is_itype & (f3==5)) | (is_rtype & ((f3==0) | (f3==5))), rng.choice([0, 32], size=num), 0)
+    # 6. randomize IMM
+    if avoid_exceptions:
+        reach = inst_mem_depth - inst_addr # forward jumps stay inside the instruction memory
+        branch_imm = rng.integers(1, np.maximum(reach >> 2, 2), endpoint=True) << 2
+        if 'btype_bwd' in opcode_probs:
+            # backward branches stay inside the instruction memory too, none from address 0
+            bwd = (rng.random(num) < opcode_probs['btype_bwd']) & (inst_addr > 0)
+            bwd_imm = -(rng.integers(1, np.maximum(np.minimum(inst_addr, 1024), 1), endpoint=True) << 2)
+            branch_imm = np.where(bwd, bwd_imm, branch_imm)
+        jal_imm = rng.integers(1, np.maximum(reach >> 2, 2), endpoint=True) << 2
+        jalr_imm = rng.integers(1, np.maximum(reach >> 3, 2), endpoint=True) << 2
+        load_imm = randint(0, main_mem_depth >> 3) << 2
+        store_imm = randint(0, main_mem_depth >> 3) << 2
+    else:
+        branch_imm = randint(0, 2**12-1) << 1
+        jal_imm = randint(0, 2**20-1) << 1
+        jalr_imm = randint(0, 2**20-1) << 1
+        load_imm = randint(0, 2**12-1)
+        store_imm = randint(0, 2**11-1) << 1
+    is_shift = is_itype & ((f3==1) | (f3==5))
+    alu_imm = np.where(is_shift, randint(0, 2**5-1), randint(0, 2**12-1))
+    itype_imm = np.select([is_load, is_jalr, is_itype], [load_imm, jalr_imm, alu_imm], default=0)
+    imm = np.select(
+        [is_btype, is_jal, is_store, is_rtype],
+        [encode_imms('btype', branch_imm), encode_imms('jtype', jal_imm), encode_imms('stype', store_imm), 0],
+        default=encode_imms('itype', itype_imm, is_itype & (f3==5))
+    )
+    inst = 3 + (op << 2) + (rd << 7) + (f3 << 12) + (rs1 << 15) + (rs2 << 20) + (f7 << 25) + imm
+    return (inst & 0xffffffff).astype(np.uint32)
@@ -1,13 +1,17 @@
 import json
+import os
 from pathlib import Path
-from typing import Tuple
+from typing import List, Tuple
 import logging
 import cocotb
 from cocotb.clock import Clock
 import cocotb.regression
 import cocotb.utils
-from cocotb.triggers import RisingEdge
+from cocotb.triggers import RisingEdge, First, ReadOnly
+from cocotb.handle import HierarchyObject, HierarchyArrayObject, NonHierarchyIndexableObject
 from models.etcpu_ref import *
+from models.etcpu_iss import PERF_CNTRS, FLUSH_SLOTS, PFConfig, get_checkpoint
+from models.riscv_infra import BPConfig
 from regen.apb_infra import *
 
 def load_registers_dict(json_path: Path):
@@ -26,83 +30,459 @@ async def cfg_cpu(driver: APBMasterDriver, trap_base_addr: int):
     trans_trap_hdlr_base = APBTransaction('etcpu_mng_regs_cfg_trap_hdlr_addr', rgf_dict, trap_base_addr, True)
     await driver._driver_send(trans_trap_hdlr_base)
 
-async def init_test(dut, avoid_exceptions=True)->Tuple[IMDriver, any]:
+def get_reg_addr(name: str)->int:
+    '''
+    APB address of a management register field, see registers/etcpu_mng_regs.json
+    '''
+    return next(int(reg['address'], 16) for reg in rgf_dict['rgf'] if reg['name'] == name)
+
+async def apb_read(dut, name: str)->int:
+    '''
+    APB4 read of a 32-bit management register field, driven straight on the mng_apb4_s bus
+    '''
+    dut.mng_apb4_s_paddr.value, dut.mng_apb4_s_pwrite.value, dut.mng_apb4_s_pprot.value = get_reg_addr(name), 0, 0
+    dut.mng_apb4_s_psel.value, dut.mng_apb4_s_penable.value = 1, 0
+    await RisingEdge(dut.clk)
+    dut.mng_apb4_s_penable.value = 1
+    while True:
+        await ReadOnly()
+        if dut.mng_apb4_s_pready.value == 1:
+            break
+        await RisingEdge(dut.clk)
+    prdata = int(dut.mng_apb4_s_prdata.value)
+    await RisingEdge(dut.clk)
+    dut.mng_apb4_s_psel.value, dut.mng_apb4_s_penable.value = 0, 0
+    return prdata
+
+async def read_perf_cntrs(dut, driver: APBMasterDriver)->dict:
+    '''
+    freezes the performance counters snapshot and reads all of it, PERF_CNTRS name -> count
+    '''
+    await driver._driver_send(APBTransaction('etcpu_mng_regs_perf_ctrl_freeze', rgf_dict, 1, True))
+    counts = {}
+    for name in PERF_CNTRS:
+        low = await apb_read(dut, f'etcpu_mng_regs_perf_{name}_lo_val')
+        high = await apb_read(dut, f'etcpu_mng_regs_perf_{name}_hi_val')
+        counts[name] = low | (high << 32)
+    return counts
+
+CPU_RST_CYCLES = 5 # CPU reset cycles left once the program is loaded
+TRAP_HDLR_ADDR = 0x80
+DRAIN_MAX_CYCLES = 16 # bound on the wait for in-flight writes once a program ended
+
+def find_mem_array(mem_inst, depth: int):
+    '''
+    backdoor handle of the storage array inside a memory instance:
+    the first array of depth words found in its hierarchy, None if there is none,
+    simulator handles or stand-ins marked is_mem_array (indexable, len) / is_scope (iterable)
+    '''
+    for child in mem_inst:
+        if (isinstance(child, NonHierarchyIndexableObject) or getattr(child, 'is_mem_array', False)) and len(child) == depth:
+            return child
+        if isinstance(child, (HierarchyObject, HierarchyArrayObject)) or getattr(child, 'is_scope', False):
+            found = find_mem_array(child, depth)
+            if found is not None:
+                return found
+    return None
+
+def get_bp_config(dut)->BPConfig:
+    '''
+    fetch branch predictor parameters etcpu_env_top passes down to etcpu_top
+    '''
+    return BPConfig(bool(int(dut.BP_DYNAMIC.value)), int(dut.BHT_IDX_W.value), int(dut.BTB_IDX_W.value))
+
+def get_pf_config(dut)->PFConfig:
+    '''
+    instruction prefetch buffer depth and instruction memory read latency of etcpu_env_top
+    '''
+    return PFConfig(int(dut.PF_DEPTH.value), int(dut.INST_MEM_LAT.value))
+
+async def start_golden(dut, inst_driver: IMDriver, rgf_sb: RGFScoreboard, mm_sb: MMScoreboard, golden_checker: GoldenChecker):
+    '''
+    golden-trace mode: once the CPU leaves reset the program is final,
+    run it on the ISS and hand the expected write sequences to the scoreboards,
+    its retired PCs and exceptions to the golden checker
+    '''
+    await RisingEdge(dut.rst_n_cpu)
+    iss = ISS(inst_driver.image, inst_driver.inst_mem_depth, inst_driver.main_mem_depth, int(dut.i_etcpu_top.cfg_trap_hdlr_addr.value), trace=True, bp=get_bp_config(dut), pf=get_pf_config(dut))
+    if TestEnv.current is not None and TestEnv.current.checkpoint is not None:
+        iss.restore(TestEnv.current.checkpoint)
+    golden = GoldenTrace(iss, cocotb.utils.get_sim_time('ns'), CLK_PERIOD_NS, 2 * inst_driver.inst_mem_depth)
+    rgf_sb.set_golden(golden, 'rgf')
+    mm_sb.set_golden(golden, 'mm')
+    golden_checker.set_golden(golden)
+    cocotb.log.info(f'Test Manage       : Golden trace ready, {len(iss.rgf_wa)} RGF and {len(iss.mm_addr)} MM writes')
+
+def get_cov_path(cov_path: str)->str:
+    '''
+    coverage database of the test, the given path or $ETCPU_COV_OUT if set, None for no coverage
+    '''
+    return cov_path if cov_path is not None else os.environ.get('ETCPU_COV_OUT')
+
+def get_trace_path(trace_path: str)->str:
+    '''
+    trace file of the test, the given path or one under $ETCPU_TRACE_DIR if set, None for no trace
+    '''
+    if trace_path is not None or 'ETCPU_TRACE_DIR' not in os.environ:
+        return trace_path
+    get_trace_path.tests_num += 1
+    return os.path.join(os.environ['ETCPU_TRACE_DIR'], f'etcpu_{cocotb.RANDOM_SEED}_{get_trace_path.tests_num}.etct')
+get_trace_path.tests_num = 0
+
+DEFAULT_OPCODE_PROBS = {'itype': 16, 'rtype': 8, 'store': 4, 'load': 2, 'jalr': 1, 'jal': 1, 'btype': 1}
+
+def get_sim_arg(name: str, default=None):
+    '''
+    simulation argument passed through the environment as $ETCPU_<NAME> (JSON),
+    used by models.etcpu_regress to vary the random tests per seed
+    '''
+    value = os.environ.get(f'ETCPU_{name.upper()}')
+    return default if value is None else json.loads(value)
+
+class TestEnv(object):
+    '''
+    Handles of everything init_test builds, kept by run_batch to run
+    several programs in a single simulation:
+        1. The monitors and the signal sampler stay alive between programs
+        2. new_program holds the CPU in reset (rst_n_cpu only), configures it again (the management
+           registers share its reset), resets the scoreboards, checkers and expected PC,
+           clears the main memory and refills the instruction memory with NOPs
+        3. fast_forward starts the loaded program from an ISS checkpoint instead of its first instruction
+    the latest environment built is TestEnv.current, end conditions are armed against it
+    '''
+    current = None
+
+    def __init__(self, dut, apb_driver: APBMasterDriver, inst_driver: IMDriver, sampler: SignalSampler, pc_sb: PCScoreboard,
+                 rgf_sb: RGFScoreboard, mm_sb: MMScoreboard, exc_checker: EXCChecker, pc_monitor: PCMonitor, golden_checker: GoldenChecker):
+        self.dut = dut
+        self.apb_driver = apb_driver
+        self.inst_driver = inst_driver
+        self.sampler = sampler
+        self.pc_sb, self.rgf_sb, self.mm_sb = pc_sb, rgf_sb, mm_sb
+        self.exc_checker = exc_checker
+        self.pc_monitor = pc_monitor # None in golden mode
+        self.golden_checker = golden_checker # None unless in golden mode
+        self.golden = golden_checker is not None
+        self.main_mem_array = find_mem_array(dut.i_main_mem, inst_driver.main_mem_depth)
+        self.cpu_rst = None
+        self.checkpoint = None # Checkpoint the program was fast-forwarded to, if any
+        self.programs_num = 0
+        TestEnv.current = self
+
+    def start_program(self):
+        '''
+        CPU reset released by the next close_test / run_program, golden trace armed for it
+        '''
+        self.cpu_rst = reset_dut(self.dut.clk, self.dut.rst_n_cpu, CPU_RST_CYCLES)
+        if self.golden:
+            cocotb.start_soon(start_golden(self.dut, self.inst_driver, self.rgf_sb, self.mm_sb, self.golden_checker))
+
+    async def new_program(self):
+        # 0. Hold the CPU in reset, let the last program's writes land
+        self.dut.rst_n_cpu.value = 0
+        await ClockCycles(self.dut.clk, 2)
+
+        # 1. The main memory is only reset with rst_n_env, clear it so every program starts from the same state
+        if self.main_mem_array is not None:
+            for word in self.main_mem_array:
+                word.value = 0
+        elif self.golden:
+            cocotb.log.error('Test Manage       : main memory array not found, golden program batches need it cleared')
+            assert False
+
+        # 2. The management registers were reset with the CPU
+        await cfg_cpu(self.apb_driver, TRAP_HDLR_ADDR)
+
+        # 3. Scoreboards and checkers
+        self.sampler.reset()
+        self.pc_sb.reset()
+        self.rgf_sb.reset()
+        self.mm_sb.reset(keep_state=self.main_mem_array is None)
+
+        # 4. Instruction memory
+        self.inst_driver.running_addr = 0
+        await self.inst_driver._load_nops(-1)
+        self.programs_num += 1
+        self.checkpoint = None
+        self.start_program()
+
+    def fast_forward(self, inst_num: int):
+        '''
+        skips the first inst_num instructions of the loaded program:
+            1. The ISS runs them and checkpoints the architectural state
+            2. The main memory is loaded by backdoor right away, the register file
+               and PC as the CPU leaves reset (its reset clears them)
+            3. The scoreboards and the expected PC start from the checkpoint
+        returns the CPU reset to await instead of the one init_test returned
+        '''
+        inst_driver = self.inst_driver
+        checkpoint = get_checkpoint(inst_driver.image, inst_driver.inst_mem_depth, inst_driver.main_mem_depth, TRAP_HDLR_ADDR, inst_num)
+        rgf_array = find_mem_array(self.dut.i_etcpu_top.i_decode_top.i_regfile, 32)
+        if rgf_array is None or self.main_mem_array is None:
+            cocotb.log.error('Test Manage       : register file or main memory array not found, cannot fast-forward')
+            assert False
+        for idx, data in enumerate(checkpoint.mm):
+            self.main_mem_array[idx].value = data
+        self.rgf_sb.expected_state = list(checkpoint.rgf)
+        self.mm_sb.expected_state = list(checkpoint.mm)
+        self.pc_sb.expected_pc = checkpoint.pc
+        self.checkpoint = checkpoint
+        self.cpu_rst = self._checkpoint_rst(self.cpu_rst, rgf_array)
+        cocotb.log.info(f'Test Manage       : fast-forwarded {checkpoint.retired} instructions, starting at PC={hex(checkpoint.pc)}')
+        return self.cpu_rst
+
+    async def _checkpoint_rst(self, cpu_rst, rgf_array):
+        await cpu_rst
+        # same time step as the reset release, before the first clock edge out of reset
+        for idx, data in enumerate(self.checkpoint.rgf):
+            rgf_array[idx].value = data
+        self.dut.i_etcpu_top.pc.value = self.checkpoint.pc
+
+    async def check_perf_cntrs(self)->bool:
+        '''
+        reads the performance counters and checks them against an ISS run of the loaded
+        program (from its checkpoint, if fast-forwarded) up to the frozen cycle count,
+        logs the CPI breakdown of the program
+        '''
+        counts = await read_perf_cntrs(self.dut, self.apb_driver)
+        inst_driver = self.inst_driver
+        iss = ISS(inst_driver.image, inst_driver.inst_mem_depth, inst_driver.main_mem_depth, TRAP_HDLR_ADDR, bp=get_bp_config(self.dut), pf=get_pf_config(self.dut))
+        if self.checkpoint is not None:
+            iss.restore(self.checkpoint)
+        iss.run(max_cycles=counts['cycles'])
+        expected = iss.get_perf_cntrs(counts['cycles'])
+        retired = max(counts['retired'], 1)
+        cocotb.log.info(f"Test Manage       : {counts['retired']} instructions in {counts['cycles']} cycles, "
+                        f"CPI {counts['cycles'] / retired:.3f} = 1 + interlock {counts['intrlock'] / retired:.3f}"
+                        f" + branch flush {FLUSH_SLOTS * counts['br_flush'] / retired:.3f}"
+                        f" + jalr flush {FLUSH_SLOTS * counts['jr_flush'] / retired:.3f}"
+                        f" + other {(counts['cycles'] - counts['retired'] - counts['intrlock'] - FLUSH_SLOTS * (counts['br_flush'] + counts['jr_flush'])) / retired:.3f}")
+        mismatched = [name for name in PERF_CNTRS if counts[name] != expected[name]]
+        for name in mismatched:
+            cocotb.log.error(f'Test Manage       : performance counter {name} MISMATCH!! expected {expected[name]} but got {counts[name]}')
+        return not mismatched
+
+    def get_failed(self)->List[str]:
+        '''
+        names of the checkers and scoreboards that found a mismatch in the current program,
+        including the ones found after it ended, which the sampler would only fail later
+        '''
+        failed = [type(checker).__name__ for checker in self.sampler.checkers if checker.failed]
+        return failed + [sb.name for sb in (self.rgf_sb, self.mm_sb) if sb.failed]
+
+    def get_result(self, program: int, passed: bool, start_cycle: int)->dict:
+        '''
+        per-program result, cycles include the CPU reset
+        '''
+        exc_checker = self.golden_checker if self.golden else self.exc_checker
+        return {
+            'program': program,
+            'passed': passed,
+            'cycles': self.sampler.cycle - start_cycle,
+            'rgf_writes': self.rgf_sb.matched_num,
+            'mm_writes': self.mm_sb.matched_num,
+            'exceptions': exc_checker.found_num,
+        }
+
+async def build_env(dut, avoid_exceptions=True, golden=False, backdoor=True, log_level=logging.INFO, trace_path=None, cov_path=None)->TestEnv:
 
     # 0. logging level
-    log_level, avoid_exceptions = logging.INFO, True
+    avoid_exceptions = True
 
     # 1. Declare Instruction Driver
     apb_driver = APBMasterDriver(dut, 'mng_apb4_s', dut.clk)
-    opcode_probs = {
-        'itype': 16, 
-        'rtype': 8, 
-        'store': 4,
-        'load': 2, 
-        'jalr': 1,
-        'jal': 1, 
-        'btype': 1
-    }
+    opcode_probs = get_sim_arg('opcode_probs', DEFAULT_OPCODE_PROBS)
     inst_driver = IMDriver(dut, 'inst_mem_wr', dut.clk, dut.INST_MEM_DEPTH.value, dut.MAIN_MEM_DEPTH.value, opcode_probs, avoid_exceptions)
     
     # 2. Start clock
-    await cocotb.start(Clock(dut.clk, 1, 'ns').start())
+    await cocotb.start(Clock(dut.clk, CLK_PERIOD_NS, 'ns').start())
     
-    # 3. Reset to CPU, hold it active for a long time
-    cpu_rst = cocotb.start_soon(reset_dut(dut.clk, dut.rst_n_cpu, int(2.2*inst_driver.inst_mem_depth)))
+    # 3. Reset to CPU, held active until close_test awaits cpu_rst
+    dut.rst_n_cpu.value = 0
     
     # 4. Wait for environment reset to complete
     await cocotb.start_soon(reset_dut(dut.clk, dut.rst_n_env, 10))
 
     # 5. Configure CPU
-    await cfg_cpu(apb_driver, 0x80)
+    await cfg_cpu(apb_driver, TRAP_HDLR_ADDR)
 
-    # 6. Fill instruction memory with NOPS
+    # 6. Start the signal sampler, attach the backdoor loader, if possible
+    sampler = SignalSampler(dut, dut.clk)
+    inst_monitor = IMMonitor(log_level)
+    sampler.add_checker(inst_monitor)
+    if backdoor:
+        inst_mem_array = find_mem_array(dut.i_inst_mem, inst_driver.inst_mem_depth)
+        if inst_mem_array is None:
+            cocotb.log.warning('Test Manage       : instruction memory array not found, loading through inst_mem_wr')
+        else:
+            inst_driver.attach_backdoor(inst_mem_array, inst_monitor)
+
+    # 7. Fill instruction memory with NOPS
     await inst_driver._load_nops(-1)
 
-    # 7. Start scoreboards and monitors
-    pc_scoreboard, rgf_scoreboard, mm_scoreboard = PCScoreboard(), RGFScoreboard(), MMScoreboard(dut.MAIN_MEM_DEPTH.value)
-    exc_inst_mis_sb, exc_inst_oob_sb, exc_main_mis_sb, exc_main_oob_sb = EXCScoreboard('INST_MIS_SB'), EXCScoreboard('INST_OOB_SB'), EXCScoreboard('MAIN_MIS_SB'), EXCScoreboard('MAIN_OOB_SB')
-    exc_inst_mis_mon= EXCMonitor(dut.clk, dut.rst_n_cpu, dut.i_etcpu_top.exc_inst_addr_mis, exc_inst_mis_sb, log_level)
-    exc_inst_oob_mon= EXCMonitor(dut.clk, dut.rst_n_cpu, dut.i_etcpu_top.exc_inst_addr_oob, exc_inst_oob_sb, log_level)
-    exc_main_mis_mon= EXCMonitor(dut.clk, dut.rst_n_cpu, dut.i_etcpu_top.exc_main_addr_mis, exc_main_mis_sb, log_level)
-    exc_main_oob_mon= EXCMonitor(dut.clk, dut.rst_n_cpu, dut.i_etcpu_top.exc_main_addr_oob, exc_main_oob_sb, log_level)
-    inst_monitor = IMMonitor(dut, 'inst_mem_wr', dut.clk, log_level)
-    main_mem_monitor = MMMonitor(dut, 'main_mem', dut.clk, mm_scoreboard, log_level)
-    rgf_monitor = RGFMonitor(
-        rgf_scoreboard, 
-        dut.i_etcpu_top.i_decode_top.i_regfile.we, dut.i_etcpu_top.i_decode_top.i_regfile.wa, dut.i_etcpu_top.i_decode_top.i_regfile.wd,
-        dut.i_etcpu_top.i_decode_top.wb_inst, dut.i_etcpu_top.i_decode_top.wb_pc, 
-        dut.clk, log_level
-    )
-    pc_monitor = PCMonitor(
-        dut.clk, dut.rst_n_cpu, dut.i_etcpu_top.pc, dut.i_etcpu_top.if2id_inst_next,
-        inst_driver.inst_mem_depth, dut.i_etcpu_top.intrlock_bubble, dut.i_etcpu_top.cfg_trap_hdlr_addr,
-        pc_scoreboard, rgf_scoreboard, mm_scoreboard,
-        exc_inst_mis_mon, exc_inst_oob_mon, exc_main_mis_mon, exc_main_oob_mon, log_level
-    )
-    return inst_driver, cpu_rst, rgf_scoreboard, mm_scoreboard
-
-async def close_test(dut, cpu_rst, max_runtime, mem_depth, rgf_sb: RGFScoreboard, mm_sb: MMScoreboard):
-
-    # 0. Wait for CPU reset to end
+    # 8. Start scoreboards and monitors
+    pc_scoreboard, rgf_scoreboard, mm_scoreboard = PCScoreboard(), RGFScoreboard(journal=True), MMScoreboard(dut.MAIN_MEM_DEPTH.value)
+    exc_checker = EXCChecker(log_level)
+    main_mem_monitor = MMMonitor(mm_scoreboard, log_level)
+    rgf_monitor = RGFMonitor(rgf_scoreboard, log_level)
+    for monitor in (exc_checker, main_mem_monitor, rgf_monitor):
+        sampler.add_checker(monitor)
+    pc_monitor, golden_checker = None, None
+    if golden:
+        golden_checker = GoldenChecker(log_level)
+        sampler.add_checker(golden_checker)
+        cocotb.log.info('Test Manage       : golden mode, PC and exceptions checked against the ISS run, no coverage')
+    else:
+        cov_path = get_cov_path(cov_path)
+        coverage = Coverage(cov_path) if cov_path is not None else None
+        if coverage is not None:
+            exc_checker.add_callback(coverage.sample_exc)
+        pc_monitor = PCMonitor(
+            dut.clk, inst_driver.inst_mem_depth,
+            pc_scoreboard, rgf_scoreboard, mm_scoreboard,
+            exc_checker, log_level, coverage, bp=get_bp_config(dut)
+        )
+        sampler.add_checker(pc_monitor)
+    trace_path = get_trace_path(trace_path)
+    if trace_path is not None:
+        sampler.add_checker(TraceMonitor(TraceSink(trace_path), log_level))
+    env = TestEnv(dut, apb_driver, inst_driver, sampler, pc_scoreboard, rgf_scoreboard, mm_scoreboard, exc_checker, pc_monitor, golden_checker)
+    env.start_program()
+    return env
+
+async def init_test(dut, avoid_exceptions=True, golden=False, backdoor=True, log_level=logging.INFO, trace_path=None, cov_path=None)->Tuple[IMDriver, any]:
+    '''
+    golden=True checks the RGF and MM writes against a trace precomputed by the ISS
+    instead of per-cycle predictions, the PC and exceptions against the retired instructions
+    and exceptions of the same ISS run (see GoldenChecker)
+    backdoor=True loads programs straight into the instruction memory array,
+    falls back to the inst_mem_wr bus if the array cannot be found
+    the CPU is held in reset until close_test, so programs can be loaded either way
+    log_level gates the per-transaction messages, their strings are only built when enabled
+    trace_path (or $ETCPU_TRACE_DIR) records a binary trace, render it with python -m models.etcpu_trace
+    cov_path (or $ETCPU_COV_OUT) collects functional coverage into a database saved at close_test,
+    see models.etcpu_cov, not collected in golden mode
+    '''
+    env = await build_env(dut, avoid_exceptions, golden, backdoor, log_level, trace_path, cov_path)
+    return env.inst_driver, env.cpu_rst, env.rgf_sb, env.mm_sb
+
+async def wait_end(dut, max_runtime, end_conditions)->str:
+    '''
+    waits for the first end condition to fire, max_runtime cycles at most,
+    returns the name of the condition that fired
+    '''
+    for cond in end_conditions:
+        cond.arm(TestEnv.current)
+    waits = [cocotb.start_soon(cond.wait()) for cond in end_conditions]
+    timeout = ClockCycles(dut.clk, max_runtime)
+    fired = await First(timeout, *waits)
+    reason = 'max_runtime' if fired is timeout else next(cond.name for cond, task in zip(end_conditions, waits) if task.done())
+    for task in waits:
+        task.kill()
+    return reason
+
+async def wait_drained(dut, rgf_sb: RGFScoreboard, mm_sb: MMScoreboard)->bool:
+    '''
+    waits until the locked scoreboards matched every pending expected transaction,
+    DRAIN_MAX_CYCLES cycles at most, the CPU keeps running meanwhile so the wait ends
+    before the writes of the instructions fetched after the lock land
+    (the exception checker is not waited on, the PC monitor predicts on every fetch)
+    '''
+    async def drained():
+        await rgf_sb.drained.wait()
+        await mm_sb.drained.wait()
+    drain = cocotb.start_soon(drained())
+    timeout = ClockCycles(dut.clk, DRAIN_MAX_CYCLES)
+    fired = await First(timeout, drain)
+    drain.kill()
+    return fired is not timeout
+
+async def run_program(dut, cpu_rst, max_runtime, mem_depth, rgf_sb: RGFScoreboard, mm_sb: MMScoreboard, fatal=True, end_conditions=None, check_perf=False)->bool:
+    '''
+    runs a loaded program and checks its scoreboards are empty at the end,
+    fatal=False returns False on a non-empty scoreboard instead of failing the test
+    end_conditions (see EndCondition) end the program at the first to fire, max_runtime cycles at most,
+    by default the last instruction memory address or a jal x0, 0 idle loop
+    check_perf=True also checks the performance counters (see TestEnv.check_perf_cntrs), they are frozen
+    and read before the scoreboards lock, the instructions retired meanwhile are still checked
+    '''
+
+    # 0. Program is loaded, release the CPU reset
     await cpu_rst
 
-    # 1. Kill the test after some time or edge of instruction memory reached
-    for _ in range(max_runtime):
-        if dut.inst_mem_rd_addr.value==((mem_depth << 2)-4):
-            break
-        await RisingEdge(dut.clk)
+    # 1. End at the first end condition, after max_runtime cycles at most
+    if end_conditions is None:
+        end_conditions = [PCSentinel((mem_depth << 2)-4), IdleLoop()]
+    reason = await wait_end(dut, max_runtime, end_conditions)
+
+    # 2. Freeze and check the performance counters, the CPU keeps running over the APB reads
+    perf_ok = True
+    if check_perf and TestEnv.current is not None:
+        perf_ok = await TestEnv.current.check_perf_cntrs()
     
-    # 2. Lock scoreboards from adding new expected transactions
-    rgf_sb.lock_expected = True
-    mm_sb.lock_expected = True
-    cocotb.log.info('Test Manage       : Locking Scoreboards')
+    # 3. Lock scoreboards from adding new expected transactions
+    rgf_sb.lock()
+    mm_sb.lock()
+    cocotb.log.info(f'Test Manage       : Program ended ({reason}), Locking Scoreboards')
+
+    # 4. Wait for actual remaining transactions to propagate
+    await wait_drained(dut, rgf_sb, mm_sb)
+
+    # 5. Make sure that all scoreboards are empty
+    rgf_sb.log_stats()
+    mm_sb.log_stats()
+    rgf_empty = rgf_sb.is_empty(fatal)
+    mm_empty = mm_sb.is_empty(fatal)
+    if not perf_ok and fatal:
+        assert False
+    return rgf_empty and mm_empty and perf_ok
 
-    # 3. Wait for actual remaining transactions to propagate
-    await ClockCycles(dut.clk, 4)
+def dump_image(inst_driver: IMDriver):
+    '''
+    writes the loaded program image (JSON list of words) to $ETCPU_IMAGE_OUT if set,
+    the input of models.etcpu_minimize
+    '''
+    if 'ETCPU_IMAGE_OUT' in os.environ:
+        with open(os.environ['ETCPU_IMAGE_OUT'], 'w') as image_file:
+            json.dump([int(word) for word in inst_driver.image], image_file)
 
-    # 4. Make sure that all scoreboards are empty
-    rgf_sb.is_empty()
-    mm_sb.is_empty()
+async def close_test(dut, cpu_rst, max_runtime, mem_depth, rgf_sb: RGFScoreboard, mm_sb: MMScoreboard, end_conditions=None):
+    if TestEnv.current is not None:
+        dump_image(TestEnv.current.inst_driver)
+    await run_program(dut, cpu_rst, max_runtime, mem_depth, rgf_sb, mm_sb, end_conditions=end_conditions, check_perf=True)
+    TraceSink.close_all()
+    Coverage.save_all()
+    cocotb.logging.shutdown()
 
-    cocotb.logging.shutdown()
\ No newline at end of file
+async def run_batch(dut, programs, max_runtime, avoid_exceptions=True, golden=False, backdoor=True, log_level=logging.INFO, trace_path=None, end_conditions=None, cov_path=None, fatal=True)->List[dict]:
+    '''
+    runs a queue of programs back to back in a single simulation,
+    every program is an async callable loading itself through the given IMDriver
+    (the CPU is held in reset meanwhile), the environment is built and configured once
+    returns one result per program, the test fails at the end if any program failed, unless fatal=False
+    '''
+    env = await build_env(dut, avoid_exceptions, golden, backdoor, log_level, trace_path, cov_path)
+    env.sampler.fatal = False
+    results = []
+    for idx, program in enumerate(programs):
+        if idx:
+            await env.new_program()
+        await program(env.inst_driver)
+        start_cycle = env.sampler.cycle
+        empty = await run_program(dut, env.cpu_rst, max_runtime, env.inst_driver.inst_mem_depth, env.rgf_sb, env.mm_sb, False, end_conditions)
+        failed_checkers = env.get_failed()
+        passed = empty and not failed_checkers
+        result = env.get_result(idx, passed, start_cycle)
+        results.append(result)
+        cocotb.log.info(f"Test Manage       : program #{idx} {'PASSED' if passed else 'FAILED'} in {result['cycles']} cycles, "
+                        f"{result['rgf_writes']} RGF and {result['mm_writes']} MM writes, {result['exceptions']} exceptions")
+        if failed_checkers:
+            cocotb.log.error(f'Test Manage       : program #{idx} failed in {failed_checkers}')
+    failed = [result['program'] for result in results if not result['passed']]
+    cocotb.log.info(f'Test Manage       : {len(results) - len(failed)}/{len(results)} programs passed')
+    TraceSink.close_all()
+    Coverage.save_all()
+    if failed:
+        cocotb.log.error(f'Test Manage       : failed programs {failed}')
+        assert not fatal
+    return results
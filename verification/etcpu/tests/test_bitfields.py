@@ -0,0 +1,102 @@
+'''
+equivalence of the shift-and-mask bitfield helpers against the list-of-bits ones
+run directly for a per-instruction decode microbenchmark:
+    python -m tests.test_bitfields
+'''
+import random
+import timeit
+from models.riscv_infra import (
+    decode_inst, inst_str2int, inst_int2str, get_field, sign_extend, decode_imm, encode_imm,
+    FIELD_OPCODE, FIELD_RD, FIELD_FUNCT3, FIELD_RS1, FIELD_RS2, FIELD_FUNCT7,
+    int_to_binary_array, binary_array_to_int, binary_array_to_int_reversed_2s_complement,
+)
+
+SEED = 0x5eed
+WORDS_NUM = 20000
+
+def legacy_decode(cmd_int: int)->tuple:
+    '''
+    decode an instruction the way the reference model used to, one bit list per call
+    '''
+    arr = int_to_binary_array(cmd_int)
+    return (
+        cmd_int,
+        binary_array_to_int(arr[2:7]),
+        binary_array_to_int(arr[12:15]),
+        binary_array_to_int(arr[25:]),
+        binary_array_to_int(arr[7:12]),
+        binary_array_to_int(arr[15:20]),
+        binary_array_to_int(arr[20:25]),
+        binary_array_to_int_reversed_2s_complement(arr[20:]),
+        binary_array_to_int_reversed_2s_complement(arr[7:12] + arr[25:]),
+        binary_array_to_int_reversed_2s_complement([0] + arr[8:12] + arr[25:31] + [arr[7]] + [arr[31]]),
+        binary_array_to_int_reversed_2s_complement([0]*12 + arr[12:]),
+        binary_array_to_int_reversed_2s_complement([0] + arr[21:31] + [arr[20]] + arr[12:20] + [arr[31]]),
+    )
+
+def legacy_sign_and_abs(value: int)->tuple:
+    '''
+    sign bit and 31-bit magnitude of a register value, as in the signed compares
+    '''
+    arr = int_to_binary_array(value)
+    return arr[31], binary_array_to_int(arr[:31])
+
+def rand_words(num: int)->list:
+    rng = random.Random(SEED)
+    return [rng.getrandbits(32) for _ in range(num)]
+
+def test_fields_match_legacy():
+    for word in rand_words(WORDS_NUM):
+        assert tuple(decode_inst.__wrapped__(word)) == legacy_decode(word), hex(word)
+
+def test_field_helpers():
+    word = inst_str2int('bne x1, x2, -12')
+    assert get_field(word, FIELD_OPCODE) == 24
+    assert get_field(word, FIELD_FUNCT3) == 1
+    assert get_field(word, FIELD_RS1) == 1
+    assert get_field(word, FIELD_RS2) == 2
+    assert decode_imm(word, 'btype') == -12
+    assert get_field(inst_str2int('sub x3, x1, x2'), FIELD_FUNCT7) == 32
+    assert get_field(inst_str2int('sub x3, x1, x2'), FIELD_RD) == 3
+    assert sign_extend(0xfff, 12) == -1 and sign_extend(0x7ff, 12) == 2047
+
+def test_signed_compare_match_legacy():
+    for value in rand_words(WORDS_NUM) + [0, 1, 0x7fffffff, 0x80000000, 0xffffffff]:
+        assert (value >> 31, value & 0x7fffffff) == legacy_sign_and_abs(value), hex(value)
+
+def test_encode_match_legacy():
+    rng = random.Random(SEED)
+    # imm_type -> (width, index of the immediate in legacy_decode)
+    formats = {'itype': (12, 7), 'stype': (12, 8), 'btype': (13, 9), 'jtype': (21, 11)}
+    for _ in range(WORDS_NUM):
+        imm_type = rng.choice(list(formats))
+        width, idx = formats[imm_type]
+        value = rng.randint(-(1 << (width - 1)), (1 << (width - 1)) - 1)
+        value = value & ~1 if imm_type in ('btype', 'jtype') else value
+        assert legacy_decode(encode_imm(imm_type, value))[idx] == value, (imm_type, value)
+    for value in (rng.randint(-(1 << 19), (1 << 19) - 1) for _ in range(1000)):
+        assert legacy_decode(encode_imm('utype', value))[10] == value << 12, value
+
+def test_asm_round_trip():
+    for word in rand_words(WORDS_NUM):
+        try:
+            inst_str = inst_int2str(word)
+        except SystemExit: # non-supported instruction
+            continue
+        if inst_str == 'nop' or inst_str.split()[0] in ('srli', 'srai'):
+            continue # nop drops its registers, shift amounts are printed as signed 5-bit
+        assert inst_int2str(inst_str2int(inst_str)) == inst_str
+
+def bench(num: int=WORDS_NUM):
+    '''
+    per-instruction decode time, list-of-bits vs. shift-and-mask (uncached)
+    '''
+    words = rand_words(num)
+    legacy_t = timeit.timeit(lambda: [legacy_decode(w) for w in words], number=1)
+    fast_t = timeit.timeit(lambda: [decode_inst.__wrapped__(w) for w in words], number=1)
+    print(f'legacy decode : {1e6 * legacy_t / num:.2f} us/inst')
+    print(f'bitfield decode : {1e6 * fast_t / num:.2f} us/inst')
+    print(f'speedup : {legacy_t / fast_t:.1f}x')
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,26 @@
+import cocotb
+from models.test_infra import init_test, close_test
+
+@cocotb.test()
+async def test_bltu(dut):
+    '''
+    test bltu instruction, unsigned compare of a negative value:
+        1. nop X 5
+        2. addi x1, x0, -1
+        3. addi x2, x0, 1
+        4. bltu x2, x1, 8  >--| taken
+        5. addi x3, x0, 3     |
+        6. bltu x1, x2, 8  <--| not taken
+        7. addi x4, x0, 4
+        8. addi x5, x0, 5
+    '''
+    inst_driver, cpu_rst, rgf_sb, mm_sb = await init_test(dut)
+    await inst_driver._load_nops(5) # 0x0, 0x4, 0x8, 0xc, 0x10
+    await inst_driver._driver_send('addi x1, x0, -1') # 0x14
+    await inst_driver._driver_send('addi x2, x0, 1') # 0x18
+    await inst_driver._driver_send('bltu x2, x1, 8') # 0x1c
+    await inst_driver._driver_send('addi x3, x0, 3') # 0x20, skipped
+    await inst_driver._driver_send('bltu x1, x2, 8') # 0x24
+    await inst_driver._driver_send('addi x4, x0, 4') # 0x28
+    await inst_driver._driver_send('addi x5, x0, 5') # 0x2c
+    await close_test(dut, cpu_rst, 30, inst_driver.inst_mem_depth, rgf_sb, mm_sb)
@@ -0,0 +1,77 @@
+'''
+get_rand_inst knobs and the coverage-directed opcode_probs loop, sampled statically
+'''
+import random
+from models.etcpu_adapt import OPCODE_TYPE_INSTS, adapt_probs, reweight
+from models.etcpu_cov import Coverage
+from models.etcpu_iss import ISS
+from models.etcpu_regress import get_rand_job
+from models.riscv_infra import BRANCH_FUNCT3, decode_inst, get_rand_inst
+
+TRAP_HDLR_ADDR = 0x80
+
+def get_program(opcode_probs: dict, inst_num: int, seed: int, reg_hist: bool=True)->list:
+    '''
+    generated as IMDriver.drive_rand_inst does
+    '''
+    random.seed(seed)
+    program, hist = [], []
+    for idx in range(inst_num):
+        word = get_rand_inst(opcode_probs, True, idx << 2, 512, 64, hist if reg_hist else None)
+        inst = decode_inst(word)
+        hist = [0 if inst.opcode in (8, 24) else inst.rd] + hist[:2]
+        program.append(word)
+    return program
+
+def test_no_knobs_same_stream():
+    opcode_probs = get_rand_job(3).opcode_probs
+    assert get_program(opcode_probs, 300, 5) == get_program(opcode_probs, 300, 5, reg_hist=False)
+
+def test_branch_knobs():
+    opcode_probs = {'itype': 4, 'rtype': 0, 'store': 0, 'load': 0, 'jalr': 0, 'jal': 0, 'btype': 4,
+                    'btype_funct3': {'bltu': 1, 'bgeu': 1}, 'btype_bwd': 0.5}
+    program = get_program(opcode_probs, 400, 1)
+    branches = [(idx, decode_inst(word)) for idx, word in enumerate(program) if decode_inst(word).opcode == 24]
+    assert {inst.funct3 for _, inst in branches} == {BRANCH_FUNCT3['bltu'], BRANCH_FUNCT3['bgeu']}
+    assert any(inst.b_imm < 0 for _, inst in branches) and any(inst.b_imm > 0 for _, inst in branches)
+    assert all((idx << 2) + inst.b_imm >= 0 for idx, inst in branches)
+    iss = ISS(program, 512, 64, TRAP_HDLR_ADDR)
+    iss.run(max_cycles=2000)
+    assert not any(iss.exc_vec)
+
+def test_rs_reuse():
+    opcode_probs = {'itype': 1, 'rtype': 1, 'store': 0, 'load': 0, 'jalr': 0, 'jal': 0, 'btype': 0,
+                    'rs_reuse': 1, 'raw_dist': [1, 0, 0]}
+    program = [decode_inst(word) for word in get_program(opcode_probs, 200, 2)]
+    assert all(inst.rs1 == prev.rd for prev, inst in zip(program, program[1:]))
+
+def test_reweight():
+    weights = reweight({'a': 1, 'b': 1, 'c': 0}, {'a': 100, 'b': 1, 'c': 1})
+    assert weights['b'] > weights['a'] and weights['c'] > 0
+    assert abs(sum(weights.values()) - 2) < 0.01
+
+def test_adaptive_closes_coverage_faster():
+    '''
+    the same number of programs hits more bins with the mix adapted after every batch
+    than with the per-seed mixes of etcpu_regress
+    '''
+    def run(adaptive: bool, batches: int=4, batch_runs: int=4)->tuple:
+        cov, opcode_probs, seed = None, None, 0
+        for _ in range(batches):
+            batch_cov = Coverage()
+            for _ in range(batch_runs):
+                seed += 1
+                job = get_rand_job(seed, opcode_probs if adaptive else None)
+                for word in get_program(job.opcode_probs, 200, seed):
+                    batch_cov.sample_inst(word, 0, False)
+            if cov is None:
+                cov = batch_cov
+            else:
+                cov.merge(batch_cov)
+            if adaptive:
+                opcode_probs = adapt_probs(cov, opcode_probs or {})
+        return cov.get_hit_num()[0], opcode_probs
+    uniform_hits, _ = run(False)
+    adaptive_hits, opcode_probs = run(True)
+    assert adaptive_hits > uniform_hits
+    assert set(OPCODE_TYPE_INSTS) <= set(opcode_probs) and opcode_probs['btype_bwd'] > 0
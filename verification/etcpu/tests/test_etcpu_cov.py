@@ -0,0 +1,87 @@
+'''
+Coverage bins of hand-made instruction streams, database save / load / merge
+'''
+import pytest
+from array import array
+from models.etcpu_cov import BIN_INDEX, BIN_NAMES, COV_MAGIC, Coverage, get_report, merge_dbs
+from models.riscv_asm import assemble
+
+def sample(cov: Coverage, src: str, intrlock=(), flush=()):
+    '''
+    samples the words of src as PCMonitor would, an interlocked word
+    is sampled twice (interlock cycle first), flushes are given by index
+    '''
+    for idx, word in enumerate(assemble(src)):
+        if idx in intrlock:
+            cov.sample_inst(word, 1, False)
+        cov.sample_inst(word, 0, idx in flush)
+
+def hits(cov: Coverage, prefix: str)->dict:
+    bins = cov.get_bins()
+    return {name: bins[idx] for idx, name in enumerate(BIN_NAMES) if name.startswith(prefix) and bins[idx]}
+
+def test_forwarding_distance():
+    cov = Coverage()
+    sample(cov, '''
+        addi x1, x0, 1
+        addi x2, x1, 1      # x1 in EX
+        nop
+        add  x3, x2, x1     # x2 in MA, x1 in WB
+        lw   x4, 0(x0)
+        add  x5, x4, x4     # load-use, x4 in MA after the bubble
+        sw   x5, 4(x0)      # x5 in EX
+        add  x6, x0, x0     # x0 is never forwarded
+    ''', intrlock=(5,))
+    assert hits(cov, 'fwd.') == {'fwd.rs1.ex': 1, 'fwd.rs1.ma': 2, 'fwd.rs2.wb': 1, 'fwd.rs2.ma': 1, 'fwd.rs2.ex': 1}
+    assert cov.get_bins()[BIN_INDEX['hazard.load_use']] == 1
+    assert cov.get_bins()[BIN_INDEX['inst.add']] == 4 and cov.get_bins()[BIN_INDEX['inst.lw']] == 1
+    assert cov.get_bins()[BIN_INDEX['rd.x0']] == 1 and cov.get_bins()[BIN_INDEX['rs2.x0']] == 2
+
+def test_branches_and_flushes():
+    cov = Coverage()
+    sample(cov, '''
+        addi x1, x0, 1
+        beq  x1, x0, 8      # forward, not taken: hit
+        bne  x1, x0, 8      # forward, taken: miss
+        addi x2, x1, 1      # the 2 slots after the flush are bubbles, x1 is not forwarded
+        jalr x0, x2, 0
+        bltu x0, x1, -20    # backward, taken: hit
+    ''', flush=(2, 4))
+    assert hits(cov, 'branch.') == {'branch.beq.fwd.hit': 1, 'branch.bne.fwd.miss': 1, 'branch.jalr.miss': 1, 'branch.bltu.bwd.hit': 1}
+    assert hits(cov, 'fwd.') == {'fwd.rs1.ex': 2, 'fwd.rs1.ma': 1}
+    cov.sample_exc(0b1001)
+    cov.sample_exc(0)
+    assert hits(cov, 'exc.') == {'exc.INST_MIS': 1, 'exc.MAIN_OOB': 1}
+
+def test_inst_bins():
+    cov = Coverage()
+    sample(cov, '''
+        sub  x1, x2, x3
+        sra  x1, x2, x3
+        srai x1, x2, 3
+        srli x1, x2, 3
+        lui  x1, 0x12345
+    ''')
+    cov.sample_inst(0xffffffff, 0, False)
+    assert set(hits(cov, 'inst.')) == {'inst.sub', 'inst.sra', 'inst.srai', 'inst.srli', 'inst.lui', 'inst.other'}
+
+def test_db_roundtrip_and_merge(tmp_path):
+    covs = []
+    for seed in range(3):
+        cov = Coverage(str(tmp_path / f'run_{seed}.etcv'))
+        sample(cov, 'addi x1, x0, 1\n' * (seed + 1))
+        covs.append(cov)
+    Coverage.save_all()
+    assert not Coverage.open_covs
+    merged = merge_dbs(sorted(tmp_path.glob('*.etcv')))
+    assert merged.runs == 3
+    assert merged.get_bins()[BIN_INDEX['inst.addi']] == 6
+    assert Coverage.load(covs[1].path).get_bins() == covs[1].get_bins()[:len(BIN_NAMES)] + array('Q', (0, 0))
+    assert 'over 3 runs' in get_report(merged)
+    assert 'hole : inst.lui' in get_report(merged, holes=True)
+
+def test_db_layout_mismatch(tmp_path):
+    path = tmp_path / 'bad.etcv'
+    path.write_bytes(COV_MAGIC + bytes(16))
+    with pytest.raises(SystemExit):
+        Coverage.load(path)
@@ -0,0 +1,80 @@
+'''
+Minimizer candidate edits and ddmin loop, against ISS-only oracles
+'''
+import random
+from models.etcpu_iss import ISS, NOP
+from models.etcpu_minimize import TRAP_HDLR_ADDR, ISSPreFilter, minimize, remove_chunk, render_test, set_imm, strip_program
+from models.riscv_asm import assemble
+from models.riscv_infra import decode_inst, get_rand_inst
+
+def run_iss(program, max_cycles=200)->ISS:
+    iss = ISS(program, 512, 64, TRAP_HDLR_ADDR)
+    iss.run(max_cycles=max_cycles)
+    return iss
+
+def test_set_imm():
+    word = assemble('beq x1, x2, 8')[0]
+    for imm_type, value in (('btype', -64), ('btype', 4094)):
+        assert decode_inst(set_imm(word, imm_type, value)).b_imm == value
+    word = assemble('jal x1, 16')[0]
+    assert decode_inst(set_imm(word, 'jtype', -2048)).j_imm == -2048
+    assert decode_inst(set_imm(word, 'jtype', -2048)).rd == 1
+
+def test_remove_chunk_retargets():
+    program = assemble('''
+                addi x1, x0, 3
+        loop:   addi x1, x1, -1
+                addi x5, x0, 7
+                addi x6, x0, 8
+                bne  x1, x0, loop
+                jal  x2, done
+                addi x7, x0, 9
+                jalr x0, x0, 36
+                addi x8, x0, 1
+        done:   addi x9, x0, 2
+    ''')
+    candidate = remove_chunk(program, 2, 4) # the loop body keeps working
+    assert len(candidate) == len(program) - 2
+    assert decode_inst(candidate[2]).b_imm == -4
+    assert decode_inst(candidate[3]).j_imm == 16
+    assert decode_inst(candidate[5]).i_imm == 28
+    assert run_iss(candidate).rgf[1:3] == [0, 16]
+    # a target inside the chunk moves to the first word after it
+    candidate = remove_chunk(program, 6, 9)
+    assert decode_inst(candidate[5]).j_imm == 4
+
+def test_minimize_iss_oracle():
+    '''
+    a failure reproduced by any program writing 0x55 to x9 is reduced
+    to its single writing instruction
+    '''
+    random.seed(0)
+    opcode_probs = {'itype': 16, 'rtype': 8, 'store': 4, 'load': 2, 'jalr': 0, 'jal': 0, 'btype': 0}
+    program = [get_rand_inst(opcode_probs, True, idx << 2, 512, 64) for idx in range(96)]
+    program[40] = assemble('addi x9, x0, 0x55')[0]
+    program = [word if idx == 40 or decode_inst(word).rd != 9 else NOP for idx, word in enumerate(program)]
+    failing = lambda candidate: 0x55 in run_iss(candidate, 400).rgf_wd
+    assert failing(program)
+    checked = []
+    def check(candidates):
+        checked.extend(candidates)
+        return [failing(candidate) for candidate in candidates]
+    minimal = minimize(program, check, ISSPreFilter(program, 512, 64, 400), log=lambda msg: None)
+    assert failing(minimal)
+    assert len(strip_program(minimal)) <= 2
+    assert all(word != NOP for word in strip_program(minimal))
+    assert checked
+
+def test_render_test():
+    program = assemble('''
+                addi x1, x0, 1
+                nop
+                nop
+                sw   x1, 4(x0)
+    ''') + [0x0000006f]
+    src = render_test(program, 'test_min_7', 'from test_rand seed 7', 500)
+    compile(src, 'test_min_7.py', 'exec')
+    assert "_driver_send('addi x1, x0, 1')" in src
+    assert '_load_nops(2)' in src
+    assert 'async def test_min_7(dut):' in src
+    assert 'close_test(dut, cpu_rst, 500,' in src
@@ -0,0 +1,364 @@
+'''
+EtcpuEnvMock pipeline and performance counters against the ISS, and the mock scheduler triggers
+'''
+import random
+import pytest
+from models.etcpu_mock import EtcpuEnvMock, MockSim, RisingEdge, ClockCycles, ReadOnly, Edge, First, Event
+from models.etcpu_mock import MNG_PERF_CTRL, MNG_PERF, PERF_FREEZE, PERF_CLR
+from models.etcpu_iss import ISS, PERF_CNTRS, PFConfig, get_checkpoint
+from models.riscv_asm import assemble
+from models.riscv_infra import BPConfig, get_rand_inst, inst_str2int
+from models.test_infra import find_mem_array
+
+NOP = inst_str2int('nop')
+TRAP_HDLR_ADDR = 0x80
+WB_SLOTS, MA_SLOTS = 4, 3 # fetch slot to register file / main memory write
+
+def start_mock(image, inst_mem_depth=512, main_mem_depth=64, checkpoint=None, bp=BPConfig(), pf=PFConfig())->EtcpuEnvMock:
+    '''
+    program loaded, trap handler configured over APB, CPU out of reset,
+    started from the checkpoint state (backdoor) if given
+    '''
+    dut = EtcpuEnvMock(inst_mem_depth, main_mem_depth, int(bp.dynamic), bp.bht_idx_w, bp.btb_idx_w, pf.depth, pf.latency)
+    dut.rst_n_env.value = 1
+    dut.inst_mem.words[:] = list(image) + [NOP] * (inst_mem_depth - len(image))
+    dut.mng_apb4_s_psel.value, dut.mng_apb4_s_penable.value, dut.mng_apb4_s_pwrite.value = 1, 1, 1
+    dut.mng_apb4_s_pstrb.value, dut.mng_apb4_s_pwdata.value = 0xf, TRAP_HDLR_ADDR
+    dut.step()
+    dut.mng_apb4_s_psel.value, dut.mng_apb4_s_penable.value = 0, 0
+    dut.rst_n_cpu.value = 1
+    if checkpoint is not None:
+        dut.main_mem.words[:] = checkpoint.mm
+        for idx, data in enumerate(checkpoint.rgf):
+            dut.i_etcpu_top.i_decode_top.i_regfile.reg_array[idx].value = data
+        dut.i_etcpu_top.pc.value = checkpoint.pc
+    dut.settle()
+    return dut
+
+def run_mock(dut: EtcpuEnvMock, cycles: int)->tuple:
+    '''
+    (cycle, address, data) register file and main memory writes of the first cycles
+    '''
+    regfile = dut.i_etcpu_top.i_decode_top.i_regfile
+    rgf, mm = [], []
+    for cycle in range(cycles):
+        if regfile.we.value and regfile.wa.value:
+            rgf.append((cycle, int(regfile.wa.value), int(regfile.wd.value)))
+        if dut.main_mem_wen.value:
+            mm.append((cycle, int(dut.main_mem_addr.value), int(dut.main_mem_dat_in.value)))
+        dut.step()
+    return rgf, mm
+
+def apb_access(dut: EtcpuEnvMock, addr: int, wdata: int=None)->int:
+    '''
+    single cycle management register access, a write if wdata is given, returns the read data
+    '''
+    dut.mng_apb4_s_paddr.value, dut.mng_apb4_s_pwrite.value = addr, int(wdata is not None)
+    dut.mng_apb4_s_psel.value, dut.mng_apb4_s_penable.value = 1, 1
+    dut.mng_apb4_s_pstrb.value, dut.mng_apb4_s_pwdata.value = 0xf, wdata or 0
+    dut.settle()
+    prdata = int(dut.mng_apb4_s_prdata.value)
+    dut.step()
+    dut.mng_apb4_s_psel.value, dut.mng_apb4_s_penable.value = 0, 0
+    dut.settle()
+    return prdata
+
+def read_perf_cntrs(dut: EtcpuEnvMock)->dict:
+    return {name: apb_access(dut, MNG_PERF + 8 * idx) | (apb_access(dut, MNG_PERF + 8 * idx + 4) << 32) for idx, name in enumerate(PERF_CNTRS)}
+
+@pytest.mark.parametrize('avoid_exceptions', [True, False])
+@pytest.mark.parametrize('seed', range(8))
+def test_pipeline_matches_iss(seed, avoid_exceptions):
+    random.seed(seed)
+    opcode_probs = {'itype': 16, 'rtype': 8, 'store': 4, 'load': 2, 'jalr': 1, 'jal': 2, 'btype': 4}
+    image = [get_rand_inst(opcode_probs, avoid_exceptions, idx << 2, 512, 64) for idx in range(256)]
+    cycles = 512
+    rgf, mm = run_mock(start_mock(image), cycles + WB_SLOTS)
+    iss = ISS(image, 512, 64, TRAP_HDLR_ADDR)
+    iss.run(max_cycles=cycles)
+    assert len(iss.rgf_wa) > 0
+    assert rgf[:len(iss.rgf_wa)] == [(slot + WB_SLOTS, wa, wd) for slot, wa, wd in zip(iss.rgf_slot, iss.rgf_wa, iss.rgf_wd)]
+    assert mm[:len(iss.mm_addr)] == [(slot + MA_SLOTS, addr, data) for slot, addr, data in zip(iss.mm_slot, iss.mm_addr, iss.mm_data)]
+
+@pytest.mark.parametrize('seed', range(4))
+def test_checkpoint_restore(seed):
+    random.seed(seed)
+    opcode_probs = {'itype': 16, 'rtype': 8, 'store': 4, 'load': 2, 'jalr': 1, 'jal': 1, 'btype': 2}
+    image = [get_rand_inst(opcode_probs, True, idx << 2, 512, 64) for idx in range(448)]
+    image.append(inst_str2int('jal x0, -1792')) # loop back to the head
+    full = ISS(image, 512, 64, TRAP_HDLR_ADDR)
+    full.run(max_insts=3000)
+    checkpoint = get_checkpoint(image, 512, 64, TRAP_HDLR_ADDR, 2000)
+    iss = ISS(image, 512, 64, TRAP_HDLR_ADDR)
+    iss.restore(checkpoint)
+    iss.run(max_insts=3000)
+    # the restored ISS continues the full run
+    assert iss.retired == full.retired and iss.rgf == full.rgf and iss.mm == full.mm
+    tail = len(full.rgf_wa) - len(iss.rgf_wa)
+    assert list(iss.rgf_wd) == list(full.rgf_wd[tail:])
+    # and so does the mock started from the checkpoint
+    rgf, mm = run_mock(start_mock(image, checkpoint=checkpoint), iss.cycle)
+    assert [(wa, wd) for _, wa, wd in rgf] == list(zip(iss.rgf_wa, iss.rgf_wd))[:len(rgf)]
+    assert [(addr, data) for _, addr, data in mm] == list(zip(iss.mm_addr, iss.mm_data))[:len(mm)]
+
+@pytest.mark.parametrize('avoid_exceptions', [True, False])
+@pytest.mark.parametrize('seed', range(4))
+def test_perf_cntrs(seed, avoid_exceptions):
+    random.seed(seed)
+    opcode_probs = {'itype': 16, 'rtype': 8, 'store': 4, 'load': 2, 'jalr': 1, 'jal': 2, 'btype': 4}
+    image = [get_rand_inst(opcode_probs, avoid_exceptions, idx << 2, 512, 64) for idx in range(256)]
+    dut = start_mock(image)
+    run_mock(dut, 400)
+    apb_access(dut, MNG_PERF_CTRL, PERF_FREEZE)
+    run_mock(dut, 16) # the counters go on, the snapshot holds
+    counts = read_perf_cntrs(dut)
+    assert counts['cycles'] == 401
+    iss = ISS(image, 512, 64, TRAP_HDLR_ADDR)
+    iss.run(max_cycles=counts['cycles'])
+    assert counts == iss.get_perf_cntrs(counts['cycles'])
+    assert counts['retired'] and sum(counts.values()) > counts['cycles'] + counts['retired']
+    # cleared while clr is set, the snapshot follows the counters once unfrozen
+    apb_access(dut, MNG_PERF_CTRL, PERF_CLR)
+    apb_access(dut, MNG_PERF_CTRL, 0)
+    run_mock(dut, 10)
+    assert read_perf_cntrs(dut)['cycles'] == 10
+
+BP_CONFIGS = [BPConfig(), BPConfig(dynamic=False), BPConfig(bht_idx_w=2, btb_idx_w=1)]
+
+@pytest.mark.parametrize('bp', BP_CONFIGS, ids=['dynamic', 'static', 'aliased'])
+@pytest.mark.parametrize('seed', range(4))
+def test_branch_predictor_matches_iss(seed, bp):
+    '''
+    branch heavy programs, every funct3 and load-use hazards into branches and jalr,
+    in a loop so the predictor tables are trained
+    '''
+    random.seed(seed)
+    opcode_probs = {'itype': 8, 'rtype': 2, 'store': 2, 'load': 4, 'jalr': 2, 'jal': 1, 'btype': 8,
+                    'btype_funct3': {'beq': 1, 'bne': 1, 'blt': 1, 'bge': 1, 'bltu': 2, 'bgeu': 2},
+                    'btype_bwd': 0.3, 'rs_reuse': 0.5, 'raw_dist': [2, 1, 1]}
+    image, hist = [], []
+    for idx in range(448):
+        word = get_rand_inst(opcode_probs, True, idx << 2, 512, 64, hist)
+        hist = [(word >> 7) & 0x1f if word & 0x7f not in (0x23, 0x63) else 0] + hist[:2]
+        image.append(word)
+    image.append(inst_str2int('jal x0, -1792')) # loop back to the head
+    cycles = 3000
+    dut = start_mock(image, bp=bp)
+    rgf, mm = run_mock(dut, cycles + WB_SLOTS)
+    iss = ISS(image, 512, 64, TRAP_HDLR_ADDR, bp=bp)
+    iss.run(max_cycles=cycles)
+    assert rgf[:len(iss.rgf_wa)] == [(slot + WB_SLOTS, wa, wd) for slot, wa, wd in zip(iss.rgf_slot, iss.rgf_wa, iss.rgf_wd)]
+    assert mm[:len(iss.mm_addr)] == [(slot + MA_SLOTS, addr, data) for slot, addr, data in zip(iss.mm_slot, iss.mm_addr, iss.mm_data)]
+    apb_access(dut, MNG_PERF_CTRL, PERF_FREEZE)
+    counts = read_perf_cntrs(dut)
+    iss.run(max_cycles=counts['cycles'])
+    assert counts == iss.get_perf_cntrs(counts['cycles'])
+
+def test_branch_predictor_loop():
+    '''
+    a loop with an always-taken forward branch and a call returning through jalr,
+    the static scheme flushes on both every iteration, the dynamic one learns them
+    '''
+    image = assemble('''
+              addi x1, x0, 50
+        loop: beq  x0, x0, skip   # forward, always taken
+              addi x9, x9, 1
+        skip: jal  x5, func
+              addi x1, x1, -1
+              bne  x1, x0, loop
+        end:  jal  x0, end
+        func: addi x2, x2, 1
+              jalr x0, x5, 0
+    ''')
+    flushes = {}
+    for bp in BP_CONFIGS[:2]:
+        dut = start_mock(image, bp=bp)
+        run_mock(dut, 600)
+        apb_access(dut, MNG_PERF_CTRL, PERF_FREEZE)
+        counts = read_perf_cntrs(dut)
+        iss = ISS(image, 512, 64, TRAP_HDLR_ADDR, bp=bp)
+        iss.run(max_cycles=counts['cycles'])
+        assert counts == iss.get_perf_cntrs(counts['cycles'])
+        assert dut.rgf.words[1:3] == [0, 50] and dut.rgf.words[9] == 0
+        flushes[bp.dynamic] = (counts['br_flush'], counts['jr_flush'])
+    assert flushes[False] == (51, 50)
+    assert flushes[True][0] <= 4 and flushes[True][1] <= 2
+
+PF_CONFIGS = [PFConfig(4, 1), PFConfig(4, 3), PFConfig(2, 2), PFConfig(1, 1)]
+
+@pytest.mark.parametrize('pf', PF_CONFIGS, ids=lambda pf: f'depth{pf.depth}-lat{pf.latency}')
+@pytest.mark.parametrize('avoid_exceptions', [True, False])
+@pytest.mark.parametrize('seed', range(4))
+def test_prefetch_matches_iss(seed, avoid_exceptions, pf):
+    '''
+    fetch slots delayed by the instruction memory latency through the prefetch buffer,
+    with predicted jumps, flushes, traps and load-use hazards restarting or stalling the stream
+    '''
+    random.seed(seed)
+    opcode_probs = {'itype': 8, 'rtype': 2, 'store': 2, 'load': 4, 'jalr': 2, 'jal': 1, 'btype': 8,
+                    'btype_bwd': 0.3, 'rs_reuse': 0.5, 'raw_dist': [2, 1, 1]}
+    image, hist = [], []
+    for idx in range(448):
+        word = get_rand_inst(opcode_probs, avoid_exceptions, idx << 2, 512, 64, hist)
+        hist = [(word >> 7) & 0x1f if word & 0x7f not in (0x23, 0x63) else 0] + hist[:2]
+        image.append(word)
+    image.append(inst_str2int('jal x0, -1792')) # loop back to the head
+    cycles = 2000
+    dut = start_mock(image, pf=pf)
+    rgf, mm = run_mock(dut, cycles + WB_SLOTS)
+    iss = ISS(image, 512, 64, TRAP_HDLR_ADDR, pf=pf)
+    iss.run(max_cycles=cycles)
+    # the last instructions the ISS ran may be fetched after cycles
+    assert rgf == [(slot + WB_SLOTS, wa, wd) for slot, wa, wd in zip(iss.rgf_slot, iss.rgf_wa, iss.rgf_wd) if slot < cycles]
+    assert mm == [(slot + MA_SLOTS, addr, data) for slot, addr, data in zip(iss.mm_slot, iss.mm_addr, iss.mm_data) if slot < cycles + 1]
+    apb_access(dut, MNG_PERF_CTRL, PERF_FREEZE)
+    counts = read_perf_cntrs(dut)
+    iss.run(max_cycles=counts['cycles'])
+    assert counts == iss.get_perf_cntrs(counts['cycles'])
+
+def test_prefetch_full_rate():
+    '''
+    straight-line code keeps one instruction per cycle once the buffer covers the latency
+    (PF_DEPTH > INST_MEM_LAT), a shallower one fetches PF_DEPTH instructions per INST_MEM_LAT + 1 cycles
+    '''
+    image = [inst_str2int('addi x1, x1, 1')] * 500
+    retired = {}
+    for pf in (PFConfig(4, 0), PFConfig(4, 3), PFConfig(8, 5), PFConfig(2, 3), PFConfig(1, 1)):
+        dut = start_mock(image, pf=pf)
+        run_mock(dut, 400)
+        apb_access(dut, MNG_PERF_CTRL, PERF_FREEZE)
+        counts = read_perf_cntrs(dut)
+        iss = ISS(image, 512, 64, TRAP_HDLR_ADDR, pf=pf)
+        iss.run(max_cycles=counts['cycles'])
+        assert counts == iss.get_perf_cntrs(counts['cycles'])
+        retired[pf] = counts['retired']
+    base = retired[PFConfig(4, 0)]
+    assert retired[PFConfig(4, 3)] == base - 3 and retired[PFConfig(8, 5)] == base - 5
+    assert abs(retired[PFConfig(2, 3)] - base / 2) <= 4 and abs(retired[PFConfig(1, 1)] - base / 2) <= 2
+
+@pytest.mark.parametrize('pf', PF_CONFIGS + [PFConfig(8, 5), PFConfig(2, 6)], ids=lambda pf: f'depth{pf.depth}-lat{pf.latency}')
+def test_prefetch_inflight_bound(pf):
+    '''
+    the reads in flight, dropped ones included, never exceed INST_MEM_LAT,
+    the bound etcpu_env_top sizes the dropped responses counter of fetch_prefetch.v by (PF_MAX_INFLIGHT)
+    '''
+    random.seed(1)
+    opcode_probs = {'itype': 8, 'rtype': 2, 'store': 2, 'load': 4, 'jalr': 2, 'jal': 1, 'btype': 8, 'btype_bwd': 0.3}
+    image = [get_rand_inst(opcode_probs, True, idx << 2, 512, 64) for idx in range(448)] + [inst_str2int('jal x0, -1792')]
+    dut = start_mock(image, pf=pf)
+    inflight = []
+    for _ in range(3000):
+        dut.step()
+        inflight.append(dut.pf_drop + dut.pf_cnt - dut.pf_fill)
+    assert max(inflight) <= pf.latency
+
+def test_load_use_interlock():
+    dut = start_mock(assemble('''
+        addi x1, x0, 5
+        sw   x1, 8(x0)
+        lw   x2, 8(x0)
+        add  x3, x2, x1     # load-use, one bubble
+        add  x4, x3, x3     # forwarded from execute
+    '''))
+    bubbles = 0
+    for _ in range(12):
+        bubbles += int(dut.i_etcpu_top.intrlock_bubble.value)
+        dut.step()
+    assert bubbles == 1
+    assert dut.rgf.words[1:5] == [5, 5, 10, 20]
+
+@pytest.mark.parametrize('bp', BP_CONFIGS, ids=['dynamic', 'static', 'aliased'])
+def test_load_use_branch(bp):
+    image = assemble('''
+        addi x1, x0, 5
+        sw   x1, 8(x0)
+        lw   x2, 8(x0)
+        beq  x2, x1, 8      # load-use, the stalled branch keeps its PC and prediction
+        addi x3, x0, 3
+        addi x4, x4, 1
+        lw   x5, 8(x0)
+        bne  x4, x5, -8     # load-use, taken 4 times
+        addi x6, x0, 6
+    ''')
+    iss = ISS(image, 512, 64, TRAP_HDLR_ADDR, bp=bp)
+    iss.run(max_cycles=60)
+    expected = [5, 5, 0, 5, 5, 6]
+    assert iss.rgf[1:7] == expected
+    dut = start_mock(image, bp=bp)
+    run_mock(dut, 60)
+    assert dut.rgf.words[1:7] == expected
+
+def test_bltu():
+    image = assemble('''
+        addi x1, x0, -1
+        addi x2, x0, 1
+        bltu x2, x1, 8      # taken, unsigned 1 < 0xffffffff
+        addi x3, x0, 3
+        bltu x1, x2, 8      # not taken
+        addi x4, x0, 4
+        addi x5, x0, 5
+    ''')
+    expected = [0xffffffff, 1, 0, 4, 5]
+    iss = ISS(image, 512, 64, TRAP_HDLR_ADDR)
+    iss.run(max_insts=6)
+    assert iss.rgf[1:6] == expected
+    dut = start_mock(image)
+    run_mock(dut, 16)
+    assert dut.rgf.words[1:6] == expected
+
+def test_sra_sign_extends():
+    image = assemble('''
+        lui  x1, 0x80000
+        addi x1, x1, 16     # 0x80000010
+        addi x2, x0, 4
+        sra  x3, x1, x2
+        srai x4, x1, 31
+        srl  x5, x1, x2
+    ''')
+    expected = [0x80000010, 4, 0xf8000001, 0xffffffff, 0x08000001]
+    iss = ISS(image, 512, 64, TRAP_HDLR_ADDR)
+    iss.run(max_insts=6)
+    assert iss.rgf[1:6] == expected
+    dut = start_mock(image)
+    run_mock(dut, 12)
+    assert dut.rgf.words[1:6] == expected
+
+def test_kernel_triggers():
+    dut = EtcpuEnvMock()
+    sim = MockSim(dut)
+    event, seen = Event(), {}
+
+    async def setter():
+        await ClockCycles(dut.clk, 3)
+        dut.rst_n_cpu.value = 1
+        event.set()
+
+    async def waiter():
+        timeout = ClockCycles(dut.clk, 10)
+        fired = await First(timeout, event.wait())
+        seen['event'] = (fired is not timeout, sim.cycle)
+
+    async def edge_watcher():
+        await Edge(dut.rst_n_cpu)
+        seen['edge'] = sim.cycle
+        await ReadOnly()
+        seen['pc'] = int(dut.i_etcpu_top.pc.value)
+
+    async def test():
+        sim.start_soon(setter())
+        watcher = sim.start_soon(edge_watcher())
+        await sim.start_soon(waiter())
+        await watcher
+        for _ in range(4):
+            await RisingEdge(dut.clk)
+        seen['end'] = sim.cycle
+
+    assert sim.run(sim.start_soon(test()), 100)
+    assert seen == {'event': (True, 3), 'edge': 3, 'pc': 0, 'end': 7}
+
+def test_backdoor_arrays():
+    # the mock memories and scopes are found by their markers, test_infra does not import the mock
+    dut = EtcpuEnvMock(256, 32)
+    assert find_mem_array(dut.i_inst_mem, 256) is dut.inst_mem
+    assert find_mem_array(dut.i_main_mem, 32) is dut.main_mem
+    assert find_mem_array(dut.i_main_mem, 64) is None
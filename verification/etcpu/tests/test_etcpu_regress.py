@@ -0,0 +1,63 @@
+'''
+Regression runner end to end on the Python mock: report, summary and reproduce lines,
+and the directed suite on the mock of non-default etcpu_env_top parameters
+'''
+import json
+import shlex
+import sys
+from pathlib import Path
+import pytest
+from models.etcpu_mock import run_test
+from models.etcpu_regress import MOCK_SIM_CMD, RAND_MODULE, RAND_TESTCASE, RegressJob, get_directed_jobs, main
+
+SIM_DIR = Path(__file__).resolve().parent.parent
+
+def run_main(monkeypatch, capsys, args)->tuple:
+    '''
+    (exit code, printed lines) of an etcpu_regress command line
+    '''
+    monkeypatch.setattr(sys, 'argv', ['etcpu_regress', '--sim-dir', str(SIM_DIR), '-j', '3'] + args)
+    with pytest.raises(SystemExit) as exit_info:
+        main()
+    return exit_info.value.code, capsys.readouterr().out.splitlines()
+
+def test_mock_regression(monkeypatch, capsys, tmp_path):
+    # no --sim-cmd or $ETCPU_SIM_CMD, the mock is the default
+    monkeypatch.delenv('ETCPU_SIM_CMD', raising=False)
+    out_dir = tmp_path / 'out'
+    code, lines = run_main(monkeypatch, capsys, ['-n', '3', '--base-seed', '7', '--out-dir', str(out_dir)])
+    assert code == 0
+    assert 'Regression summary : 3/3 passed' in lines[-1]
+    results = [json.loads(line) for line in (out_dir / 'report.jsonl').read_text().splitlines()]
+    assert len({result['seed'] for result in results}) == 3
+    assert all(result['status'] == 'PASS' and result['test'] == 'tests.test_rand.test_rand' for result in results)
+    assert all(Path(result['log']).exists() for result in results)
+
+def test_failed_run_reproduces(monkeypatch, capsys, tmp_path):
+    # every run times out, the summary lists it with the command reproducing it
+    code, lines = run_main(monkeypatch, capsys, ['--sim-cmd', MOCK_SIM_CMD, '-n', '2', '--base-seed', '7',
+                                                 '--timeout', '0.001', '--out-dir', str(tmp_path / 'out')])
+    assert code == 1
+    summary = lines.index(next(line for line in lines if line.startswith('Regression summary')))
+    assert 'Regression summary : 0/2 passed' in lines[summary]
+    repro = [line.split(':', 1)[1].strip() for line in lines[summary:] if line.strip().startswith('reproduce')]
+    assert len(repro) == 2
+    assert sum(line.strip().startswith('minimize') for line in lines[summary:]) == 2
+
+    # the reproduce command runs the same seed alone, passing without the timeout
+    argv = shlex.split(repro[0])
+    assert argv[:3] == ['python', '-m', 'models.etcpu_regress']
+    seed = int(argv[argv.index('--seed') + 1])
+    code, lines = run_main(monkeypatch, capsys, argv[3:] + ['--out-dir', str(tmp_path / 'repro')])
+    assert code == 0
+    assert 'Regression summary : 1/1 passed' in lines[-1]
+    result = json.loads((tmp_path / 'repro' / 'report.jsonl').read_text())
+    assert result['seed'] == seed
+
+ENV_CONFIGS = [{'BP_DYNAMIC': 0}, {'INST_MEM_LAT': 3}, {'PF_DEPTH': 1, 'INST_MEM_LAT': 1}]
+
+@pytest.mark.parametrize('params', ENV_CONFIGS, ids=lambda params: '-'.join(f'{name}{value}' for name, value in params.items()))
+def test_env_params(params):
+    # the directed suite and test_rand on the mock of a non-default etcpu_env_top
+    jobs = get_directed_jobs(7) + [RegressJob(RAND_MODULE, RAND_TESTCASE, seed) for seed in (1, 2)]
+    assert [job.name for job in jobs if not run_test(job.module, job.testcase, job.seed, params=params)] == []
@@ -0,0 +1,46 @@
+'''
+Binary trace write / read / render round trip, and the DUT-sampled trace of a test run on the mock
+'''
+from models.etcpu_mock import run_test
+from models.etcpu_trace import TRACE_FLAG_FETCH, TRACE_FLAG_RGF_WR, TRACE_FLAG_MM_WR, TRACE_FLUSH_RECORDS, TraceRecord, TraceSink, format_record, read_trace
+from models.riscv_infra import inst_str2int
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'trace.etct'
+    sink = TraceSink(str(path))
+    addi, sw = inst_str2int('addi x1, x0, 7'), inst_str2int('sw x1, 4(x0)')
+    sink.record(10, 0x0, addi)
+    sink.record(11, 0x4, sw, rd=1, wd=7)
+    sink.record(12, mm_addr=4, mm_data=7)
+    for cycle in range(13, 13 + TRACE_FLUSH_RECORDS): # across a block flush
+        sink.record(cycle, cycle << 2, addi)
+    TraceSink.close_all()
+    assert TraceSink.open_sinks == []
+
+    records = list(read_trace(str(path)))
+    assert len(records) == 3 + TRACE_FLUSH_RECORDS
+    assert records[:3] == [
+        TraceRecord(10, 0x0, addi, TRACE_FLAG_FETCH, 0, 0, 0, 0),
+        TraceRecord(11, 0x4, sw, TRACE_FLAG_FETCH | TRACE_FLAG_RGF_WR, 1, 7, 0, 0),
+        TraceRecord(12, 0, 0, TRACE_FLAG_MM_WR, 0, 0, 4, 7),
+    ]
+    assert records[-1].cycle == 12 + TRACE_FLUSH_RECORDS
+    lines = [format_record(rec) for rec in records[:3]]
+    assert lines[0].split() == ['10', ':', '0x0', 'addi', 'x1,', 'x0,', '7']
+    assert lines[1].endswith('x1  <= 0x7') and '0x4' in lines[1]
+    assert lines[2] == f'{"12".rjust(8)} : {"".ljust(33)} MAIN_MEM[0x4] <= 0x7'
+
+def test_mock_run_sampled(tmp_path, monkeypatch):
+    # addi x1, x0, 7 / addi x1, x1, 4 on the mock, the trace holds what the DUT fetched and wrote
+    monkeypatch.setenv('ETCPU_TRACE_DIR', str(tmp_path))
+    assert run_test('tests.test_data_hazard', 'test_data_hazard', seed=1)
+    path, = tmp_path.glob('*.etct')
+    records = list(read_trace(str(path)))
+    fetched = [rec.inst for rec in records if rec.flags & TRACE_FLAG_FETCH]
+    assert fetched[:2] == [inst_str2int('addi x1, x0, 7'), inst_str2int('addi x1, x1, 4')]
+    writes = [(rec.rd, rec.wd) for rec in records if rec.flags & TRACE_FLAG_RGF_WR]
+    assert writes == [(1, 7), (1, 11)]
+    # written on the cycle the write back happens, after both fetches
+    first_write = next(rec for rec in records if rec.flags & TRACE_FLAG_RGF_WR)
+    assert first_write.cycle > records[1].cycle
+    assert not any(rec.flags & TRACE_FLAG_MM_WR for rec in records)
@@ -0,0 +1,68 @@
+'''
+EXCChecker delay line, and wrong or missing exceptions injected into a mock run
+'''
+import logging
+from types import SimpleNamespace
+import pytest
+from models.etcpu_mock import EtcpuEnvMock, MockSim, patch_cocotb, run_test
+from models.etcpu_ref import EXCChecker, SignalSnapshot, CLK_PERIOD_NS, MAIN_EXC_SLOTS
+
+MAIN_MIS, MAIN_OOB = 0b0100, 0b1000
+
+@pytest.fixture
+def sim():
+    sim = MockSim(EtcpuEnvMock(), CLK_PERIOD_NS)
+    restore = patch_cocotb(sim, 0)
+    yield sim
+    restore()
+    MockSim.current = None
+
+def get_snap(cycle: int, exc: int=0)->SignalSnapshot:
+    return SignalSnapshot(cycle, 1, *[0] * 5, exc, *[0] * 11)
+
+def test_delay_line(sim):
+    checker = EXCChecker(logging.INFO)
+    checker.sampler = SimpleNamespace(fail=lambda: None) # failures only set the checker's flag
+    checker.predict(get_snap(10), MAIN_MIS)
+    checker.predict(get_snap(11), 0)
+    assert not checker.drained.is_set()
+    # MA raises a main memory exception MAIN_EXC_SLOTS cycles after the prediction
+    for cycle in range(11, 10 + MAIN_EXC_SLOTS):
+        checker.sample(get_snap(cycle))
+    checker.sample(get_snap(10 + MAIN_EXC_SLOTS, MAIN_MIS))
+    checker.sample(get_snap(11 + MAIN_EXC_SLOTS))
+    assert not checker.failed and checker.found_num == 1 and checker.drained.is_set()
+
+    # raised a cycle late, missing on its cycle
+    checker.predict(get_snap(20), MAIN_OOB)
+    for cycle in range(21, 20 + MAIN_EXC_SLOTS + 1):
+        checker.sample(get_snap(cycle))
+    assert checker.failed
+    checker.reset()
+    assert not checker.failed and checker.found_num == 0 and checker.drained.is_set()
+
+def inject(monkeypatch, fault):
+    '''
+    the mock's main memory exception outputs rewritten by fault(mis, oob) -> (mis, oob), its state is left alone
+    '''
+    settle = EtcpuEnvMock.settle
+    def faulty_settle(dut):
+        settle(dut)
+        top = dut.i_etcpu_top
+        mis, oob = fault(int(top.exc_main_addr_mis.value), int(top.exc_main_addr_oob.value))
+        top.exc_main_addr_mis._drive(mis)
+        top.exc_main_addr_oob._drive(oob)
+    monkeypatch.setattr(EtcpuEnvMock, 'settle', faulty_settle)
+
+def test_exc_found():
+    assert run_test('tests.test_exc_main_mis', 'test_exc_main_mis', seed=1)
+
+def test_missing_exc(monkeypatch, caplog):
+    inject(monkeypatch, lambda mis, oob: (0, oob))
+    assert not run_test('tests.test_exc_main_mis', 'test_exc_main_mis', seed=1)
+    assert 'EXCEPTION MISMATCH!! predicted MAIN_MIS but got none' in caplog.text
+
+def test_wrong_exc(monkeypatch, caplog):
+    inject(monkeypatch, lambda mis, oob: (0, oob | mis))
+    assert not run_test('tests.test_exc_main_mis', 'test_exc_main_mis', seed=1)
+    assert 'EXCEPTION MISMATCH!! predicted MAIN_MIS but got MAIN_OOB' in caplog.text
@@ -0,0 +1,25 @@
+import cocotb
+from models.test_infra import init_test, close_test, TestEnv
+
+LOOP_ITERATIONS = 0x40000
+LOOP_INST_NUM = 2 + 3 * LOOP_ITERATIONS
+
+@cocotb.test()
+async def test_fast_forward(dut):
+    '''
+    fast-forward test - a 786K instruction loop checked from its last iterations:
+        1. the ISS runs the first instructions and checkpoints the state
+        2. the register file, main memory and PC are loaded by backdoor
+        3. the remaining iterations and the idle loop are checked as usual
+    '''
+    inst_driver, cpu_rst, rgf_sb, mm_sb = await init_test(dut)
+    await inst_driver.load_asm(f'''
+                addi x1, x0, 0
+                lui  x2, {LOOP_ITERATIONS >> 12}
+        loop:   addi x1, x1, 1
+                sw   x1, 4(x0)
+                bne  x1, x2, loop
+        done:   jal  x0, done           # idle loop, ends the test
+    ''')
+    cpu_rst = TestEnv.current.fast_forward(LOOP_INST_NUM - 3 * 10)
+    await close_test(dut, cpu_rst, 200, inst_driver.inst_mem_depth, rgf_sb, mm_sb)
@@ -0,0 +1,17 @@
+import cocotb
+from models.test_infra import init_test, close_test, get_sim_arg
+
+@cocotb.test()
+async def test_image(dut):
+    '''
+    test image:
+        runs the program image given in $ETCPU_IMAGE (JSON list of words),
+        used by models.etcpu_minimize to re-check candidate programs
+    '''
+    inst_driver, cpu_rst, rgf_sb, mm_sb = await init_test(dut)
+    image = get_sim_arg('image')
+    if image is None:
+        cocotb.log.error('Test Manage       : no program image, set $ETCPU_IMAGE')
+        assert False
+    await inst_driver.load_image(image)
+    await close_test(dut, cpu_rst, get_sim_arg('max_runtime', 1000), inst_driver.inst_mem_depth, rgf_sb, mm_sb)
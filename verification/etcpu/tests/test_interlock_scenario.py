@@ -10,6 +10,7 @@ async def test_interlock_scenario(dut):
         3. nop X 5 
         4. lw x2, 0(x0)
         5. add x3, x2, x2
+        6. addi x4, x3, 1 (fetched on the interlock bubble and again on the next cycle)
     '''
     inst_driver, cpu_rst, rgf_sb, mm_sb = await init_test(dut)
     await inst_driver._driver_send('addi x1, x0, 7')
@@ -17,4 +18,5 @@ async def test_interlock_scenario(dut):
     await inst_driver._load_nops(5)
     await inst_driver._driver_send('lw x2, 0(x0)')
     await inst_driver._driver_send('add x3, x2, x2')
+    await inst_driver._driver_send('addi x4, x3, 1')
     await close_test(dut, cpu_rst, 30, inst_driver.inst_mem_depth, rgf_sb, mm_sb)
@@ -0,0 +1,128 @@
+'''
+ISS streams against hand-computed ones: interlocks, traps, misaligned and out-of-bounds accesses
+run directly for an instructions-per-second benchmark:
+    python -m tests.test_iss
+'''
+import random
+import timeit
+from typing import List
+from models.etcpu_iss import ISS
+from models.riscv_infra import get_rand_inst, inst_str2int
+
+NOP = inst_str2int('nop')
+TRAP_HDLR_ADDR = 0x80
+INST_MEM_DEPTH, MAIN_MEM_DEPTH = 64, 64
+HANDLER = ['addi x7, x0, 7']
+OPCODE_PROBS = {'itype': 16, 'rtype': 8, 'store': 4, 'load': 2, 'jalr': 1, 'jal': 2, 'btype': 4}
+
+def run_iss(program: List[str], insts: int, handler: List[str]=None)->ISS:
+    '''
+    ISS of the program, the trap handler (if given) at TRAP_HDLR_ADDR
+    '''
+    image = [inst_str2int(inst) for inst in program]
+    if handler is not None:
+        image += [NOP] * ((TRAP_HDLR_ADDR >> 2) - len(image)) + [inst_str2int(inst) for inst in handler]
+    iss = ISS(image, INST_MEM_DEPTH, MAIN_MEM_DEPTH, TRAP_HDLR_ADDR)
+    assert iss.run(max_insts=insts) == 'insts'
+    return iss
+
+def streams(iss: ISS)->tuple:
+    '''
+    (slot, pc) retired, (slot, address, data) register file and main memory writes, (slot, vector) exceptions
+    '''
+    return (
+        list(zip(iss.ret_slot, iss.ret_pc)),
+        list(zip(iss.rgf_slot, iss.rgf_wa, iss.rgf_wd)),
+        list(zip(iss.mm_slot, iss.mm_addr, iss.mm_data)),
+        list(zip(iss.exc_slot, iss.exc_vec)),
+    )
+
+def get_rand_image(seed: int, num: int, avoid_exceptions: bool)->List[int]:
+    random.seed(seed)
+    return [get_rand_inst(OPCODE_PROBS, avoid_exceptions, idx << 2, 512, 64) for idx in range(num)]
+
+def test_load_use():
+    iss = run_iss([
+        'addi x1, x0, 5',
+        'addi x2, x1, 3',
+        'sw x2, 4(x0)',
+        'lw x3, 4(x0)',
+        'add x4, x3, x1', # load-use, latched a slot later
+        'jal x0, 0',
+    ], 7)
+    ret, rgf, mm, exc = streams(iss)
+    assert ret == [(0, 0x0), (1, 0x4), (2, 0x8), (3, 0xc), (5, 0x10), (6, 0x14), (7, 0x14)]
+    assert rgf == [(0, 1, 5), (1, 2, 8), (3, 3, 8), (5, 4, 13)]
+    assert mm == [(2, 4, 8)] and exc == []
+    assert (iss.intrlock_bubbles, iss.branch_flushes, iss.jalr_flushes, iss.traps) == (1, 0, 0, 0)
+
+def test_main_mem_misaligned():
+    iss = run_iss([
+        'addi x1, x0, 1',
+        'lw x2, 2(x0)',   # misaligned, traps from MA, no write
+        'addi x3, x0, 3',
+        'addi x4, x0, 4',
+        'addi x5, x0, 5', # last one in flight
+        'addi x6, x0, 6',
+    ], 6, HANDLER)
+    ret, rgf, mm, exc = streams(iss)
+    assert ret == [(0, 0x0), (1, 0x4), (2, 0x8), (3, 0xc), (4, 0x10), (5, TRAP_HDLR_ADDR)]
+    assert rgf == [(0, 1, 1), (2, 3, 3), (3, 4, 4), (4, 5, 5), (5, 7, 7)]
+    assert mm == [] and exc == [(4, 0b0100)] and iss.traps == 1
+
+def test_main_mem_out_of_bounds():
+    iss = run_iss([
+        'addi x1, x0, 1',
+        'sw x1, 1024(x0)', # out of bounds, no write
+        'addi x3, x0, 3',
+        'addi x4, x0, 4',
+        'addi x5, x0, 5',
+    ], 5, HANDLER)
+    ret, rgf, mm, exc = streams(iss)
+    assert ret == [(0, 0x0), (1, 0x4), (2, 0x8), (3, 0xc), (4, 0x10)]
+    assert rgf == [(0, 1, 1), (2, 3, 3), (3, 4, 4), (4, 5, 5)]
+    assert mm == [] and exc == [(4, 0b1000)]
+    assert iss.pc == TRAP_HDLR_ADDR
+
+def test_inst_misaligned():
+    iss = run_iss([
+        'jalr x1, x0, 6', # misaligned target, traps once the jalr flushed
+        'addi x3, x0, 3',
+        'addi x4, x0, 4',
+    ], 3, HANDLER)
+    ret, rgf, mm, exc = streams(iss)
+    assert ret == [(0, 0x0), (3, TRAP_HDLR_ADDR), (4, TRAP_HDLR_ADDR + 4)]
+    assert rgf == [(0, 1, 4), (3, 7, 7)]
+    assert exc == [(2, 0b0001)] and iss.jalr_flushes == 1
+
+def test_inst_out_of_bounds():
+    iss = run_iss([
+        'addi x1, x0, 1',
+        'jal x0, 1024', # beyond the instruction memory
+        'addi x3, x0, 3',
+    ], 3, HANDLER)
+    ret, rgf, mm, exc = streams(iss)
+    assert ret == [(0, 0x0), (1, 0x4), (2, TRAP_HDLR_ADDR)]
+    assert rgf == [(0, 1, 1), (2, 7, 7)]
+    assert exc == [(1, 0b0010)] and iss.traps == 1
+
+def test_trace_off_same_state():
+    image = get_rand_image(0, 256, False)
+    traced, untraced = ISS(image, 512, 64, TRAP_HDLR_ADDR), ISS(image, 512, 64, TRAP_HDLR_ADDR, trace=False)
+    traced.run(max_insts=5000)
+    untraced.run(max_insts=5000)
+    assert (traced.pc, traced.rgf, traced.mm, traced.cycle) == (untraced.pc, untraced.rgf, untraced.mm, untraced.cycle)
+    assert len(untraced.ret_slot) == 0
+
+def bench(num: int=200000):
+    '''
+    instructions per second of a random program looping over the instruction memory
+    '''
+    image = get_rand_image(1, 448, True) + [inst_str2int('jal x0, -1792')]
+    for trace in (True, False):
+        iss = ISS(image, 512, 64, TRAP_HDLR_ADDR, trace=trace)
+        run_t = timeit.timeit(lambda: iss.run(max_insts=num), number=1)
+        print(f'ISS trace={trace} : {num / run_t:,.0f} inst/s')
+
+if __name__ == '__main__':
+    bench()
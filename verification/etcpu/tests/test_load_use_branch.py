@@ -0,0 +1,28 @@
+import cocotb
+from models.test_infra import init_test, close_test
+
+@cocotb.test()
+async def test_load_use_branch(dut):
+    '''
+    test branches stalled by a load-use interlock, they keep their PC and prediction:
+        1. addi x1, x0, 5
+        2. sw   x1, 8(x0)
+        3. lw   x2, 8(x0)
+        4. beq  x2, x1, 8  >--| taken
+        5. addi x3, x0, 3     |
+        6. addi x4, x4, 1  <--|-------|
+        7. lw   x5, 8(x0)             |
+        8. bne  x4, x5, -8 >----------| X 4
+        9. addi x6, x0, 6
+    '''
+    inst_driver, cpu_rst, rgf_sb, mm_sb = await init_test(dut)
+    await inst_driver._driver_send('addi x1, x0, 5') # 0x0
+    await inst_driver._driver_send('sw x1, 8(x0)') # 0x4
+    await inst_driver._driver_send('lw x2, 8(x0)') # 0x8
+    await inst_driver._driver_send('beq x2, x1, 8') # 0xc
+    await inst_driver._driver_send('addi x3, x0, 3') # 0x10, skipped
+    await inst_driver._driver_send('addi x4, x4, 1') # 0x14
+    await inst_driver._driver_send('lw x5, 8(x0)') # 0x18
+    await inst_driver._driver_send('bne x4, x5, -8') # 0x1c
+    await inst_driver._driver_send('addi x6, x0, 6') # 0x20
+    await close_test(dut, cpu_rst, 60, inst_driver.inst_mem_depth, rgf_sb, mm_sb)
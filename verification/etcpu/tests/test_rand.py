@@ -1,23 +1,29 @@
 import random
 import cocotb
-from models.test_infra import init_test, close_test
+from models.test_infra import init_test, close_test, get_sim_arg, TestEnv
 
 @cocotb.test()
 async def test_rand(dut, inst_num=None, avoid_exceptions=True):
     '''
     test rand_inst:
         random set of instructions
+    $ETCPU_FAST_FORWARD=N starts checking after the first N instructions (see TestEnv.fast_forward)
     '''
     inst_driver, cpu_rst, rgf_sb, mm_sb = await init_test(dut, avoid_exceptions)
     # initialize all registers with some random integer
     for i in range(32):
         await inst_driver._driver_send(f'addi x{i}, x0, {random.randint(0,2**12-1)}')
     # fill the rest of the instruction memory with random instructions
-    inst_num = inst_driver.inst_mem_depth-32-1-5 if not inst_num else inst_num
+    max_inst_num = inst_driver.inst_mem_depth-32-1-5
+    inst_num = inst_num or get_sim_arg('inst_num')
+    inst_num = max_inst_num if not inst_num else min(inst_num, max_inst_num)
     for _ in range(inst_num):
         await inst_driver.drive_rand_inst()
     # make sure we jump to head
     await inst_driver._driver_send(f'jal x0, -{int(inst_num << 2)}')
     for _ in range(5):
         await inst_driver._driver_send('nop')
+    fast_forward = get_sim_arg('fast_forward')
+    if fast_forward:
+        cpu_rst = TestEnv.current.fast_forward(fast_forward)
     await close_test(dut, cpu_rst, 1000, inst_driver.inst_mem_depth, rgf_sb, mm_sb)
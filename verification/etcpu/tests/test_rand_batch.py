@@ -0,0 +1,76 @@
+import random
+import cocotb
+from models.test_infra import run_batch, get_sim_arg
+from models.etcpu_ref import RetiredInsts
+from models.etcpu_trans import RGFTrans
+
+BATCH_PROGRAMS_NUM = 16
+BATCH_INST_NUM = 32
+
+async def load_rand_program(inst_driver, inst_num):
+    '''
+    test_rand program: random register values, inst_num random instructions, jump back to head
+    '''
+    inst_num = min(inst_num, inst_driver.inst_mem_depth-32-1-5)
+    for i in range(32):
+        await inst_driver._driver_send(f'addi x{i}, x0, {random.randint(0,2**12-1)}')
+    for _ in range(inst_num):
+        await inst_driver.drive_rand_inst()
+    await inst_driver._driver_send(f'jal x0, -{int(inst_num << 2)}')
+    for _ in range(5):
+        await inst_driver._driver_send('nop')
+
+class LateMismatch(RetiredInsts):
+    '''
+    ends every program after num checked instructions, in program #target it also corrupts
+    the newest expected register file write, which lands after the program ended
+    '''
+    name = 'late_mismatch'
+
+    def __init__(self, num: int, target: int):
+        super().__init__(num)
+        self.target = target
+        self.program = -1
+        self.env = None
+
+    def arm(self, env):
+        super().arm(env)
+        self.program += 1
+        self.env = env
+
+    def _retire(self, trans):
+        super()._retire(trans)
+        if self.retired_num == self.num and self.program == self.target:
+            expected_trns = self.env.rgf_sb.expected_trns
+            time_ns, write_idx, expected = expected_trns[-1]
+            expected_trns[-1] = (time_ns, write_idx, RGFTrans(expected.data ^ 1, expected.reg_addr))
+
+async def load_addi_program(inst_driver, inst_num):
+    '''
+    inst_num addi instructions writing x1, x2, ..., then a jal x0, 0 idle loop
+    '''
+    for i in range(inst_num):
+        await inst_driver._driver_send(f'addi x{i % 31 + 1}, x0, {i + 1}')
+    await inst_driver._driver_send('jal x0, 0')
+
+@cocotb.test()
+async def test_rand_batch(dut, programs_num=BATCH_PROGRAMS_NUM, inst_num=BATCH_INST_NUM):
+    '''
+    test rand_inst batch:
+        programs_num small random programs back to back in one simulation,
+        CPU-only reset and reload between them
+    '''
+    inst_num = get_sim_arg('inst_num', inst_num)
+    programs = [lambda inst_driver: load_rand_program(inst_driver, inst_num)] * programs_num
+    await run_batch(dut, programs, 8 * inst_num)
+
+@cocotb.test()
+async def test_batch_late_mismatch(dut, programs_num=3, inst_num=8, target=1):
+    '''
+    test batch verdict:
+        a register file mismatch found only after program #target ended (in its drain)
+        fails that program and no other, its scoreboards still drain empty
+    '''
+    programs = [lambda inst_driver: load_addi_program(inst_driver, inst_num)] * programs_num
+    results = await run_batch(dut, programs, 8 * inst_num, end_conditions=[LateMismatch(inst_num + 1, target)], fatal=False)
+    assert [result['passed'] for result in results] == [idx != target for idx in range(programs_num)]
@@ -0,0 +1,68 @@
+import random
+import cocotb
+from models.test_infra import init_test, close_test, get_sim_arg, run_batch, TRAP_HDLR_ADDR
+
+@cocotb.test()
+async def test_rand_golden(dut, inst_num=None, avoid_exceptions=True):
+    '''
+    test rand_inst in golden-trace mode:
+        random set of instructions, RGF and MM writes checked against
+        the ISS trace precomputed at CPU reset release
+    '''
+    inst_driver, cpu_rst, rgf_sb, mm_sb = await init_test(dut, avoid_exceptions, golden=True)
+    # initialize all registers with some random integer
+    for i in range(32):
+        await inst_driver._driver_send(f'addi x{i}, x0, {random.randint(0,2**12-1)}')
+    # fill the rest of the instruction memory with random instructions
+    max_inst_num = inst_driver.inst_mem_depth-32-1-5
+    inst_num = inst_num or get_sim_arg('inst_num')
+    inst_num = max_inst_num if not inst_num else min(inst_num, max_inst_num)
+    for _ in range(inst_num):
+        await inst_driver.drive_rand_inst()
+    # make sure we jump to head
+    await inst_driver._driver_send(f'jal x0, -{int(inst_num << 2)}')
+    for _ in range(5):
+        await inst_driver._driver_send('nop')
+    await close_test(dut, cpu_rst, 1000, inst_driver.inst_mem_depth, rgf_sb, mm_sb)
+    # at least the 32 register initializations were matched against the golden trace
+    assert rgf_sb.get_stats()['matched'] >= 32
+
+@cocotb.test()
+async def test_exc_golden(dut):
+    '''
+    test golden-trace mode PC and exception checks:
+        1. lw x2, 2(x0) - misaligned, traps to 0x80
+        2. the handler writes x7 and jumps out of bounds, trapping back to itself
+    '''
+    inst_driver, cpu_rst, rgf_sb, mm_sb = await init_test(dut, golden=True)
+    await inst_driver._driver_send('addi x1, x0, 1')
+    await inst_driver._driver_send('lw x2, 2(x0)')
+    await inst_driver._driver_send('addi x3, x0, 3')
+    inst_driver.running_addr = 0x80
+    await inst_driver._driver_send('addi x7, x0, 7')
+    await inst_driver._driver_send('jal x0, 4000')
+    await close_test(dut, cpu_rst, 40, inst_driver.inst_mem_depth, rgf_sb, mm_sb)
+
+EXC_PROGRAMS = ( # one exception each, trapping to TRAP_HDLR_ADDR
+    'addi x1, x0, 1\nlw x2, 2(x0)\naddi x3, x0, 3\naddi x4, x0, 4\naddi x5, x0, 5',    # MAIN_MIS
+    'addi x1, x0, 1\nsw x1, 1024(x0)\naddi x3, x0, 3\naddi x4, x0, 4\naddi x5, x0, 5', # MAIN_OOB
+    'jalr x1, x0, 6\naddi x3, x0, 3\naddi x4, x0, 4',                                  # INST_MIS
+    'addi x1, x0, 1\njal x0, 4000\naddi x3, x0, 3',                                    # INST_OOB
+)
+EXC_HANDLER = 'addi x7, x0, 7\njal x0, 0'
+
+@cocotb.test()
+async def test_exc_golden_batch(dut):
+    '''
+    test golden-trace mode exception checks on every exception:
+        every program raises a single exception and idles in the trap handler,
+        each must pass with its exception found as golden and its writes matched
+    '''
+    def get_program(src: str):
+        async def load(inst_driver):
+            await inst_driver.load_asm(src)
+            await inst_driver.load_asm(EXC_HANDLER, TRAP_HDLR_ADDR)
+        return load
+    results = await run_batch(dut, [get_program(src) for src in EXC_PROGRAMS], 40, golden=True, end_conditions=[])
+    assert [result['exceptions'] for result in results] == [1] * len(EXC_PROGRAMS)
+    assert all(result['rgf_writes'] for result in results)
@@ -0,0 +1,58 @@
+'''
+NumPy batch generator checks, skipped where numpy is not installed
+'''
+import io
+import contextlib
+import pytest
+np = pytest.importorskip('numpy')
+from models.riscv_rand_np import get_rand_insts
+from models.riscv_infra import decode_inst, inst_int2str, inst_int2pcexp, inst_int2mmexp
+
+OPCODE_PROBS = {'itype': 16, 'rtype': 8, 'store': 4, 'load': 2, 'jalr': 1, 'jal': 1, 'btype': 1}
+INST_MEM_DEPTH, MAIN_MEM_DEPTH = 512, 64
+
+def test_seed_reproducible():
+    first = get_rand_insts(1000, OPCODE_PROBS, seed=7, inst_mem_depth=INST_MEM_DEPTH, main_mem_depth=MAIN_MEM_DEPTH)
+    second = get_rand_insts(1000, OPCODE_PROBS, seed=7, inst_mem_depth=INST_MEM_DEPTH, main_mem_depth=MAIN_MEM_DEPTH)
+    assert first.dtype == np.uint32 and np.array_equal(first, second)
+
+def test_opcode_probs():
+    insts = get_rand_insts(20000, {**dict.fromkeys(OPCODE_PROBS, 0), 'store': 1, 'jal': 1}, seed=1)
+    opcodes = (insts >> 2) & 0x1f
+    assert set(np.unique(opcodes).tolist()) == {8, 27}
+
+@pytest.mark.parametrize('avoid_exceptions', [True, False])
+def test_supported(avoid_exceptions):
+    for inst in get_rand_insts(5000, OPCODE_PROBS, avoid_exceptions, seed=3).tolist():
+        with contextlib.redirect_stdout(io.StringIO()):
+            inst_int2str(inst) # exits on a non-supported instruction
+
+def test_avoid_exceptions():
+    running_addr = 0x100
+    insts = get_rand_insts(2 * INST_MEM_DEPTH, OPCODE_PROBS, True, running_addr, INST_MEM_DEPTH, MAIN_MEM_DEPTH, seed=5)
+    rgf, mm = [0] * 32, [0] * MAIN_MEM_DEPTH
+    for i, inst in enumerate(insts.tolist()):
+        pc = (running_addr + 4 * i) % (INST_MEM_DEPTH << 2)
+        if pc == (INST_MEM_DEPTH << 2) - 4:
+            continue # falling through the last address is the test's job, see test_rand
+        _, _, inst_mis, inst_oob = inst_int2pcexp(decode_inst(inst), rgf, pc, 0, INST_MEM_DEPTH)
+        _, _, _, main_mis, main_oob = inst_int2mmexp(decode_inst(inst), rgf, mm)
+        assert not (inst_mis or inst_oob or main_mis or main_oob), (hex(pc), inst_int2str(inst))
+
+def test_adapt_knobs():
+    knobs = {'reg_weights': [0] * 5 + [1] * 3 + [0] * 24, 'btype_funct3': {'bltu': 1, 'bgeu': 1}, 'btype_bwd': 1.0}
+    insts = get_rand_insts(5000, {**OPCODE_PROBS, **knobs}, True, 0, INST_MEM_DEPTH, MAIN_MEM_DEPTH, seed=9)
+    decoded = [decode_inst(inst) for inst in insts.tolist()]
+    assert {inst.rd for inst in decoded if inst.opcode not in (8, 24)} <= {0, 5, 6, 7} # stores and branches have no rd
+    assert {inst.rs2 for inst in decoded if inst.opcode == 12} == {5, 6, 7}
+    branches = [(idx, inst) for idx, inst in enumerate(decoded) if inst.opcode == 24]
+    assert {inst.funct3 for _, inst in branches} == {6, 7}
+    # backward, except from address 0, and inside the instruction memory
+    assert all(inst.b_imm < 0 and (idx % INST_MEM_DEPTH) * 4 + inst.b_imm >= 0 for idx, inst in branches if idx % INST_MEM_DEPTH)
+
+def test_rs_reuse():
+    insts = get_rand_insts(5000, {**OPCODE_PROBS, 'rs_reuse': 1.0, 'raw_dist': [0, 1, 0]}, seed=11).tolist()
+    decoded = [decode_inst(inst) for inst in insts]
+    writes = [0 if inst.opcode in (8, 24) else inst.rd for inst in decoded]
+    # every source read is the destination two instructions back (the MA forwarding distance)
+    assert all(inst.rs1 == writes[idx - 2] and inst.rs2 == writes[idx - 2] for idx, inst in enumerate(decoded[2:], 2) if inst.opcode == 12)
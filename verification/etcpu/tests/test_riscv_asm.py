@@ -0,0 +1,56 @@
+'''
+program-level assembler against the single-line one
+'''
+from models.riscv_asm import assemble, asm_line, NOP
+from models.riscv_infra import inst_str2int
+
+def test_matches_single_line():
+    src = '''
+        addi x1, x0, 7      # comment
+        addi x2, x0, 4      // another comment
+        sub x3, x1, x2
+        sw x3, 4(x2)
+        lw x4, 4(x2)
+    '''
+    lines = ['addi x1, x0, 7', 'addi x2, x0, 4', 'sub x3, x1, x2', 'sw x3, 4(x2)', 'lw x4, 4(x2)']
+    assert assemble(src) == [inst_str2int(line) for line in lines]
+
+def test_labels():
+    src = '''
+        start:  addi x1, x1, 1
+                beq x1, x2, done
+                jal x0, start
+        done:   jalr x0, x0, start
+    '''
+    assert assemble(src, base_addr=0x40) == [
+        inst_str2int('addi x1, x1, 1'),
+        inst_str2int('beq x1, x2, 8'),
+        inst_str2int('jal x0, -8'),
+        inst_str2int('jalr x0, x0, 64'),
+    ]
+
+def test_scratchpad_offsets():
+    src = '''
+                .fill 166
+                jal x25, target
+                .fill 35
+        target: ori x9, x25, 120
+    '''
+    image = assemble(src)
+    assert len(image) == 0x328 // 4 + 1
+    assert image[0x298 // 4] == inst_str2int('jal x25, 144')
+
+def test_directives():
+    image = assemble('''
+        .word 0x13, -1, 5
+        .fill 2
+        .fill 3, 0xdeadbeef
+        lw x1, 0x10(x0)
+    ''')
+    assert image == [0x13, 0xffffffff, 5, NOP, NOP] + [0xdeadbeef] * 3 + [inst_str2int('lw x1, 16(x0)')]
+
+def test_line_cache():
+    asm_line.cache_clear()
+    assemble('\n'.join(['nop'] * 100 + ['addi x1, x1, 1'] * 100))
+    info = asm_line.cache_info()
+    assert info.misses == 2 and info.hits == 198
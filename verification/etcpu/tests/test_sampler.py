@@ -0,0 +1,69 @@
+'''
+SignalSampler fan-out and failure delay on the mock
+'''
+import logging
+import pytest
+from models.etcpu_mock import EtcpuEnvMock, MockSim, ClockCycles, patch_cocotb
+from models.etcpu_ref import SampledChecker, SignalSampler, CLK_PERIOD_NS
+
+@pytest.fixture
+def sim():
+    sim = MockSim(EtcpuEnvMock(), CLK_PERIOD_NS)
+    restore = patch_cocotb(sim, 0)
+    yield sim
+    restore()
+    MockSim.current = None
+
+class Recorder(SampledChecker):
+    '''
+    records the snapshots it is handed, in a log shared with the other recorders,
+    fails on the given cycle
+    '''
+    def __init__(self, name: str, record: list, fail_cycle: int=None):
+        super().__init__(logging.INFO)
+        self.name = name
+        self.record = record
+        self.fail_cycle = fail_cycle
+
+    def sample(self, snap):
+        self.record.append((self.name, snap))
+        if snap.cycle == self.fail_cycle:
+            self.fail()
+
+def run_cycles(sim: MockSim, cycles: int)->bool:
+    async def wait():
+        await ClockCycles(sim.dut.clk, cycles)
+    return sim.run(sim.start_soon(wait()), cycles + 2)
+
+def test_fan_out(sim):
+    record = []
+    sampler = SignalSampler(sim.dut, sim.dut.clk)
+    for name in ('first', 'second'):
+        sampler.add_checker(Recorder(name, record))
+    assert run_cycles(sim, 10)
+    # every checker gets the same snapshot each cycle, in registration order
+    assert [name for name, _ in record] == ['first', 'second'] * (len(record) // 2)
+    firsts, seconds = record[0::2], record[1::2]
+    assert all(first[1] is second[1] for first, second in zip(firsts, seconds))
+    assert [snap.cycle for _, snap in firsts] == list(range(len(firsts)))
+    assert sampler.snapshot is record[-1][1]
+
+def test_failure_delay(sim):
+    record = []
+    sampler = SignalSampler(sim.dut, sim.dut.clk)
+    checker = Recorder('failing', record, fail_cycle=3)
+    sampler.add_checker(checker)
+    assert not run_cycles(sim, 20)
+    assert isinstance(sim.failure, AssertionError)
+    # the test fails 5 cycles after the checker reported
+    assert checker.failed and record[-1][1].cycle == 3 + 5
+
+def test_failure_not_fatal(sim):
+    sampler = SignalSampler(sim.dut, sim.dut.clk)
+    sampler.fatal = False # program batches read the failed flags
+    checker = Recorder('failing', [], fail_cycle=3)
+    sampler.add_checker(checker)
+    assert run_cycles(sim, 20)
+    assert checker.failed
+    sampler.reset()
+    assert not checker.failed and sampler.fail_cycle is None
@@ -0,0 +1,78 @@
+'''
+Scoreboard matching, statistics, high-water bound and journal, timed by the mock scheduler
+'''
+import pytest
+from models.etcpu_mock import EtcpuEnvMock, MockSim, patch_cocotb
+from models.etcpu_ref import RGFScoreboard, MMScoreboard, CLK_PERIOD_NS
+from models.etcpu_trans import RGFTrans, MMTrans
+
+@pytest.fixture
+def sim():
+    sim = MockSim(EtcpuEnvMock(), CLK_PERIOD_NS)
+    restore = patch_cocotb(sim, 0)
+    yield sim
+    restore()
+    MockSim.current = None
+
+def predict(sb: RGFScoreboard, reg_addr: int, data: int):
+    '''
+    the PCMonitor order: expected transaction, then its write to the expected state
+    '''
+    sb.add_expected(RGFTrans(data, reg_addr))
+    sb.apply_write(reg_addr, data)
+
+def test_in_order_match_and_stats(sim):
+    sb = RGFScoreboard()
+    predict(sb, 1, 5)
+    predict(sb, 2, 6)
+    sim.cycle += 3
+    sb.add_actual(RGFTrans(5, 1))
+    assert sb.compare()
+    sim.cycle += 1
+    sb.add_actual(RGFTrans(6, 2))
+    assert sb.compare()
+    assert sb.get_stats() == {'matched': 2, 'max_depth': 2, 'avg_latency': 3.5}
+    assert sb.is_empty()
+
+def test_mismatch_and_unexpected(sim):
+    sb = MMScoreboard(16)
+    sb.add_expected(MMTrans(7, 8))
+    sb.add_actual(MMTrans(7, 12))
+    assert not sb.compare() and sb.failed
+    sb.add_actual(MMTrans(7, 8))
+    assert not sb.compare() # nothing left to match
+    assert sb.get_stats()['matched'] == 1
+
+def test_high_water(sim):
+    sb = RGFScoreboard(high_water=2)
+    sb.add_expected(RGFTrans(1, 1))
+    sb.add_expected(RGFTrans(2, 2))
+    with pytest.raises(AssertionError):
+        sb.add_expected(RGFTrans(3, 3))
+    unbounded = RGFScoreboard(high_water=None)
+    for idx in range(2000):
+        unbounded.add_expected(RGFTrans(idx, 1))
+    assert unbounded.get_stats()['max_depth'] == 2000
+
+def test_state_before_matched_write(sim):
+    sb = RGFScoreboard(journal=True)
+    predict(sb, 1, 5)
+    predict(sb, 1, 7)
+    predict(sb, 2, 9)
+    sb.add_actual(RGFTrans(5, 1))
+    assert sb.compare() and sb.matched_write_idx == 0
+    assert sb.get_state_before(0)[1:3] == [0, 0]
+    sb.add_actual(RGFTrans(8, 1))
+    assert not sb.compare() and sb.matched_write_idx == 1
+    # the state the mismatching write was predicted on, not the latest one
+    assert sb.get_state_before(sb.matched_write_idx)[1:3] == [5, 0]
+    assert sb.expected_state[1:3] == [7, 9]
+    sb.add_actual(RGFTrans(9, 2))
+    sb.add_actual(RGFTrans(1, 3))
+    assert sb.compare() and sb.matched_write_idx == 2
+    assert not sb.compare() and sb.matched_write_idx is None
+
+def test_state_before_without_journal(sim):
+    sb = RGFScoreboard()
+    predict(sb, 1, 5)
+    assert sb.get_state_before(0) is None
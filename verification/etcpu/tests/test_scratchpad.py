@@ -7,10 +7,13 @@ async def test_scratchpad(dut):
     scratchpad test - reproduce some errors in a direct test
     '''
     inst_driver, cpu_rst, rgf_sb, mm_sb = await init_test(dut)
-    await inst_driver._load_nops(int(0x298/4))
-    await inst_driver._driver_send('jal x25, 144')
-    await inst_driver._load_nops(int(140/4))
-    await inst_driver._driver_send('ori x9, x25, 120')
-    await inst_driver._load_nops(1)
-    await inst_driver._driver_send('addi x9, x19, 1550')
-    await close_test(dut, cpu_rst, 1000, inst_driver.inst_mem_depth, rgf_sb, mm_sb)
\ No newline at end of file
+    await inst_driver.load_asm('''
+                .fill 166               # 0x0 - 0x294
+                jal x25, target         # 0x298
+                .fill 35
+        target: ori x9, x25, 120        # 0x328
+                nop
+                addi x9, x19, 1550
+        done:   jal x0, done            # idle loop, ends the test
+    ''')
+    await close_test(dut, cpu_rst, 1000, inst_driver.inst_mem_depth, rgf_sb, mm_sb)
@@ -0,0 +1,32 @@
+'''
+slotted transaction types: equality on raw integers, lazy cached strings, pickling
+'''
+import pickle
+from models.etcpu_trans import RGFTrans, MMTrans, IMTrans
+from models.riscv_infra import inst_str2int
+
+def test_slots():
+    for trans in (RGFTrans(1, 2), MMTrans(3, 4), IMTrans(0x33, 8)):
+        assert not hasattr(trans, '__dict__')
+
+def test_equality():
+    assert RGFTrans(0x10, 3) == RGFTrans(0x10, 3) and RGFTrans(0x10, 3) != RGFTrans(0x10, 4)
+    assert MMTrans(0x10, 8) == MMTrans(0x10, 8) and MMTrans(0x10, 8) != MMTrans(0x11, 8)
+    assert IMTrans('addi x1, x0, 7', 4) == IMTrans(inst_str2int('addi x1, x0, 7'), 4)
+    assert len({RGFTrans(1, 1), RGFTrans(1, 1), RGFTrans(2, 1)}) == 2
+
+def test_lazy_strings():
+    trans = IMTrans(inst_str2int('sub x3, x1, x2'), 0x10)
+    assert trans._inst_str is None and trans._log_msg is None
+    msg = trans.get_log_message()
+    assert trans.inst_str == 'sub x3, x1, x2' and msg.endswith('@ 0x10')
+    assert trans.get_log_message() is msg
+    assert RGFTrans(0xff, 5).get_log_message() == ' : x5  <= 0xff    '
+    assert MMTrans(0xff, 0x8).get_log_message() == ' : MAIN_MEM[0x8] <= 0xff'
+
+def test_pickle():
+    for trans in (RGFTrans(0xdead, 31), MMTrans(0xbeef, 0x3c), IMTrans('jal x0, -8', 0x20)):
+        trans.get_log_message()
+        loaded = pickle.loads(pickle.dumps(trans))
+        assert type(loaded) is type(trans) and loaded == trans
+        assert loaded._log_msg is None # caches are not exported